@@ -0,0 +1,522 @@
+import importlib.util
+import os
+import sys
+import time
+
+from result_store import RESULT_DIR
+
+# PyTensor のコンパイル結果（C コード）を残すディレクトリ
+# pytensor の読み込み時に決まるので、pymc より先にこのモジュールを import する
+COMPILE_DIR = os.path.abspath(os.path.join(RESULT_DIR, "pytensor_cache"))
+if "pytensor" not in sys.modules and "base_compiledir" not in os.environ.get("PYTENSOR_FLAGS", ""):
+    os.environ["PYTENSOR_FLAGS"] = ",".join(
+        flag for flag in [os.environ.get("PYTENSOR_FLAGS"), f"base_compiledir={COMPILE_DIR}"] if flag)
+
+import arviz as az
+import numpy as np
+import pandas as pd
+import pymc as pm
+import xarray as xr
+from pymc.blocking import DictToArrayBijection, RaveledVars
+from pymc.step_methods.hmc.quadpotential import QuadPotential, QuadPotentialDiag, QuadPotentialDiagAdapt
+from pymc.step_methods.step_sizes import DualAverageAdaptation
+from scipy import optimize
+
+# サンプラーの種類と必要なパッケージ（pymc 以外はインストールされている場合のみ使える）
+SAMPLER_BACKENDS = {"pymc": None, "nutpie": "nutpie", "numpyro": "numpyro", "blackjax": "blackjax"}
+
+# 近似推論の方法
+APPROX_METHODS = ("laplace", "advi")
+
+# ADVI の変分分布の初期標準偏差（制約のない空間）
+ADVI_START_SIGMA = 0.01
+
+# 適応的サンプリングの既定の収束目標
+ADAPTIVE_TARGETS = {"rhat": 1.01, "ess_bulk": 400, "ess_tail": 400}
+
+# 説明変数の傾きがグループ（ジャンル）ごとに変わる階層モデルの family と、グループ間の偏差の表し方
+# 非中心化: offset = tau * z (z ~ Normal(0, 1))。中心化: offset ~ Normal(0, tau)（ベンチマークの比較用）
+HIERARCHICAL_FAMILIES = {"hierarchical": "noncentered", "hierarchical_centered": "centered"}
+
+# ジャンル間のばらつき tau はゼロ付近に事後分布の裾があり、ステップが大きいと発散するので小さめにする
+HIERARCHICAL_TARGET_ACCEPT = 0.95
+
+# pm.sample の外部サンプラーとして呼び出す JAX 系のバックエンド（呼び出しごとに JIT コンパイルされる）
+JAX_BACKENDS = ("numpyro", "blackjax")
+
+
+def available_backends():
+    """インストールされているサンプラーの一覧"""
+    return [name for name, module in SAMPLER_BACKENDS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def convergence_diagnostics(trace, terms=None):
+    """
+    beta の係数（terms を指定した場合はその係数のみ）の R-hat の最大値と bulk / tail ESS の最小値
+    """
+    beta = trace.posterior[["beta"]]
+    if terms is not None:
+        beta = beta.sel(beta_dim_0=list(terms))
+    return {
+        "rhat": float(az.rhat(beta)["beta"].max()),
+        "ess_bulk": float(az.ess(beta, method="bulk")["beta"].min()),
+        "ess_tail": float(az.ess(beta, method="tail")["beta"].min()),
+    }
+
+
+def targets_met(diagnostics, targets):
+    return (diagnostics["rhat"] <= targets["rhat"] and diagnostics["ess_bulk"] >= targets["ess_bulk"]
+            and diagnostics["ess_tail"] >= targets["ess_tail"])
+
+
+class ContinuablePotential(QuadPotential):
+    """
+    NUTS の対角の質量行列
+    通常は pm.NUTS の既定と同じく QuadPotentialDiagAdapt でチューニング中に適応し、
+    fix() の後は固定した対角の質量行列を使う（pm.sample の呼び出しごとの reset でも固定したまま）
+    適応的サンプリングの続きの区間で、コンパイル済みのステップを作り直さずに使うため
+    """
+
+    def __init__(self, n, dtype=None, rng=None):
+        super().__init__(rng=rng)
+        self.adaptive = QuadPotentialDiagAdapt(n, np.zeros(n), np.ones(n), 10, dtype=dtype, rng=self.rng)
+        self.dtype = self.adaptive.dtype
+        self.fixed = None
+
+    @property
+    def active(self):
+        return self.adaptive if self.fixed is None else self.fixed
+
+    def fix(self, variance):
+        """質量行列を制約のない空間での分散 variance に固定する（None の場合は適応に戻す）"""
+        self.fixed = None if variance is None else QuadPotentialDiag(variance, dtype=self.dtype, rng=self.rng)
+
+    def velocity(self, x, out=None):
+        return self.active.velocity(x, out=out)
+
+    def energy(self, x, velocity=None):
+        return self.active.energy(x, velocity=velocity)
+
+    def velocity_energy(self, x, v_out):
+        return self.active.velocity_energy(x, v_out)
+
+    def random(self):
+        return self.active.random()
+
+    def update(self, sample, grad, tune):
+        self.active.update(sample, grad, tune)
+
+    def raise_ok(self, map_info=None):
+        self.active.raise_ok(map_info)
+
+    def reset(self):
+        self.active.reset()
+
+    def stats(self):
+        return self.active.stats()
+
+    def set_rng(self, rng):
+        super().set_rng(rng)
+        for potential in (self.adaptive, self.fixed):
+            if potential is not None:
+                potential.set_rng(self.rng)
+
+
+class BayesianModelFactory:
+    """
+    X と y を pm.Data として宣言したモデルを (デザイン行列の形状, family) ごとに一度だけ構築・コンパイルし、
+    目的変数・閾値で作ったラベル・ブートストラップの再標本などは pm.set_data で差し替えて再利用する
+
+    NUTS のステップ（対数密度と勾配のコンパイル済み関数）も保持するので、
+    2回目以降の pm.sample では再コンパイルが発生しない。ステップは pymc の NUTS で使う場合にだけ作る
+    (nutpie・JAX 系のバックエンドと近似推論はモデルだけを使う)
+    """
+
+    def __init__(self, prior_beta_sigma=1, prior_sigma=10, varying_slope="political_news_count",
+                 group_prefix="Genre_"):
+        self.prior_beta_sigma = prior_beta_sigma
+        self.prior_sigma = prior_sigma
+        # 階層モデルでグループごとに傾きを変える説明変数と、グループのダミー変数の列名の接頭辞
+        self.varying_slope = varying_slope
+        self.group_prefix = group_prefix
+        self._models = {}
+        self._steps = {}
+        self._nutpie_models = {}
+        self._logp_dlogp_fns = {}
+        self.compile_times = {}
+
+    def _build(self, X, y, family, groups=None):
+        with pm.Model() as model:
+            X_data = pm.Data("X", X)
+            y_data = pm.Data("y", y)
+
+            # 事前分布
+            beta = pm.Normal("beta", mu=0, sigma=self.prior_beta_sigma, shape=X.shape[1])
+
+            # 線形予測子
+            linear_pred = pm.math.dot(X_data, beta)
+
+            if family in HIERARCHICAL_FAMILIES:
+                # グループごとの傾きの偏差を tau で部分プーリングする
+                slope_idx, group_idx = groups
+                tau = pm.HalfNormal("tau_group", sigma=self.prior_beta_sigma)
+                if HIERARCHICAL_FAMILIES[family] == "noncentered":
+                    z = pm.Normal("group_offset_z", mu=0, sigma=1, shape=len(group_idx))
+                    offset = pm.Deterministic("group_offset", tau * z)
+                else:
+                    offset = pm.Normal("group_offset", mu=0, sigma=tau, shape=len(group_idx))
+                pm.Deterministic("group_slope", beta[slope_idx] + offset)
+                # 傾きの変数とグループのダミーの積（複数のグループに属する行は偏差の和になる）
+                varying = X_data[:, list(group_idx)] * X_data[:, slope_idx][:, None]
+                linear_pred = linear_pred + pm.math.dot(varying, offset)
+
+            # 尤度
+            if family == 'normal' or family in HIERARCHICAL_FAMILIES:
+                sigma = pm.HalfNormal("sigma", sigma=self.prior_sigma)
+                pm.Normal("y_obs", mu=linear_pred, sigma=sigma, observed=y_data, shape=X_data.shape[0])
+            elif family == 'bernoulli':
+                # logit_p で渡すと、線形予測子が大きい場合も対数尤度が数値的に安定する
+                pm.Bernoulli("y_obs", logit_p=linear_pred, observed=y_data, shape=X_data.shape[0])
+            else:
+                raise ValueError(f"Unknown family: {family}")
+        return model
+
+    @staticmethod
+    def _arrays(X, y, family):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y).ravel()
+        y = y.astype(np.int64) if family == 'bernoulli' else y.astype(float)
+        return X, y
+
+    def _groups(self, X, family):
+        """階層モデルで傾きを変える説明変数と、グループのダミー変数の列番号（それ以外の family は None）"""
+        if family not in HIERARCHICAL_FAMILIES:
+            return None
+        if not isinstance(X, pd.DataFrame):
+            raise ValueError("The hierarchical model needs X as a DataFrame with column names.")
+        columns = list(X.columns)
+        group_idx = tuple(i for i, column in enumerate(columns) if column.startswith(self.group_prefix))
+        if self.varying_slope not in columns or not group_idx:
+            raise ValueError(f"X needs '{self.varying_slope}' and '{self.group_prefix}*' columns "
+                             f"for the hierarchical model.")
+        return columns.index(self.varying_slope), group_idx
+
+    def _coords(self, X, family):
+        """係数の座標（X が DataFrame の場合は列名、階層モデルではグループの偏差・傾きにグループ名）"""
+        if not isinstance(X, pd.DataFrame):
+            return {}
+        coords = {"beta_dim_0": list(X.columns)}
+        groups = self._groups(X, family)
+        if groups is not None:
+            names = [X.columns[i] for i in groups[1]]
+            coords.update({f"{var}_dim_0": names for var in ("group_offset", "group_offset_z", "group_slope")})
+        return coords
+
+    @staticmethod
+    def _assign_coords(dataset, coords):
+        return dataset.assign_coords({dim: values for dim, values in coords.items() if dim in dataset.dims})
+
+    def _key(self, X, y, family):
+        groups = self._groups(X, family)
+        X, y = self._arrays(X, y, family)
+        return (X.shape, family, groups)
+
+    def get_model(self, X, y, family='normal'):
+        """X, y を差し替えたモデルを返す（初回のみ構築し、NUTS のステップはコンパイルしない）"""
+        key = self._key(X, y, family)
+        X, y = self._arrays(X, y, family)
+        if key not in self._models:
+            start = time.perf_counter()
+            self._models[key] = self._build(X, y, family, groups=key[2])
+            self.compile_times[key + ("model",)] = time.perf_counter() - start
+        model = self._models[key]
+        with model:
+            pm.set_data({"X": X, "y": y})
+        return model
+
+    def get(self, X, y, family='normal'):
+        """X, y を差し替えたモデルと pymc の NUTS のステップを返す（初回のみ構築・コンパイル）"""
+        model = self.get_model(X, y, family)
+        key = self._key(X, y, family)
+        if key not in self._steps:
+            # 対数密度と勾配をここで一度だけコンパイルする
+            # (適応的サンプリングの続きの区間で質量行列を固定できるポテンシャルを使う)
+            start = time.perf_counter()
+            n = sum(np.size(value) for value in model.initial_point().values())
+            target_accept = HIERARCHICAL_TARGET_ACCEPT if key[2] is not None else 0.8
+            with model:
+                self._steps[key] = pm.NUTS(potential=ContinuablePotential(n), target_accept=target_accept)
+            self.compile_times[key + ("pymc",)] = time.perf_counter() - start
+        return model, self._steps[key]
+
+    def _get_nutpie(self, X, y, family):
+        """nutpie でコンパイルしたモデル（初回のみコンパイル）に X, y を差し替えて返す"""
+        import nutpie
+
+        model = self.get_model(X, y, family)
+        key = self._key(X, y, family)
+        X, y = self._arrays(X, y, family)
+        if key not in self._nutpie_models:
+            start = time.perf_counter()
+            self._nutpie_models[key] = nutpie.compile_pymc_model(model, freeze_model=False)
+            self.compile_times[key + ("nutpie",)] = time.perf_counter() - start
+        return self._nutpie_models[key].with_data(X=X, y=y)
+
+    def compile(self, X, y, family='normal', backend='pymc'):
+        """
+        サンプリングの前にモデルをコンパイルしておく（ベンチマークでコンパイル時間を分けて測るため）
+        JAX 系のバックエンドは pm.sample の呼び出しごとに JIT コンパイルされるので、ここではモデルの構築だけを行う
+        (JIT コンパイルの時間はサンプリングの時間に含まれる)
+        """
+        if backend == 'nutpie':
+            self._get_nutpie(X, y, family)
+        elif backend in JAX_BACKENDS:
+            self.get_model(X, y, family)
+        else:
+            self.get(X, y, family)
+
+    def _initvals(self, model, n_params, chains, rng):
+        """チェーンごとの初期値（pm.sample の jitter の代わり）"""
+        initvals = []
+        for _ in range(chains):
+            point = {"beta": rng.uniform(-1, 1, n_params)}
+            if "sigma" in model.named_vars:
+                point["sigma"] = float(np.exp(rng.uniform(-1, 1)))
+            initvals.append(point)
+        return initvals
+
+    def sample(self, X, y, family='normal', draws=2000, tune=1000, chains=2, cores=None,
+               progressbar=True, random_seed=None, backend='pymc', **kwargs):
+        """
+        コンパイル済みのモデルで事後分布をサンプリングする
+        backend: 'pymc' (既定の NUTS) / 'nutpie' / 'numpyro' / 'blackjax'
+        X が DataFrame の場合は列名を係数の座標 (beta_dim_0) に付ける
+        """
+        if backend not in available_backends():
+            raise ImportError(f"Sampler backend '{backend}' is not available (install {SAMPLER_BACKENDS.get(backend)}).")
+        coords = self._coords(X, family)
+        rng = np.random.default_rng(random_seed)
+        seed = int(rng.integers(2 ** 31))
+
+        if backend == 'nutpie':
+            import nutpie
+
+            compiled = self._get_nutpie(X, y, family)
+            trace = nutpie.sample(compiled, draws=draws, tune=tune, chains=chains, cores=cores,
+                                  seed=seed, progress_bar=progressbar, **kwargs)
+        else:
+            sampler_kwargs = {} if cores is None else {"cores": cores, "blas_cores": cores}
+            if backend in JAX_BACKENDS:
+                model = self.get_model(X, y, family)
+                # CPU では複数チェーンを1つの JIT 関数でまとめて進める
+                sampler_kwargs.update(nuts_sampler=backend, nuts_sampler_kwargs={"chain_method": "vectorized"})
+            else:
+                model, sampler_kwargs["step"] = self.get(X, y, family)
+            with model:
+                trace = pm.sample(draws=draws, tune=tune, chains=chains,
+                                  initvals=self._initvals(model, np.shape(X)[1], chains, rng),
+                                  random_seed=seed, progressbar=progressbar,
+                                  return_inferencedata=True, **sampler_kwargs, **kwargs)
+
+        trace.posterior = self._assign_coords(trace.posterior, coords)
+        return trace
+
+    @staticmethod
+    def _continuation_step(step, trace):
+        """
+        チューニング済みのチェーンを続けるように、コンパイル済みの NUTS のステップを設定する
+        pm.sample は呼び出しごとにステップの適応をやり直すので、これまでの draws から
+        制約のない空間での分散（対角の質量行列）と適応後のステップサイズを求めて固定する
+        """
+        columns = []
+        for var in step.vars:
+            values = trace.posterior[var.name].values
+            columns.append(values.reshape(values.shape[0] * values.shape[1], -1))
+        variance = np.concatenate(columns, axis=1).var(axis=0)
+        step_size = float(trace.sample_stats["step_size_bar"].isel(draw=-1).mean())
+        step.potential.fix(np.maximum(variance, 1e-10))
+        # tune=0 では適応しないので、ステップサイズは初期値 step_size のまま使われる
+        step.step_adapt = DualAverageAdaptation(step_size, step.target_accept, gamma=0.05, k=0.75, t0=10)
+        return step
+
+    @staticmethod
+    def _last_points(model, trace):
+        """各チェーンの最後の draw（次の区間の初期値）"""
+        names = [rv.name for rv in model.free_RVs]
+        return [{name: trace.posterior[name].isel(chain=c, draw=-1).values for name in names}
+                for c in range(trace.posterior.sizes["chain"])]
+
+    def sample_adaptive(self, X, y, family='normal', targets=None, terms=None, chunk=500, tune=1000,
+                        max_draws=10000, time_budget=None, chains=2, cores=None, progressbar=True,
+                        random_seed=None):
+        """
+        draws を chunk ずつ追加し、収束目標を満たした時点（または時間切れ）で止める
+        targets: {"rhat": R-hat の上限, "ess_bulk": bulk ESS の下限, "ess_tail": tail ESS の下限}
+        terms: 判定に使う beta の係数名（省略時は全係数）
+        time_budget: 秒数。次の区間が前の区間と同じ時間かかると予算を超える場合は止める
+
+        戻り値の trace.posterior.attrs に draws 数・所要時間・停止理由・最後の診断量を記録する
+        """
+        targets = dict(ADAPTIVE_TARGETS, **(targets or {}))
+        coords = self._coords(X, family)
+        model, step = self.get(X, y, family)
+        rng = np.random.default_rng(random_seed)
+        sampler_kwargs = {"chains": chains, "progressbar": progressbar, "return_inferencedata": True,
+                          "idata_kwargs": {"include_transformed": True}}
+        if cores is not None:
+            sampler_kwargs.update(cores=cores, blas_cores=cores)
+
+        start = time.perf_counter()
+        with model:
+            trace = pm.sample(draws=chunk, tune=tune, step=step, random_seed=int(rng.integers(2 ** 31)),
+                              initvals=self._initvals(model, np.shape(X)[1], chains, rng), **sampler_kwargs)
+        trace.posterior = self._assign_coords(trace.posterior, coords)
+        sampling_time = trace.posterior.attrs.get("sampling_time", 0.0)
+
+        # 最初の区間はチューニングを含むので、1区間あたりの時間は draws の割合で見積もる
+        chunk_time = (time.perf_counter() - start) * chunk / (tune + chunk)
+        # 続きの区間ではステップの質量行列とステップサイズを固定するので、終わったら適応する設定に戻す
+        initial_step_adapt = step.step_adapt
+        try:
+            while True:
+                diagnostics = convergence_diagnostics(trace, terms)
+                draws = trace.posterior.sizes["draw"]
+                elapsed = time.perf_counter() - start
+                print(f"draws {draws}: R-hat {diagnostics['rhat']:.4f}, ESS bulk {diagnostics['ess_bulk']:.0f}, "
+                      f"ESS tail {diagnostics['ess_tail']:.0f} ({elapsed:.1f}s)")
+                if targets_met(diagnostics, targets):
+                    reason = "converged"
+                elif draws + chunk > max_draws:
+                    reason = "max_draws"
+                elif time_budget is not None and elapsed + chunk_time > time_budget:
+                    reason = "time_budget"
+                else:
+                    reason = None
+                if reason is not None:
+                    break
+
+                chunk_start = time.perf_counter()
+                with model:
+                    more = pm.sample(draws=chunk, tune=0, step=self._continuation_step(step, trace),
+                                     initvals=self._last_points(model, trace),
+                                     random_seed=int(rng.integers(2 ** 31)), **sampler_kwargs)
+                more.posterior = self._assign_coords(more.posterior, coords).assign_coords(
+                    draw=more.posterior["draw"] + draws)
+                more.sample_stats = more.sample_stats.assign_coords(draw=more.sample_stats["draw"] + draws)
+                trace.posterior = xr.concat([trace.posterior, more.posterior], dim="draw")
+                trace.sample_stats = xr.concat([trace.sample_stats, more.sample_stats], dim="draw")
+                sampling_time += more.posterior.attrs.get("sampling_time", 0.0)
+                chunk_time = time.perf_counter() - chunk_start
+        finally:
+            step.potential.fix(None)
+            step.step_adapt = initial_step_adapt
+
+        # 適応に使った制約のない空間の変数は残さない
+        trace.posterior = trace.posterior.drop_vars([v for v in trace.posterior.data_vars if v.endswith("__")])
+        # concat では最初の区間の属性が残るので、全区間の合計のサンプリング時間に直す
+        for group in (trace.posterior, trace.sample_stats):
+            group.attrs.update(sampling_time=float(sampling_time), tuning_steps=int(tune))
+        trace.posterior.attrs.update({
+            "adaptive_draws": int(draws), "adaptive_tune": int(tune), "adaptive_time": float(elapsed),
+            "adaptive_stop_reason": reason,
+            **{f"adaptive_{name}": value for name, value in diagnostics.items()},
+        })
+        return trace
+
+    def _logp_dlogp(self, model):
+        """
+        制約のない空間での対数密度と勾配を返す関数（モデルごとに1回だけコンパイルする）
+        入力は変数の辞書、勾配は model.continuous_value_vars の順に並ぶ
+        """
+        if id(model) not in self._logp_dlogp_fns:
+            self._logp_dlogp_fns[id(model)] = model.compile_fn([model.logp(), model.dlogp()],
+                                                               inputs=model.continuous_value_vars)
+        return self._logp_dlogp_fns[id(model)]
+
+    def _find_mode(self, model):
+        """
+        制約のない空間での MAP 推定
+        戻り値: (MAP, 負の対数密度と勾配の関数, 変数の並び)
+        """
+        logp_dlogp = self._logp_dlogp(model)
+        initial_point = model.initial_point()
+        start = DictToArrayBijection.map({v.name: initial_point[v.name] for v in model.continuous_value_vars})
+
+        def neg_logp(q):
+            logp, grad = logp_dlogp(DictToArrayBijection.rmap(RaveledVars(q, start.point_map_info)))
+            return -logp, -grad
+
+        mode = optimize.minimize(neg_logp, start.data, jac=True, method="L-BFGS-B").x
+        return mode, neg_logp, start.point_map_info
+
+    def _laplace(self, model, y, draws, rng):
+        """
+        MAP と、その点でのヘッセ行列による正規近似（制約のない空間で近似し、sigma は exp で戻す）
+        ヘッセ行列は勾配の中心差分で求める
+        """
+        mode, neg_logp, point_map_info = self._find_mode(model)
+
+        # 負の対数密度のヘッセ行列（勾配の中心差分）
+        eps = 1e-5 * np.maximum(np.abs(mode), 1)
+        hessian = np.empty((len(mode), len(mode)))
+        for j in range(len(mode)):
+            step_j = np.zeros(len(mode))
+            step_j[j] = eps[j]
+            hessian[:, j] = (neg_logp(mode + step_j)[1] - neg_logp(mode - step_j)[1]) / (2 * eps[j])
+        hessian = (hessian + hessian.T) / 2
+
+        # q = mode + L z (L L' = H^-1) をまとめて生成
+        chol = np.linalg.cholesky(np.linalg.inv(hessian))
+        q = mode + rng.standard_normal((draws, len(mode))) @ chol.T
+
+        posterior = {}
+        offset = 0
+        for name, shape, size, _ in point_map_info:
+            values = q[:, offset:offset + size].reshape((draws,) + shape)
+            offset += size
+            if name == "sigma_log__":
+                name, values = "sigma", np.exp(values)
+            posterior[name] = values[None]
+        return az.from_dict(posterior=posterior, dims={"beta": ["beta_dim_0"]},
+                            observed_data={"y_obs": np.asarray(y).ravel()},
+                            attrs={"approximation": "laplace"})
+
+    def approximate(self, X, y, family='normal', method='laplace', draws=2000, random_seed=None,
+                    n_iter=30000):
+        """
+        NUTS の代わりに近似推論で事後分布を求める（事後平均・符号・スケールの確認用）
+        method: 'laplace' (MAP + ヘッセ行列による正規近似) / 'advi' (平均場変分推論)
+        戻り値は1チェーンの InferenceData（analyze_interaction やプロットはそのまま使える）
+        """
+        if method not in APPROX_METHODS:
+            raise ValueError(f"Unknown approximation: {method}")
+        if method == 'laplace' and family in HIERARCHICAL_FAMILIES:
+            raise ValueError("The Laplace approximation does not support the hierarchical model (use 'advi').")
+        coords = self._coords(X, family)
+        model = self.get_model(X, y, family)
+        rng = np.random.default_rng(random_seed)
+
+        if method == 'laplace':
+            trace = self._laplace(model, y, draws, rng)
+        else:
+            # MAP から小さい標準偏差で始めると、標準化していない説明変数でも最適化が発散しない
+            mode, _, point_map_info = self._find_mode(model)
+            start = DictToArrayBijection.rmap(RaveledVars(mode, point_map_info))
+            start_sigma = {name: np.full(shape, ADVI_START_SIGMA) for name, shape, _, _ in point_map_info}
+            with model:
+                approx = pm.fit(n=n_iter, method="advi", start=start, start_sigma=start_sigma,
+                                random_seed=int(rng.integers(2 ** 31)),
+                                obj_optimizer=pm.adam(learning_rate=0.01), progressbar=False)
+                trace = approx.sample(draws, random_seed=int(rng.integers(2 ** 31)))
+            trace.posterior.attrs["approximation"] = "advi"
+
+        trace.posterior = self._assign_coords(trace.posterior, coords)
+        return trace
+
+    def sample_targets(self, X, targets, family='normal', **sample_kwargs):
+        """
+        同じデザイン行列で複数の目的変数（閾値ごとのラベル・再標本など）を順に推定する
+        targets: {名前: y} の辞書。モデルのコンパイルは最初の1回だけ
+        """
+        return {name: self.sample(X, y, family, **sample_kwargs) for name, y in targets.items()}
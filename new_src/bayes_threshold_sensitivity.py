@@ -0,0 +1,161 @@
+# PyTensor のコンパイルキャッシュの設定を有効にするため、pymc より先に読み込む
+import bayes_model_factory
+import os
+import time
+
+import arviz as az
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import patsy
+import pymc as pm
+
+from threshold_sensitivity import threshold_labels
+from visualization import IMAGE_DIR
+
+
+# 部分プーリングの閾値間のばらつき tau の事前分布 Gamma(alpha, beta)（平均 0.1）
+# 隣り合う閾値のラベルはほとんど同じで係数の差は小さいので、係数の事前分布 (prior_beta_sigma) より狭くする。
+# HalfNormal と違い tau = 0 付近に密度がないので、tau が 0 に近づく漏斗状の領域で発散しない
+POOLED_TAU_ALPHA = 2
+POOLED_TAU_BETA = 20
+# 標準化していない説明変数 (political_news_count, actor_fame_log) は tau が大きい領域で曲率が急になるので、
+# ステップサイズを小さめにする
+POOLED_TARGET_ACCEPT = 0.95
+
+# 収束の警告を出す R-hat の上限
+RHAT_WARNING = 1.01
+
+
+def build_threshold_model(X, labels, quantiles, column_names, pooled=False, prior_beta_sigma=1):
+    """
+    閾値ごとの2値ラベル (n×Q) を1つのモデルにまとめたロジスティック回帰
+    係数は (説明変数, 閾値) の行列で、線形予測子は X @ beta の1回の行列積で全閾値分を計算する
+
+    pooled: True の場合は説明変数ごとに閾値間で係数を部分プーリングする
+            (beta[:, q] = mu + tau * z[:, q]、z ~ Normal(0, 1)、tau ~ Gamma(POOLED_TAU_ALPHA, POOLED_TAU_BETA))
+            閾値間の係数の差はラベルが入れ替わる少数の行からしか識別されないので非中心化で表す
+    """
+    coords = {"beta_dim_0": list(column_names), "quantile": list(quantiles)}
+    with pm.Model(coords=coords) as model:
+        X_data = pm.Data("X", np.asarray(X, dtype=float))
+        labels_data = pm.Data("labels", np.asarray(labels, dtype=np.int64))
+
+        if pooled:
+            mu = pm.Normal("mu_beta", mu=0, sigma=prior_beta_sigma, dims="beta_dim_0")
+            tau = pm.Gamma("tau_beta", alpha=POOLED_TAU_ALPHA, beta=POOLED_TAU_BETA, dims="beta_dim_0")
+            z = pm.Normal("beta_z", mu=0, sigma=1, dims=("beta_dim_0", "quantile"))
+            beta = pm.Deterministic("beta", mu[:, None] + tau[:, None] * z, dims=("beta_dim_0", "quantile"))
+        else:
+            beta = pm.Normal("beta", mu=0, sigma=prior_beta_sigma, dims=("beta_dim_0", "quantile"))
+
+        pm.Bernoulli("y_obs", logit_p=pm.math.dot(X_data, beta), observed=labels_data,
+                     shape=labels_data.shape)
+    return model
+
+
+def _initvals(model, shape, chains, rng):
+    """
+    チェーンごとの初期値（pm.sample の jitter の代わり）
+    階層モデルで tau が極端な値から始まると、チェーンが動かなくなることがある
+    """
+    initvals = []
+    for _ in range(chains):
+        if "tau_beta" in model.named_vars:
+            point = {"mu_beta": rng.uniform(-0.5, 0.5, shape[0]), "tau_beta": np.full(shape[0], POOLED_TAU_ALPHA / POOLED_TAU_BETA),
+                     "beta_z": rng.uniform(-1, 1, shape)}
+        else:
+            point = {"beta": rng.uniform(-0.5, 0.5, shape)}
+        initvals.append(point)
+    return initvals
+
+
+def summarize_threshold_trace(trace, target_term, thresholds, hdi_prob=0.95):
+    """閾値ごとの target_term の係数の事後平均・HDI・正である確率・収束診断"""
+    beta = trace.posterior["beta"].sel(beta_dim_0=target_term)
+    hdi = az.hdi(beta, hdi_prob=hdi_prob)["beta"]
+    rhat = az.rhat(beta.to_dataset(name="beta"))["beta"]
+    ess = az.ess(beta.to_dataset(name="beta"), method="bulk")["beta"]
+    return pd.DataFrame({
+        "quantile": beta["quantile"].values,
+        "threshold": thresholds,
+        "mean": beta.mean(dim=("chain", "draw")).values,
+        "sd": beta.std(dim=("chain", "draw")).values,
+        "hdi_lower": hdi.sel(hdi="lower").values,
+        "hdi_upper": hdi.sel(hdi="higher").values,
+        "prob_positive": (beta > 0).mean(dim=("chain", "draw")).values,
+        "r_hat": rhat.values,
+        "ess_bulk": ess.values,
+    })
+
+
+def run_bayesian_threshold_sensitivity(df, formula_rhs, target_term, quantiles=None, value_col='roi',
+                                       pooled=False, draws=2000, tune=1000, chains=2, cores=None,
+                                       prior_beta_sigma=1, random_seed=None, progressbar=True):
+    """
+    閾値を変動させたベイズロジスティック回帰の感度分析を、1回のコンパイルとサンプリングで実行する
+    ラベルの作り方と行の対応は run_threshold_sensitivity と同じ
+
+    戻り値: (閾値ごとの要約, トレース, 所要時間)
+    """
+    if quantiles is None:
+        quantiles = [0.35, 0.40, 0.45, 0.50, 0.55, 0.60, 0.65]
+    X = patsy.dmatrix(formula_rhs, df, return_type='dataframe')
+    thresholds, labels = threshold_labels(df[value_col].to_numpy(), quantiles)
+    labels = labels[df.index.get_indexer(X.index)]
+
+    start = time.perf_counter()
+    model = build_threshold_model(X, labels, quantiles, X.columns, pooled=pooled,
+                                  prior_beta_sigma=prior_beta_sigma)
+    sampler_kwargs = {} if cores is None else {"cores": cores, "blas_cores": cores}
+    rng = np.random.default_rng(random_seed)
+    with model:
+        trace = pm.sample(draws=draws, tune=tune, chains=chains, random_seed=int(rng.integers(2 ** 31)),
+                          initvals=_initvals(model, (X.shape[1], len(quantiles)), chains, rng),
+                          target_accept=POOLED_TARGET_ACCEPT if pooled else 0.8,
+                          progressbar=progressbar, **sampler_kwargs)
+    elapsed = time.perf_counter() - start
+
+    return summarize_threshold_trace(trace, target_term, thresholds), trace, elapsed
+
+
+def convergence_warnings(trace, res_df):
+    """発散・木の深さの上限・R-hat の問題があれば警告文のリストを返す（問題がなければ空）"""
+    stats = trace.sample_stats
+    warnings = []
+    divergences = int(stats["diverging"].sum())
+    if divergences:
+        warnings.append(f"{divergences} divergent transitions; the posterior summaries may be biased.")
+    if "reached_max_treedepth" in stats and int(stats["reached_max_treedepth"].sum()):
+        warnings.append(f"{int(stats['reached_max_treedepth'].sum())} draws reached the maximum tree depth.")
+    if res_df["r_hat"].max() > RHAT_WARNING:
+        warnings.append(f"max R-hat {res_df['r_hat'].max():.3f} > {RHAT_WARNING}; the chains have not mixed.")
+    return warnings
+
+
+def plot_bayesian_threshold_sensitivity(res_df, target_term, filename="bayes_sensitivity_analysis.png"):
+    """閾値ごとの事後平均と95%HDI（帯）、係数が正である確率（右軸）をプロットする"""
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+    ax1.plot(res_df['quantile'], res_df['mean'], '-o', color='blue', label='Posterior Mean')
+    ax1.fill_between(res_df['quantile'], res_df['hdi_lower'], res_df['hdi_upper'],
+                     color='blue', alpha=0.2, label='95% HDI')
+    ax1.axhline(y=0, color='gray', linestyle='--', linewidth=1)
+    ax1.set_xlabel('ROI Threshold Quantile (Median=0.5)')
+    ax1.set_ylabel('Coefficient (Posterior)')
+    ax1.set_title(f'Bayesian Sensitivity Analysis: {target_term}')
+    ax1.grid(True, linestyle=':', alpha=0.6)
+
+    ax2 = ax1.twinx()
+    ax2.plot(res_df['quantile'], res_df['prob_positive'], color='red', linestyle=':', marker='x',
+             label='P(coef > 0)')
+    ax2.set_ylabel('P(coef > 0)')
+    ax2.set_ylim(0, 1)
+
+    lines1, labels1 = ax1.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
+
+    save_path = os.path.join(IMAGE_DIR, filename)
+    plt.savefig(save_path, bbox_inches='tight')
+    print(f"Saved sensitivity plot to: {save_path}")
+    plt.close()
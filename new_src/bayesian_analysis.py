@@ -1,15 +1,61 @@
+import argparse
+# PyTensor のコンパイルキャッシュの設定を有効にするため、pymc を使うモジュールより先に読み込む
+from bayes_model_factory import (BayesianModelFactory, available_backends, SAMPLER_BACKENDS, APPROX_METHODS,
+                                 ADAPTIVE_TARGETS, HIERARCHICAL_FAMILIES)
 import pandas as pd
 import numpy as np
-import pymc as pm
 import arviz as az
 import patsy
 import matplotlib.pyplot as plt
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from data_processing import load_and_preprocess_data
+from design_cache import DesignMatrixCache
+from result_store import FitResultStore, make_key, RESULT_DIR
+from sampler_benchmark import benchmark_backends, benchmark_parameterizations
+from bayes_threshold_sensitivity import (run_bayesian_threshold_sensitivity, plot_bayesian_threshold_sensitivity,
+                                         convergence_warnings)
+from threshold_sensitivity import threshold_labels
+from posterior_summary import summarize_posterior, summarize_models
+from trace_storage import save_trace, load_trace, storage_report, TRACE_FORMATS
+from posterior_predictive import (psis_loo, holdout_elpd, interval_coverage, calibration, plot_calibration,
+                                  INTERVAL_PROBS)
+from sampler_instrumentation import (PhaseTimer, build_run_record, write_run_log, format_run_summary,
+                                     load_run_log, compare_runs, plot_run_comparison, RUN_LOG_CSV)
 from visualization import save_arviz_plot, IMAGE_DIR
 
 # --- 設定 ---
 INPUT_FILE = "new_data/movies_with_news.csv"
 
+# サンプリング設定（保存キーの一部）
+SAMPLER_SETTINGS = {"draws": 2000, "tune": 1000, "chains": 2, "prior_beta_sigma": 1, "prior_sigma": 10}
+
+# 標準化する連続変数
+CONTINUOUS_COLS = ['political_news_count', 'actor_fame_log', 'budget_log']
+
+# 共通の右辺（説明変数）
+BASE_FORMULA_RHS = """
+    political_news_count + actor_fame_log + budget_log_std + belongs_to_collection + 
+    Genre_Drama + Genre_Comedy + Genre_Thriller + 
+    Genre_Action + Genre_Adventure + Genre_Romance + Genre_Crime + 
+    Genre_Science_Fiction + Genre_Family + Genre_Horror
+"""
+
+# 推定する3モデル {キー: (フォーミュラ, モデル名, family)}
+MODEL_SPECS = {
+    "revenue": (f"revenue_log ~ {BASE_FORMULA_RHS}", "Revenue Log", 'normal'),
+    "roi": (f"roi_log ~ {BASE_FORMULA_RHS}", "ROI Log", 'normal'),
+    "logit": (f"is_high_roi ~ {BASE_FORMULA_RHS}", "High ROI (Logistic)", 'bernoulli'),
+}
+
+# 階層モデルでジャンルごとに変える傾き（BayesianModelFactory の既定）
+VARYING_SLOPE = "political_news_count"
+
+# (デザイン行列の形状, family) ごとのコンパイル済みモデル（プロセス内で共有）
+MODEL_FACTORY = BayesianModelFactory(prior_beta_sigma=SAMPLER_SETTINGS["prior_beta_sigma"],
+                                     prior_sigma=SAMPLER_SETTINGS["prior_sigma"])
+
 def standardize_data(df, cols):
     """指定された列を標準化（Z-score normalization）する"""
     df_std = df.copy()
@@ -20,116 +66,551 @@ def standardize_data(df, cols):
             df_std[f'{col}_std'] = (df_std[col] - mean_val) / std_val
     return df_std
 
-def run_bayesian_model(df, formula, model_name, family='normal'):
+def run_bayesian_model(df, formula, model_name, family='normal', design_cache=None,
+                       store=None, force_resample=False, chains=None, cores=None, progressbar=True,
+                       factory=None, backend='pymc', approx=None, adaptive=None, trace_storage=None,
+                       run_log=True):
     """
     PatsyとPyMCを用いてベイズモデルを構築・実行する共通関数
     family: 'normal' (線形回帰) or 'bernoulli' (ロジスティック回帰)
+            or 'hierarchical' (political_news_count の傾きがジャンルごとに変わる線形回帰、非中心化)
+    design_cache: DesignMatrixCache を渡すとデザイン行列を再構築せずに共有する
+    store: FitResultStore を渡すと、同じフォーミュラ・設定・データのトレースを再利用する
+    force_resample: True の場合は保存済みのトレースを使わずに再サンプリングする
+    chains: チェーン数（省略時は SAMPLER_SETTINGS の値）
+    cores: このモデルに割り当てるコア数（チェーンの並列数と BLAS のスレッド数の上限）
+    factory: BayesianModelFactory（省略時は MODEL_FACTORY）。同じ形状・family のモデルは再コンパイルしない
+    backend: サンプラー ('pymc' / 'nutpie' / 'numpyro' / 'blackjax')
+    approx: 'laplace' / 'advi' を指定すると NUTS の代わりに近似推論で事後分布を求める（速報用）
+    adaptive: 辞書を渡すと draws を固定せず、収束目標を満たすまで区間ごとに追加する
+              キーは targets, terms, chunk, max_draws, time_budget (BayesianModelFactory.sample_adaptive を参照)
+    trace_storage: トレースの保存方法 {"fmt": 'netcdf' / 'zarr', "float32": bool} (save_trace を参照)
+    run_log: True の場合、新しくサンプリングした推定の所要時間の内訳（デザイン行列・コンパイル・初期化・
+             チューニング・本サンプリング）、チェーンごとのステップサイズ・木の深さ・発散、係数ごとの ESS/秒を
+             実行ログ (sampler_instrumentation.RUN_LOG_DIR / RUN_LOG_CSV) に書く
     """
+    if approx is not None:
+        # 近似推論はチェーン・チューニングを使わないので、保存キーもサンプリングとは別にする
+        settings = {k: SAMPLER_SETTINGS[k] for k in ("draws", "prior_beta_sigma", "prior_sigma")}
+        settings["approx"] = approx
+        estimator = f"{approx}_{family}"
+    else:
+        settings = dict(SAMPLER_SETTINGS, chains=chains or SAMPLER_SETTINGS["chains"])
+        if backend != 'pymc':
+            settings["backend"] = backend
+        if adaptive is not None:
+            if backend != 'pymc':
+                raise ValueError("Adaptive sampling is only supported with the pymc backend.")
+            # draws は結果として決まるので、キーには収束目標を入れる
+            settings.pop("draws")
+            settings["adaptive"] = adaptive
+        estimator = f"pymc_{family}"
     print(f"\n========== Running Bayesian Model: {model_name} ==========")
     
     # デザイン行列の作成
-    y, X = patsy.dmatrices(formula, data=df, return_type='dataframe')
+    start = time.perf_counter()
+    if design_cache is not None:
+        y, X = design_cache.dmatrices(formula)
+    else:
+        y, X = patsy.dmatrices(formula, data=df, return_type='dataframe')
     X_columns = X.columns
+    phases = {"design_s": time.perf_counter() - start}
+
+    # 保存済みのトレースがあれば読み込む
+    if store is not None:
+        key = make_key(formula, estimator, settings, X, y)
+        record = None if force_resample else store.get(key)
+        if record is not None and record["artifact_path"] and os.path.exists(record["artifact_path"]):
+            print(f"Loading stored trace: {record['artifact_path']}")
+            return load_trace(record["artifact_path"]), X_columns
     
-    with pm.Model() as model:
-        # 事前分布
-        beta = pm.Normal("beta", mu=0, sigma=1, shape=X.shape[1])
-        
-        # 線形予測子
-        linear_pred = pm.math.dot(np.asarray(X), beta)
-        
-        # 尤度
-        if family == 'normal':
-            # 線形回帰の場合、誤差の分散 sigma も推定
-            sigma = pm.HalfNormal("sigma", sigma=10)
-            pm.Normal("y_obs", mu=linear_pred, sigma=sigma, observed=np.asarray(y).flatten())
-            
-        elif family == 'bernoulli':
-            # ロジスティック回帰の場合、シグモイド変換
-            p = pm.math.sigmoid(linear_pred)
-            pm.Bernoulli("y_obs", p=p, observed=np.asarray(y).flatten())
-        
-        # MCMCサンプリング
+    # pm.Data で X, y を差し替えてコンパイル済みのモデルを再利用する
+    if factory is None:
+        factory = MODEL_FACTORY
+    # コンパイルを先に済ませ、サンプリングの時間と分けて測る（同じ形状のモデルがあれば 0 に近い）
+    # JAX 系のバックエンドと近似推論ではモデルの構築だけで、JIT・対数密度のコンパイルはサンプリングの時間に含まれる
+    start = time.perf_counter()
+    if approx is not None:
+        factory.get_model(X, y, family)
+    else:
+        factory.compile(X, y, family, backend=backend)
+    phases["compile_s"] = time.perf_counter() - start
+    # チューニングと本サンプリングの境目は pymc の NUTS でだけ測れる（他は合計の時間のみ）
+    timer = PhaseTimer() if run_log and approx is None and adaptive is None and backend == 'pymc' else None
+
+    start = time.perf_counter()
+    if approx is not None:
+        print(f"Approximating ({approx})...")
+        trace = factory.approximate(X, y, family, method=approx, draws=settings["draws"])
+        print(f"Done in {time.perf_counter() - start:.2f}s")
+    elif adaptive is not None:
+        print("Sampling until the convergence targets are met...")
+        trace = factory.sample_adaptive(X, y, family, tune=settings["tune"], chains=settings["chains"],
+                                        cores=cores, progressbar=progressbar, **adaptive)
+        attrs = trace.posterior.attrs
+        print(f"Stopped ({attrs['adaptive_stop_reason']}) after {attrs['adaptive_draws']} draws "
+              f"per chain in {attrs['adaptive_time']:.1f}s")
+    else:
         print("Sampling...")
-        trace = pm.sample(draws=2000, tune=1000, chains=2, return_inferencedata=True)
-        
-    # 変数名をマッピング
-    trace.posterior = trace.posterior.assign_coords({"beta_dim_0": X_columns})
+        sample_kwargs = {} if timer is None else {"callback": timer}
+        trace = factory.sample(X, y, family, draws=settings["draws"], tune=settings["tune"],
+                               chains=settings["chains"], cores=cores, progressbar=progressbar, backend=backend,
+                               **sample_kwargs)
+    phases["sampling_s"] = time.perf_counter() - start
+
+    if run_log and approx is None:
+        if timer is not None:
+            chain_phases, per_chain = timer.phases()
+        else:
+            chain_phases, per_chain = {"init_s": np.nan, "tune_s": np.nan, "draw_s": np.nan}, None
+        phases.update(chain_phases)
+        if adaptive is not None:
+            phases["adaptive_draws"] = trace.posterior.attrs["adaptive_draws"]
+        run_record = build_run_record(model_name, formula, family, backend, settings, phases, trace, per_chain)
+        write_run_log(run_record)
+        print(f"Run log: {format_run_summary(run_record)}")
+
+    # トレースを保存し、キーと紐付ける
+    if store is not None:
+        trace_path = save_trace(trace, key, **(trace_storage or {}))
+        beta_mean = trace.posterior["beta"].mean(dim=("chain", "draw")).values
+        # 適応的サンプリングでは使った draws 数・時間・停止理由を記録する
+        diagnostics = {k[len("adaptive_"):]: v for k, v in trace.posterior.attrs.items()
+                       if k.startswith("adaptive_")} or None
+        store.put(key, formula, estimator, settings,
+                  param_names=list(X_columns), params=beta_mean,
+                  nobs=float(len(X)), diagnostics=diagnostics, artifact_path=trace_path)
     
     return trace, X_columns
 
-def analyze_interaction(trace, interaction_name, model_name, family='normal'):
-    """交互作用項の詳細分析と解釈"""
-    print(f"\n--- Interaction Analysis: {interaction_name} ({model_name}) ---")
-    
+def _bayesian_model_worker(args):
+    """
+    1モデルを推定する
+    args: (df, base_formula_rhs, design_cache, run_bayesian_model のキーワード引数)
+    別プロセスで実行する場合はデザイン行列 (design_cache=None) と保存庫をプロセス内で作る
+    """
+    df, base_formula_rhs, design_cache, model_kwargs = args
+    start = time.perf_counter()
+    if design_cache is None:
+        design_cache = DesignMatrixCache(df, [base_formula_rhs])
+    store = FitResultStore()
     try:
-        beta_samples = trace.posterior["beta"].sel(beta_dim_0=interaction_name).values.flatten()
-        
-        # 確率計算
-        prob_positive = (beta_samples > 0).mean()
-        prob_negative = (beta_samples < 0).mean()
-        
-        hdi = az.hdi(beta_samples, hdi_prob=0.95)
-        mean_val = beta_samples.mean()
-        
-        print(f"事後平均 (Mean): {mean_val:.4f}")
-        print(f"95%信用区間 (HDI): {hdi}")
-        
-        if family == 'bernoulli':
-            # ロジスティック回帰の場合はオッズ比も計算
-            odds_samples = np.exp(beta_samples)
-            prob_odds_gt_1 = (odds_samples > 1).mean()
-            print(f"オッズ比 > 1 の確率: {prob_odds_gt_1:.1%}")
-        else:
-            print(f"係数が正である確率: {prob_positive:.1%}")
-            print(f"係数が負である確率: {prob_negative:.1%}")
-
-        # 簡易判定
-        if prob_positive > 0.95:
-            print(">> 結論: 強い「正の」影響が見られます。")
-        elif prob_negative > 0.95:
-            print(">> 結論: 強い「負の」影響が見られます。")
+        trace, X_columns = run_bayesian_model(df, design_cache=design_cache, store=store, **model_kwargs)
+    finally:
+        store.close()
+    return trace, X_columns, time.perf_counter() - start
+
+def run_bayesian_models(df, base_formula_rhs, model_specs, parallel=False, chains=None,
+                        cores_per_model=None, core_budget=None, force_resample=False, backend='pymc',
+                        approx=None, adaptive=None, trace_storage=None):
+    """
+    複数のベイズモデルを推定する
+    model_specs: {キー: (フォーミュラ, モデル名, family)} の辞書
+    parallel: True の場合は独立なモデルを別プロセスで同時に推定する
+    chains: モデルごとのチェーン数
+    cores_per_model: モデルごとのコア数（省略時はチェーン数とコア予算から決める）
+    core_budget: 全体で使うコア数の上限（省略時は全コア）
+    backend: サンプラー (run_bayesian_model を参照)
+    approx: 近似推論の方法 (run_bayesian_model を参照)
+    adaptive: 適応的サンプリングの設定 (run_bayesian_model を参照)
+    trace_storage: トレースの保存方法 (run_bayesian_model を参照)
+
+    戻り値: ({キー: (trace, X_columns)}, 全体の所要時間)
+    """
+    chains = chains or SAMPLER_SETTINGS["chains"]
+    core_budget = core_budget or os.cpu_count() or 1
+    n_models = len(model_specs) if parallel else 1
+    if cores_per_model is None:
+        cores_per_model = max(1, min(chains, core_budget // n_models))
+    n_workers = max(1, min(n_models, core_budget // cores_per_model))
+
+    # 逐次実行では全モデルで共通のデザイン行列を一度だけ構築する
+    design_cache = DesignMatrixCache(df, [base_formula_rhs]) if n_workers == 1 else None
+    tasks = [(df, base_formula_rhs, design_cache,
+              {"formula": formula, "model_name": model_name, "family": family, "chains": chains,
+               "cores": cores_per_model, "force_resample": force_resample, "progressbar": n_workers == 1,
+               "backend": backend, "approx": approx, "adaptive": adaptive,
+               "trace_storage": trace_storage})
+             for formula, model_name, family in model_specs.values()]
+
+    start = time.perf_counter()
+    if n_workers == 1:
+        outputs = [_bayesian_model_worker(task) for task in tasks]
+    else:
+        print(f"Running {len(tasks)} models on {n_workers} workers "
+              f"({chains} chains, {cores_per_model} cores per model, budget {core_budget} cores)")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            outputs = list(executor.map(_bayesian_model_worker, tasks))
+    wall_time = time.perf_counter() - start
+
+    results = {}
+    for key, (trace, X_columns, elapsed) in zip(model_specs, outputs):
+        attrs = trace.posterior.attrs
+        if "adaptive_draws" in attrs:
+            print(f"{model_specs[key][1]}: {elapsed:.1f}s ({attrs['adaptive_draws']} draws per chain, "
+                  f"sampling {attrs['adaptive_time']:.1f}s, {attrs['adaptive_stop_reason']})")
         else:
-            print(">> 結論: 0を含んでおり、効果は不確実です。")
-            
-    except KeyError:
+            print(f"{model_specs[key][1]}: {elapsed:.1f}s")
+        results[key] = (trace, X_columns)
+    return results, wall_time
+
+def analyze_interaction(trace, interaction_name, model_name, family='normal', summary=None):
+    """
+    交互作用項の詳細分析と解釈
+    summary: summarize_posterior の結果（全係数の要約）を渡すと、トレースから再計算しない
+    """
+    print(f"\n--- Interaction Analysis: {interaction_name} ({model_name}) ---")
+
+    if summary is None:
+        summary = summarize_posterior(trace, family=family, hdi_probs=(0.95,))
+    rows = summary[summary["term"] == interaction_name]
+    if rows.empty:
         print(f"Warning: Interaction term '{interaction_name}' not found in trace.")
+        return
+    row = rows.iloc[0]
+
+    print(f"事後平均 (Mean): {row['mean']:.4f}")
+    print(f"95%信用区間 (HDI): {np.array([row['hdi_95_low'], row['hdi_95_high']])}")
+
+    if family == 'bernoulli':
+        # ロジスティック回帰の場合はオッズ比も計算
+        print(f"オッズ比 > 1 の確率: {row['p_odds_ratio_gt_1']:.1%}")
+    else:
+        print(f"係数が正である確率: {row['p_positive']:.1%}")
+        print(f"係数が負である確率: {row['p_negative']:.1%}")
+
+    # 簡易判定
+    if row['p_positive'] > 0.95:
+        print(">> 結論: 強い「正の」影響が見られます。")
+    elif row['p_negative'] > 0.95:
+        print(">> 結論: 強い「負の」影響が見られます。")
+    else:
+        print(">> 結論: 0を含んでおり、効果は不確実です。")
+
+def compare_approximation(approx_trace, nuts_trace, var_names=("beta", "sigma"), hdi_prob=0.95):
+    """
+    近似推論と NUTS の事後分布をパラメータごとに比較する
+    平均の差は NUTS の事後標準偏差を単位にし、HDI の重なりは NUTS の HDI 幅に対する割合で表す
+    """
+    var_names = [v for v in var_names if v in nuts_trace.posterior and v in approx_trace.posterior]
+    approx_summary = az.summary(approx_trace, var_names=var_names, kind="stats", hdi_prob=hdi_prob)
+    nuts_summary = az.summary(nuts_trace, var_names=var_names, kind="stats", hdi_prob=hdi_prob)
+    # kind="stats" の列は mean, sd, HDI の下限, HDI の上限
+    lower, upper = nuts_summary.columns[2], nuts_summary.columns[3]
+
+    report = pd.DataFrame({
+        "mean_nuts": nuts_summary["mean"],
+        "mean_approx": approx_summary["mean"],
+        "sd_nuts": nuts_summary["sd"],
+        "sd_approx": approx_summary["sd"],
+        "hdi_low_nuts": nuts_summary[lower],
+        "hdi_high_nuts": nuts_summary[upper],
+        "hdi_low_approx": approx_summary[lower],
+        "hdi_high_approx": approx_summary[upper],
+    })
+    report["mean_diff_sd"] = (report["mean_approx"] - report["mean_nuts"]) / report["sd_nuts"]
+    overlap = (np.minimum(report["hdi_high_nuts"], report["hdi_high_approx"])
+               - np.maximum(report["hdi_low_nuts"], report["hdi_low_approx"])).clip(lower=0)
+    report["hdi_overlap"] = overlap / (report["hdi_high_nuts"] - report["hdi_low_nuts"])
+    report["same_sign"] = np.sign(report["mean_nuts"]) == np.sign(report["mean_approx"])
+    return report
+
+def hierarchical_specs(model_specs):
+    """線形回帰のモデルを、political_news_count の傾きがジャンルごとに変わる階層モデルに置き換える"""
+    return {key: (formula, model_name, 'hierarchical' if family == 'normal' else family)
+            for key, (formula, model_name, family) in model_specs.items()}
 
-def execute_bayesian_analysis():
+def summarize_group_slopes(traces, model_specs):
+    """階層モデルのジャンルごとの傾き (group_slope) の要約と、ジャンル間のばらつき tau"""
+    frames = []
+    for key, (trace, _) in traces.items():
+        if model_specs[key][2] not in HIERARCHICAL_FAMILIES:
+            continue
+        summary = summarize_posterior(trace, var_name="group_slope")
+        summary.insert(0, "model", model_specs[key][1])
+        frames.append(summary)
+        tau = summarize_posterior(trace, var_name="tau_group").iloc[0]
+        print(f"{model_specs[key][1]}: tau_group mean {tau['mean']:.4f}, "
+              f"95% HDI [{tau['hdi_95_low']:.4f}, {tau['hdi_95_high']:.4f}]")
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def load_standardized_data():
+    """データを読み込み、連続変数を標準化する"""
     # データ読み込み
     print("Loading data...")
     df = load_and_preprocess_data(INPUT_FILE)
     
     # 標準化
-    continuous_cols = ['political_news_count','actor_fame_log','budget_log']
-
-    df_std = standardize_data(df, continuous_cols)
+    df_std = standardize_data(df, CONTINUOUS_COLS)
     
     # 確認表示
     print("\nStandardized columns summary:")
-    print(df_std[[f'{c}_std' for c in continuous_cols if f'{c}_std' in df_std.columns]].describe().loc[['mean', 'std']])
+    print(df_std[[f'{c}_std' for c in CONTINUOUS_COLS if f'{c}_std' in df_std.columns]].describe().loc[['mean', 'std']])
+    return df_std
+
+def execute_backend_benchmark(backends=None, chains=None, cores=None):
+    """
+    サンプラーごとのコンパイル時間・サンプリング時間・ESS/秒を3モデルについて比較する
+    """
+    df_std = load_standardized_data()
+    print("\n========== Benchmark: Sampler Backends ==========")
+    summary_df, ess_df = benchmark_backends(
+        df_std, BASE_FORMULA_RHS, MODEL_SPECS, backends=backends,
+        draws=SAMPLER_SETTINGS["draws"], tune=SAMPLER_SETTINGS["tune"],
+        chains=chains or SAMPLER_SETTINGS["chains"], cores=cores,
+        prior_beta_sigma=SAMPLER_SETTINGS["prior_beta_sigma"], prior_sigma=SAMPLER_SETTINGS["prior_sigma"])
+
+    print("\n--- ESS per second by parameter ---")
+    print(ess_df.to_string(index=False))
+    print("\n--- Summary ---")
+    print(summary_df.to_string(index=False))
+    return summary_df, ess_df
+
+def execute_run_log_report(last=None):
+    """
+    実行ログから、モデルごとに実行を並べた比較表（所要時間の内訳・発散・ステップサイズ・木の深さ・ESS/秒）を表示する
+    last: モデルごとに直近の last 回だけを表示する
+    """
+    table = compare_runs(load_run_log(), last=last)
+    if not len(table):
+        print("No runs logged yet.")
+        return table
+    columns = ["started_at", "backend", "chains", "draws", "design_s", "compile_s", "init_s", "tune_s", "draw_s",
+               "sampling_s", "divergences", "step_size", "tree_depth_mean", "min_ess_per_sec",
+               "median_ess_per_sec", "ess_ratio_prev"]
+    for model, runs in table.groupby("model", sort=False):
+        print(f"\n--- {model} ---")
+        print(runs[columns].round(3).to_string(index=False))
+    print(f"\nFull log: {RUN_LOG_CSV}")
+    plot_run_comparison(table)
+    return table
+
+def execute_hierarchical_benchmark(chains=None, cores=None):
+    """
+    ジャンル階層モデルの非中心化と中心化の表し方で、発散の数と ESS/秒を Revenue Log / ROI Log について比較する
+    """
+    df_std = load_standardized_data()
+    design_cache = DesignMatrixCache(df_std, [BASE_FORMULA_RHS])
+    summaries = []
+    for key, (formula, model_name, family) in MODEL_SPECS.items():
+        if family != 'normal':
+            continue
+        print(f"\n========== Benchmark: Hierarchical Parameterization ({model_name}) ==========")
+        y, X = design_cache.dmatrices(formula)
+        summary_df, _ = benchmark_parameterizations(
+            X, y, draws=SAMPLER_SETTINGS["draws"], tune=SAMPLER_SETTINGS["tune"],
+            chains=chains or SAMPLER_SETTINGS["chains"], cores=cores,
+            prior_beta_sigma=SAMPLER_SETTINGS["prior_beta_sigma"], prior_sigma=SAMPLER_SETTINGS["prior_sigma"])
+        summary_df.insert(0, "Model", model_name)
+        summaries.append(summary_df)
+        rates = summary_df.set_index("Parameterization")["Min_ESS_per_sec"]
+        print(f"Min ESS/s: non-centered {rates['noncentered']:.1f}, centered {rates['centered']:.1f} "
+              f"({rates['noncentered'] / rates['centered']:.2f}x)")
+
+    summary_df = pd.concat(summaries, ignore_index=True)
+    print("\n--- Summary ---")
+    print(summary_df.round(2).to_string(index=False))
+    return summary_df
 
-    # 共通の右辺（説明変数）
-    base_formula_rhs = """
-        political_news_count + actor_fame_log + budget_log_std + belongs_to_collection + 
-        Genre_Drama + Genre_Comedy + Genre_Thriller + 
-        Genre_Action + Genre_Adventure + Genre_Romance + Genre_Crime + 
-        Genre_Science_Fiction + Genre_Family + Genre_Horror
+def execute_predictive_check(holdout_frac=0.2, seed=0, chains=None, cores=None, force_resample=False,
+                             trace_storage=None, hierarchical=False):
     """
+    3モデルを学習用の行で推定し、予測の良さを評価する
+    学習用の行: PSIS-LOO の ELPD（と Pareto k）
+    検証用の行 (holdout_frac): 対数予測密度、線形回帰の予測区間のカバー率、ロジスティック回帰の較正
+    予測は保存済みの事後サンプルから行列積で計算する（PyMC のモデルは使わない）
+    """
+    df_std = load_standardized_data()
+    model_specs = hierarchical_specs(MODEL_SPECS) if hierarchical else MODEL_SPECS
+    rng = np.random.default_rng(seed)
+    is_test = np.zeros(len(df_std), dtype=bool)
+    is_test[rng.permutation(len(df_std))[:int(round(holdout_frac * len(df_std)))]] = True
+    df_train = df_std[~is_test]
+    design_cache = DesignMatrixCache(df_std, [BASE_FORMULA_RHS])
+    train_cache = DesignMatrixCache(df_train, [BASE_FORMULA_RHS])
+    print(f"\n========== Predictive Checks: {len(df_train)} training / {is_test.sum()} held-out movies ==========")
+
+    store = FitResultStore()
+    rows, coverage_tables, calibration_tables = [], [], {}
+    try:
+        for key, (formula, model_name, family) in model_specs.items():
+            trace, _ = run_bayesian_model(df_train, formula, model_name, family, design_cache=train_cache,
+                                          store=store, force_resample=force_resample, chains=chains,
+                                          cores=cores, trace_storage=trace_storage)
+            y_train, X_train = train_cache.dmatrices(formula)
+            y, X = design_cache.dmatrices(formula)
+            test_rows = is_test[df_std.index.get_indexer(X.index)]
+            y_test, X_test = y[test_rows], X[test_rows]
+
+            start = time.perf_counter()
+            loo, _ = psis_loo(trace, X_train, y_train, family)
+            holdout = holdout_elpd(trace, X_test, y_test, family)
+            row = {"model": model_name, **loo,
+                   "holdout_elpd": holdout["elpd"], "holdout_se": holdout["se"],
+                   "holdout_elpd_per_row": holdout["elpd_per_row"]}
+            if family == 'bernoulli':
+                table, scores = calibration(trace, X_test, y_test)
+                calibration_tables[model_name] = table
+                row.update(scores)
+                print(f"\n--- Calibration on held-out movies: {model_name} ---")
+                print(table.round(3).to_string(index=False))
+            else:
+                table = interval_coverage(trace, X_test, y_test, random_seed=seed)
+                table.insert(0, "model", model_name)
+                coverage_tables.append(table)
+                row["coverage_95"] = float(table.loc[table["prob"] == 0.95, "coverage"].iloc[0])
+            row["eval_time"] = time.perf_counter() - start
+            rows.append(row)
+    finally:
+        store.close()
+
+    result_df = pd.DataFrame(rows)
+    print("\n--- PSIS-LOO (training) / ELPD and calibration (held-out) ---")
+    print(result_df.round(3).to_string(index=False))
+    if coverage_tables:
+        coverage_df = pd.concat(coverage_tables, ignore_index=True)
+        print(f"\n--- Predictive interval coverage on held-out movies (nominal {list(INTERVAL_PROBS)}) ---")
+        print(coverage_df.round(3).to_string(index=False))
+        coverage_df.to_csv(os.path.join(RESULT_DIR, "bayes_interval_coverage.csv"), index=False)
+    result_path = os.path.join(RESULT_DIR, "bayes_predictive_checks.csv")
+    result_df.to_csv(result_path, index=False)
+    print(f"Saved predictive checks to: {result_path}")
+    if calibration_tables:
+        plot_calibration(calibration_tables)
+    return result_df
+
+def execute_threshold_sensitivity(quantiles=None, pooled=False, chains=None, cores=None, compare_separate=False,
+                                  target_term='political_news_count'):
+    """
+    High ROI の閾値（ROI の分位点）を変えたロジスティック回帰の感度分析を1つのモデルで推定する
+    pooled: True の場合は閾値間で係数を部分プーリングする
+    compare_separate: True の場合は閾値ごとに別々にサンプリングした場合と所要時間・事後平均を比較する
+    """
+    df_std = load_standardized_data()
+    chains = chains or SAMPLER_SETTINGS["chains"]
+    print(f"\n========== Bayesian Threshold Sensitivity: {target_term} ==========")
+    res_df, trace, elapsed = run_bayesian_threshold_sensitivity(
+        df_std, BASE_FORMULA_RHS, target_term, quantiles=quantiles, pooled=pooled,
+        draws=SAMPLER_SETTINGS["draws"], tune=SAMPLER_SETTINGS["tune"], chains=chains, cores=cores,
+        prior_beta_sigma=SAMPLER_SETTINGS["prior_beta_sigma"])
+    print(res_df.round(4).to_string(index=False))
+    print(f"Single model ({len(res_df)} thresholds{', pooled' if pooled else ''}): {elapsed:.1f}s, "
+          f"divergences: {int(trace.sample_stats['diverging'].sum())}")
+    for warning in convergence_warnings(trace, res_df):
+        print(f"Warning: {warning}")
+    plot_bayesian_threshold_sensitivity(res_df, target_term)
+
+    if compare_separate:
+        # 閾値ごとのモデル（同じ形状なのでコンパイルは1回、サンプリングは閾値の数だけ）
+        y, X = DesignMatrixCache(df_std, [BASE_FORMULA_RHS]).dmatrices(MODEL_SPECS["logit"][0])
+        _, labels = threshold_labels(df_std['roi'].to_numpy(), res_df['quantile'])
+        labels = labels[df_std.index.get_indexer(X.index)]
+        start = time.perf_counter()
+        separate = MODEL_FACTORY.sample_targets(
+            X, {q: labels[:, j] for j, q in enumerate(res_df['quantile'])}, family='bernoulli',
+            draws=SAMPLER_SETTINGS["draws"], tune=SAMPLER_SETTINGS["tune"], chains=chains, cores=cores,
+            progressbar=False)
+        separate_time = time.perf_counter() - start
+        res_df["mean_separate"] = [float(separate[q].posterior["beta"].sel(beta_dim_0=target_term).mean())
+                                   for q in res_df['quantile']]
+        print(res_df[["quantile", "mean", "mean_separate"]].round(4).to_string(index=False))
+        print(f"Separate models: {separate_time:.1f}s, Single model: {elapsed:.1f}s, "
+              f"Speedup: {separate_time / elapsed:.2f}x")
+    return res_df, trace
+
+def execute_bayesian_analysis(force_resample=False, parallel=False, chains=None, cores_per_model=None,
+                              core_budget=None, benchmark=False, backend='pymc', approx=None,
+                              approx_report=False, adaptive=None, trace_storage=None, hierarchical=False,
+                              model_specs=None):
+    """
+    3モデルのベイズ推定を行う
+    force_resample: True の場合は保存済みのトレースを使わずに再サンプリングする
+    parallel: True の場合は3モデルを同時に推定する
+    chains, cores_per_model, core_budget: run_bayesian_models を参照
+    benchmark: True の場合は保存済みのトレースを使わずに逐次実行と並列実行の所要時間を比較する
+    backend: サンプラー (run_bayesian_model を参照)
+    approx: 'laplace' / 'advi' を指定すると NUTS の代わりに近似推論で推定する（以降の分析・プロットは同じ）
+    approx_report: True の場合は近似推論と NUTS の事後平均・HDI の比較を表示する
+    adaptive: 適応的サンプリングの設定 (run_bayesian_model を参照)
+    trace_storage: トレースの保存方法 (run_bayesian_model を参照)
+    hierarchical: True の場合は Revenue Log と ROI Log をジャンルごとに傾きが変わる階層モデルで推定し、
+                  ジャンルごとの political_news_count の傾きを保存する
+    model_specs: 推定するモデル {キー: (フォーミュラ, モデル名, family)}（省略時は MODEL_SPECS）
+                 revenue / roi / logit のキーは必須で、他のキーのモデルは要約に加わる
+    """
+    df_std = load_standardized_data()
+    base_formula_rhs = BASE_FORMULA_RHS
     
     interaction_term = 'political_news_count'
 
+    # 3モデルは互いに独立なので、まとめて（必要なら同時に）推定する
+    model_specs = model_specs or MODEL_SPECS
+    if hierarchical:
+        model_specs = hierarchical_specs(model_specs)
+    sampler_kwargs = {"chains": chains, "cores_per_model": cores_per_model, "core_budget": core_budget,
+                      "backend": backend, "adaptive": adaptive, "trace_storage": trace_storage}
+    if approx_report and approx is None:
+        approx = 'laplace'
+    # 近似推論はベンチマーク・適応的サンプリングの経路では使われないので、黙って無視せずに止める
+    if approx is not None and benchmark:
+        raise ValueError("Approximate inference cannot be combined with the benchmark.")
+    if approx is not None and adaptive is not None:
+        raise ValueError("Approximate inference cannot be combined with adaptive sampling.")
+    if benchmark:
+        print("\n========== Benchmark: Sequential vs Parallel ==========")
+        _, sequential_time = run_bayesian_models(df_std, base_formula_rhs, model_specs, parallel=False,
+                                                 force_resample=True, **sampler_kwargs)
+        traces, parallel_time = run_bayesian_models(df_std, base_formula_rhs, model_specs, parallel=True,
+                                                    force_resample=True, **sampler_kwargs)
+        print(f"\nSequential: {sequential_time:.1f}s, Parallel: {parallel_time:.1f}s, "
+              f"Speedup: {sequential_time / parallel_time:.2f}x")
+    else:
+        traces, wall_time = run_bayesian_models(df_std, base_formula_rhs, model_specs, parallel=parallel,
+                                                force_resample=force_resample, approx=approx,
+                                                **sampler_kwargs)
+        print(f"Total {'approximation' if approx else 'sampling'} wall time: {wall_time:.1f}s")
+
+    if approx_report and approx is not None:
+        # 比較対象の NUTS の結果（保存済みのトレースがあれば再利用する）
+        nuts_traces, nuts_time = run_bayesian_models(df_std, base_formula_rhs, model_specs, parallel=parallel,
+                                                     force_resample=force_resample, **sampler_kwargs)
+        print(f"\n========== Approximation ({approx}) vs NUTS ==========")
+        print(f"Wall time: {approx} {wall_time:.1f}s, NUTS {nuts_time:.1f}s")
+        for key, (_, model_name, _) in model_specs.items():
+            report = compare_approximation(traces[key][0], nuts_traces[key][0])
+            print(f"\n--- {model_name} ---")
+            print(report.round(4).to_string())
+            print(f"Max |mean diff| / sd_nuts: {report['mean_diff_sd'].abs().max():.3f}, "
+                  f"min HDI overlap: {report['hdi_overlap'].min():.1%}, "
+                  f"sign agreement: {report['same_sign'].mean():.0%}")
+
+    # 全モデル・全係数の要約を一度に計算する
+    summary_df = summarize_models({model_specs[key][1]: (traces[key][0], model_specs[key][2]) for key in traces})
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    summary_path = os.path.join(RESULT_DIR, "bayes_posterior_summary.csv")
+    summary_df.to_csv(summary_path, index=False)
+    print(f"Saved posterior summary to: {summary_path}")
+    summaries = {name: group for name, group in summary_df.groupby("model", sort=False)}
+
+    if hierarchical:
+        print(f"\n========== Genre-specific slopes of {VARYING_SLOPE} ==========")
+        slopes_df = summarize_group_slopes(traces, model_specs)
+        print(slopes_df[["model", "term", "mean", "hdi_95_low", "hdi_95_high", "p_positive"]]
+              .round(4).to_string(index=False))
+        slopes_path = os.path.join(RESULT_DIR, "bayes_genre_slopes.csv")
+        slopes_df.to_csv(slopes_path, index=False)
+        print(f"Saved genre slopes to: {slopes_path}")
+
     # ==========================================
     # Model 1: Revenue Log (Linear Regression)
     # ==========================================
-    formula_rev = f"revenue_log ~ {base_formula_rhs}"
-    trace_rev, cols_rev = run_bayesian_model(df_std, formula_rev, "Revenue Log", family='normal')
+    trace_rev, cols_rev = traces["revenue"]
     
     # 要約表示
     print(az.summary(trace_rev, var_names=["beta"], kind="stats"))
     
     # 分析と保存
-    analyze_interaction(trace_rev, interaction_term, "Revenue Log")
+    analyze_interaction(trace_rev, interaction_term, "Revenue Log", summary=summaries["Revenue Log"])
     save_arviz_plot(az.plot_trace, trace_rev, "bayes_trace_revenue.png", var_names=["beta", "sigma"])
     save_arviz_plot(az.plot_posterior, trace_rev, "bayes_post_revenue_interact.png", 
                     var_names=["beta"], coords={"beta_dim_0": interaction_term}, ref_val=0)
@@ -137,10 +618,9 @@ def execute_bayesian_analysis():
     # ==========================================
     # Model 2: ROI Log (Linear Regression)
     # ==========================================
-    formula_roi = f"roi_log ~ {base_formula_rhs}"
-    trace_roi, cols_roi = run_bayesian_model(df_std, formula_roi, "ROI Log", family='normal')
+    trace_roi, cols_roi = traces["roi"]
     
-    analyze_interaction(trace_roi, interaction_term, "ROI Log")
+    analyze_interaction(trace_roi, interaction_term, "ROI Log", summary=summaries["ROI Log"])
     save_arviz_plot(az.plot_trace, trace_roi, "bayes_trace_roi.png", var_names=["beta", "sigma"])
     save_arviz_plot(az.plot_posterior, trace_roi, "bayes_post_roi_interact.png", 
                     var_names=["beta"], coords={"beta_dim_0": interaction_term}, ref_val=0)
@@ -148,13 +628,118 @@ def execute_bayesian_analysis():
     # ==========================================
     # Model 3: ROI dummy (Logistic Regression)
     # ==========================================
-    formula_logit = f"is_high_roi ~ {base_formula_rhs}"
-    trace_logit, cols_logit = run_bayesian_model(df_std, formula_logit, "High ROI (Logistic)", family='bernoulli')
+    trace_logit, cols_logit = traces["logit"]
     
-    analyze_interaction(trace_logit, interaction_term, "High ROI (Logistic)", family='bernoulli')
+    analyze_interaction(trace_logit, interaction_term, "High ROI (Logistic)", family='bernoulli',
+                        summary=summaries["High ROI (Logistic)"])
     save_arviz_plot(az.plot_trace, trace_logit, "bayes_trace_logit.png", var_names=["beta"])
     save_arviz_plot(az.plot_posterior, trace_logit, "bayes_post_logit_interact.png", 
                     var_names=["beta"], coords={"beta_dim_0": interaction_term}, ref_val=0)
 
 if __name__ == "__main__":
-    execute_bayesian_analysis()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ベイズ推定による政治ニュース効果の分析")
+    parser.add_argument("--force-resample", action="store_true",
+                        help="保存済みのトレースを使わずに再サンプリングする")
+    parser.add_argument("--parallel", action="store_true",
+                        help="3モデルを別プロセスで同時に推定する")
+    parser.add_argument("--chains", type=int, default=None,
+                        help="モデルごとのチェーン数")
+    parser.add_argument("--cores-per-model", type=int, default=None,
+                        help="モデルごとのコア数")
+    parser.add_argument("--core-budget", type=int, default=None,
+                        help="全体で使うコア数の上限（省略時は全コア）")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="逐次実行と並列実行の所要時間を比較する（保存済みのトレースは使わない）")
+    parser.add_argument("--backend", choices=list(SAMPLER_BACKENDS), default="pymc",
+                        help="サンプラー（pymc 以外は対応するパッケージが必要）")
+    parser.add_argument("--benchmark-backends", nargs="*", default=None, metavar="BACKEND",
+                        help="サンプラーごとのコンパイル時間・サンプリング時間・ESS/秒を比較する（省略時は利用可能な全サンプラー）")
+    parser.add_argument("--approx", choices=APPROX_METHODS, default=None,
+                        help="NUTS の代わりに近似推論 (Laplace / ADVI) で速報を出す")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="draws を固定せず、収束目標を満たす（または時間切れになる）までサンプリングする")
+    parser.add_argument("--target-rhat", type=float, default=ADAPTIVE_TARGETS["rhat"],
+                        help="適応的サンプリングの R-hat の上限")
+    parser.add_argument("--target-ess-bulk", type=float, default=ADAPTIVE_TARGETS["ess_bulk"],
+                        help="適応的サンプリングの bulk ESS の下限")
+    parser.add_argument("--target-ess-tail", type=float, default=ADAPTIVE_TARGETS["ess_tail"],
+                        help="適応的サンプリングの tail ESS の下限")
+    parser.add_argument("--monitor", nargs="+", default=None, metavar="TERM",
+                        help="収束を判定する係数（省略時は全係数）")
+    parser.add_argument("--adaptive-chunk", type=int, default=500,
+                        help="1回に追加する draws 数")
+    parser.add_argument("--max-draws", type=int, default=10000,
+                        help="チェーンあたりの draws の上限")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="モデルごとのサンプリング時間の上限（秒）")
+    parser.add_argument("--hierarchical", action="store_true",
+                        help="Revenue Log と ROI Log を political_news_count の傾きがジャンルごとに変わる階層モデルで推定する")
+    parser.add_argument("--benchmark-hierarchical", action="store_true",
+                        help="階層モデルの非中心化と中心化の表し方の発散の数・ESS/秒を比較する")
+    parser.add_argument("--predictive-check", action="store_true",
+                        help="学習用の行で推定し、PSIS-LOO と検証用の行の予測（ELPD・カバー率・較正）を評価する")
+    parser.add_argument("--holdout-frac", type=float, default=0.2,
+                        help="予測の評価に使う検証用の行の割合")
+    parser.add_argument("--trace-format", choices=list(TRACE_FORMATS), default="netcdf",
+                        help="トレースの保存形式")
+    parser.add_argument("--float32-traces", action="store_true",
+                        help="トレースの draws を float32 で保存する（ディスク使用量が約半分）")
+    parser.add_argument("--storage-report", action="store_true",
+                        help="保存済みのトレースのディスク上のサイズと圧縮率を表示する")
+    parser.add_argument("--threshold-sensitivity", action="store_true",
+                        help="High ROI の閾値を変えたロジスティック回帰の感度分析を1つのモデルで推定する")
+    parser.add_argument("--quantiles", nargs="+", type=float, default=None,
+                        help="感度分析の ROI の分位点")
+    parser.add_argument("--pooled-thresholds", action="store_true",
+                        help="感度分析で閾値間の係数を部分プーリングする")
+    parser.add_argument("--compare-separate", action="store_true",
+                        help="感度分析を閾値ごとに別々に推定した場合と比較する")
+    parser.add_argument("--run-log", action="store_true",
+                        help="実行ログ（所要時間の内訳・サンプラーの統計・ESS/秒）を実行ごとに比較する")
+    parser.add_argument("--run-log-last", type=int, default=None,
+                        help="--run-log でモデルごとに表示する直近の実行の数")
+    parser.add_argument("--approx-report", action="store_true",
+                        help="近似推論と NUTS の事後平均・95%%HDI を比較する（--approx 省略時は laplace）")
+    args = parser.parse_args()
+    if (args.approx or args.approx_report) and args.benchmark:
+        parser.error("--approx / --approx-report cannot be combined with --benchmark")
+    if (args.approx or args.approx_report) and args.adaptive:
+        parser.error("--approx / --approx-report cannot be combined with --adaptive")
+    adaptive = None
+    if args.adaptive:
+        adaptive = {"targets": {"rhat": args.target_rhat, "ess_bulk": args.target_ess_bulk,
+                                "ess_tail": args.target_ess_tail},
+                    "terms": args.monitor, "chunk": args.adaptive_chunk, "max_draws": args.max_draws,
+                    "time_budget": args.time_budget}
+    trace_storage = {"fmt": args.trace_format, "float32": args.float32_traces}
+    if args.storage_report:
+        store = FitResultStore()
+        try:
+            report = storage_report(store)
+        finally:
+            store.close()
+        print(report.round(2).to_string(index=False))
+        if len(report):
+            print(f"Total: {report['disk_kb'].sum() / 1024:.1f} MB on disk, "
+                  f"{report['memory_kb'].sum() / 1024:.1f} MB in memory")
+    elif args.run_log:
+        execute_run_log_report(last=args.run_log_last)
+    elif args.threshold_sensitivity:
+        execute_threshold_sensitivity(quantiles=args.quantiles, pooled=args.pooled_thresholds,
+                                      chains=args.chains, cores=args.cores_per_model,
+                                      compare_separate=args.compare_separate)
+    elif args.predictive_check:
+        execute_predictive_check(holdout_frac=args.holdout_frac, chains=args.chains, cores=args.cores_per_model,
+                                 force_resample=args.force_resample, trace_storage=trace_storage,
+                                 hierarchical=args.hierarchical)
+    elif args.benchmark_hierarchical:
+        execute_hierarchical_benchmark(chains=args.chains, cores=args.cores_per_model)
+    elif args.benchmark_backends is not None:
+        execute_backend_benchmark(backends=args.benchmark_backends or available_backends(),
+                                  chains=args.chains, cores=args.cores_per_model)
+    else:
+        execute_bayesian_analysis(force_resample=args.force_resample, parallel=args.parallel, chains=args.chains,
+                                  cores_per_model=args.cores_per_model, core_budget=args.core_budget,
+                                  benchmark=args.benchmark, backend=args.backend, approx=args.approx,
+                                  approx_report=args.approx_report, adaptive=adaptive, trace_storage=trace_storage,
+                                  hierarchical=args.hierarchical)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from fast_logit import fit_logit_batch, weighted_gram, batched_solve
+
+# 列の尺度をそろえた正規方程式の条件数がこれを超えるリサンプルは特異とみなす
+# (モデルグリッドの元データでは最大でも 1e9 程度)
+MAX_GRAM_CONDITION = 1e12
+
+
+def resample_counts(rng, n, n_boot):
+    """
+    再標本化のインデックス行列 (n_boot×n) を一括で生成し、
+    各リサンプルでの行ごとの出現回数に変換する
+    """
+    idx = rng.integers(0, n, size=(n_boot, n))
+    offset = (np.arange(n_boot) * n)[:, None]
+    return np.bincount((idx + offset).ravel(), minlength=n_boot * n).reshape(n_boot, n)
+
+
+def _ols_draws(X, y, counts):
+    """
+    出現回数を重みとした正規方程式を全リサンプルについて一括で解く
+    まれなダミーや交互作用がリサンプルに現れず、正規方程式が特異・悪条件になったリサンプルは欠損とする
+    (最小ノルム解ではその係数が 0 になり、区間が 0 に引き寄せられる)
+    """
+    W = counts.T.astype(float)
+    G = weighted_gram(X, W)
+    b = W.T @ (X * y[:, None])
+
+    # 列の尺度をそろえた正規方程式の条件数で判定する（元の尺度では交互作用項の大きさで条件数が膨らむ）
+    scale = np.sqrt(np.diagonal(G, axis1=1, axis2=2))
+    valid = np.all(scale > 0, axis=1)
+    scale = np.where(scale > 0, scale, 1)
+    valid[valid] = np.linalg.cond(G[valid] / (scale[valid, :, None] * scale[valid, None, :])) < MAX_GRAM_CONDITION
+
+    draws = np.full(b.shape, np.nan)
+    if valid.any():
+        draws[valid] = batched_solve(G[valid], b[valid])
+    return draws
+
+
+def _logit_draws(X, y, counts, start_params):
+    """出現回数を度数重みとして、全リサンプルのロジットを一括IRLSで解く"""
+    n_boot = counts.shape[0]
+    Y = np.broadcast_to(y[:, None], (len(y), n_boot))
+    fit = fit_logit_batch(X, Y, start_params=start_params, freq_weights=counts.T)
+    draws = fit["params"].to_numpy().T.copy()
+    # 収束しなかったリサンプル（完全分離など）は欠損とする
+    draws[~fit["converged"].to_numpy()] = np.nan
+    return draws
+
+
+def _bootstrap_worker(args):
+    X, y, family, n_boot, seed_seq, chunk_size, start_params = args
+    rng = np.random.default_rng(seed_seq)
+    draws = []
+    for start in range(0, n_boot, chunk_size):
+        counts = resample_counts(rng, len(y), min(chunk_size, n_boot - start))
+        if family == 'ols':
+            draws.append(_ols_draws(X, y, counts))
+        else:
+            draws.append(_logit_draws(X, y, counts, start_params))
+    return np.vstack(draws)
+
+
+def fit_point_estimate(X, y, family='ols'):
+    """元データでの係数推定値"""
+    if family == 'ols':
+        return np.linalg.lstsq(X, y, rcond=None)[0]
+    return fit_logit_batch(X, y)["params"].to_numpy()[:, 0]
+
+
+def jackknife_params(X, y, params, family='ols'):
+    """
+    1行ずつ除いた推定値 (n×p) を再推定なしで計算する（BCa の加速度用）
+    OLS は厳密な公式、ロジットはニュートン法1ステップの近似
+    """
+    if family == 'ols':
+        weights = np.ones(len(y))
+        resid = y - X @ params
+    else:
+        mu = 1 / (1 + np.exp(-(X @ params)))
+        weights = mu * (1 - mu)
+        resid = y - mu
+    H_inv = np.linalg.inv(X.T @ (X * weights[:, None]))
+    XH = X @ H_inv
+    leverage = weights * np.einsum('ij,ij->i', XH, X)
+    return params - XH * (resid / (1 - leverage))[:, None]
+
+
+def bootstrap_params(X, y, family='ols', n_boot=2000, n_jobs=1, seed=0, chunk_size=250, executor=None):
+    """
+    係数のブートストラップ分布 (n_boot×p) を計算する
+    リサンプルはワーカーごとに独立した乱数ストリーム (SeedSequence.spawn) で生成する
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).ravel()
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    estimate = fit_point_estimate(X, y, family)
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    sizes = [len(block) for block in np.array_split(np.arange(n_boot), n_jobs) if len(block) > 0]
+    tasks = [(X, y, family, size, child, chunk_size, estimate)
+             for size, child in zip(sizes, seed_seq.spawn(len(sizes)))]
+
+    if len(tasks) == 1:
+        draws = [_bootstrap_worker(tasks[0])]
+    elif executor is not None:
+        draws = list(executor.map(_bootstrap_worker, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            draws = list(pool.map(_bootstrap_worker, tasks))
+
+    return estimate, np.vstack(draws)
+
+
+def bootstrap_intervals(estimate, draws, jackknife, names, alpha=0.05):
+    """
+    パーセンタイル区間と BCa 区間を全係数についてまとめて計算する
+    """
+    tails = np.array([alpha / 2, 1 - alpha / 2])
+    percentile = np.nanquantile(draws, tails, axis=0)
+
+    # バイアス補正 z0 と加速度 a
+    n_valid = np.sum(~np.isnan(draws), axis=0)
+    prop_below = np.sum(draws < estimate, axis=0) / n_valid
+    prop_below = np.clip(prop_below, 1 / n_valid, 1 - 1 / n_valid)
+    z0 = stats.norm.ppf(prop_below)
+
+    dev = jackknife.mean(axis=0) - jackknife
+    accel = np.sum(dev ** 3, axis=0) / (6 * np.sum(dev ** 2, axis=0) ** 1.5)
+
+    z_tails = stats.norm.ppf(tails)[:, None]
+    adjusted = stats.norm.cdf(z0 + (z0 + z_tails) / (1 - accel * (z0 + z_tails)))
+    bca = np.array([np.nanquantile(draws[:, j], adjusted[:, j]) for j in range(draws.shape[1])]).T
+
+    return pd.DataFrame({
+        'estimate': estimate,
+        'boot_se': np.nanstd(draws, axis=0, ddof=1),
+        'pct_lower': percentile[0],
+        'pct_upper': percentile[1],
+        'bca_lower': bca[0],
+        'bca_upper': bca[1],
+        'n_valid': n_valid,
+    }, index=pd.Index(names, name='term'))
+
+
+def bootstrap_model_grid(design_cache, formula_bases, targets, term_filter='political_news_count',
+                         n_boot=2000, n_jobs=1, seed=0, alpha=0.05):
+    """
+    モデルグリッド全体について、term_filter を含む項のブートストラップ信頼区間を計算する
+    targets: main.py と同じ形式 ({"name", "dep_var", "type"} の辞書のリスト)
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    model_seeds = iter(np.random.SeedSequence(seed).spawn(len(formula_bases) * len(targets)))
+
+    tables = []
+    executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    try:
+        for base_name, base_formula in formula_bases.items():
+            for target in targets:
+                family = 'ols' if target['type'] == "ols" else 'logit'
+                y, X = design_cache.dmatrices(f"{target['dep_var']} ~ {base_formula}")
+                names = list(X.columns)
+                X, y = X.to_numpy(), y.to_numpy().ravel()
+
+                estimate, draws = bootstrap_params(X, y, family, n_boot=n_boot, n_jobs=n_jobs,
+                                                   seed=next(model_seeds), executor=executor)
+                jackknife = jackknife_params(X, y, estimate, family)
+                table = bootstrap_intervals(estimate, draws, jackknife, names, alpha=alpha)
+
+                table = table[table.index.str.contains(term_filter, regex=False)].reset_index()
+                table.insert(0, 'Target', target['name'])
+                table.insert(0, 'Base', base_name)
+                tables.append(table)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+from fast_logit import fit_logit_batch
+from gram_ols import solve_gram
+
+
+def kfold_assignments(n, n_splits=5, n_repeats=10, seed=0):
+    """繰り返し k-fold の割り当て (n_repeats×n, 値は fold 番号) を作成する"""
+    rng = np.random.default_rng(seed)
+    base = np.arange(n) % n_splits
+    return np.stack([rng.permutation(base) for _ in range(n_repeats)])
+
+
+def _cv_repeat(args):
+    """
+    1回分の k-fold を全スペック・全目的変数について評価する
+
+    OLS: fold ごとのグラム行列を一度だけ計算し、学習側は「全体 - 検証 fold」で求める。
+         検証誤差も fold のグラム行列から計算するので、スペックごとに行を走査しない。
+    ロジット: 学習 fold を度数重みとして、全 fold を一括IRLSで推定する。
+    """
+    X, Y_ols, Y_logit, spec_columns, folds, n_splits = args
+    fold_masks = np.stack([folds == f for f in range(n_splits)], axis=1)
+    n_test = fold_masks.sum(axis=0)
+
+    # fold ごとの十分統計量 (全スペック共通)
+    G_fold = np.stack([X[m].T @ X[m] for m in fold_masks.T])
+    Gy_fold = np.stack([X[m].T @ Y_ols[m] for m in fold_masks.T])
+    yy_fold = np.stack([np.einsum('ij,ij->j', Y_ols[m], Y_ols[m]) for m in fold_masks.T])
+    G_total, Gy_total = G_fold.sum(axis=0), Gy_fold.sum(axis=0)
+
+    rows = []
+    for spec_name, idx in spec_columns.items():
+        ix = np.ix_(idx, idx)
+        for f in range(n_splits):
+            params, _ = solve_gram(G_total[ix] - G_fold[f][ix], Gy_total[idx] - Gy_fold[f][idx])
+            # 検証 fold の残差平方和 = y'y - 2b'X'y + b'X'Xb
+            sse = (yy_fold[f] - 2 * np.einsum('ij,ij->j', params, Gy_fold[f][idx])
+                   + np.einsum('ij,ij->j', params, G_fold[f][ix] @ params))
+            rmse = np.sqrt(np.maximum(sse, 0) / n_test[f])
+            for t in range(Y_ols.shape[1]):
+                rows.append((spec_name, 'ols', f, t, rmse[t]))
+
+        X_s = X[:, idx]
+        for t in range(Y_logit.shape[1]):
+            Y = np.broadcast_to(Y_logit[:, [t]], (len(X_s), n_splits))
+            fit = fit_logit_batch(X_s, Y, freq_weights=~fold_masks)
+            mu = np.clip(expit(X_s @ fit["params"].to_numpy()), 1e-15, 1 - 1e-15)
+            loss = -(Y * np.log(mu) + (1 - Y) * np.log(1 - mu))
+            log_loss = (loss * fold_masks).sum(axis=0) / n_test
+            for f in range(n_splits):
+                rows.append((spec_name, 'logit', f, t, log_loss[f]))
+    return rows
+
+
+def cross_validate_grid(design_cache, formula_bases, targets, n_splits=5, n_repeats=10, n_jobs=1, seed=0):
+    """
+    繰り返し k-fold 交差検証でモデルグリッド全体の予測性能を評価する
+    OLS は RMSE、ロジットは log-loss (いずれも小さいほど良い)。
+    各繰り返し（fold 分割）は並列に実行できる
+    """
+    ols_targets = [t for t in targets if t['type'] == "ols"]
+    logit_targets = [t for t in targets if t['type'] != "ols"]
+
+    # 全スペックの列の和集合で、欠損のない行だけを使う
+    responses = {t['dep_var']: design_cache.response(t['dep_var'])[0][:, 0] for t in targets}
+    X = design_cache.X
+    mask = ~np.isnan(X).any(axis=1)
+    for values in responses.values():
+        mask &= ~np.isnan(values)
+    X = np.ascontiguousarray(X[mask])
+    Y_ols = np.column_stack([responses[t['dep_var']][mask] for t in ols_targets] or [np.empty((len(X), 0))])
+    Y_logit = np.column_stack([responses[t['dep_var']][mask] for t in logit_targets] or [np.empty((len(X), 0))])
+    spec_columns = {name: design_cache.column_indices(rhs)[0] for name, rhs in formula_bases.items()}
+
+    folds = kfold_assignments(len(X), n_splits, n_repeats, seed)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    tasks = [(X, Y_ols, Y_logit, spec_columns, folds[r], n_splits) for r in range(n_repeats)]
+    if n_jobs == 1:
+        repeats = [_cv_repeat(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, n_repeats)) as executor:
+            repeats = list(executor.map(_cv_repeat, tasks))
+
+    results = []
+    for repeat, rows in enumerate(repeats):
+        for spec_name, kind, fold, t, score in rows:
+            if kind == 'ols':
+                results.append((spec_name, ols_targets[t]['name'], "RMSE", repeat, fold, score))
+            else:
+                results.append((spec_name, logit_targets[t]['name'], "LogLoss", repeat, fold, score))
+
+    cv_df = pd.DataFrame(results, columns=["Base", "Target", "CV_Metric", "repeat", "fold", "score"])
+    return (cv_df.groupby(["Base", "Target", "CV_Metric"], sort=False)["score"]
+            .agg(CV_Mean="mean", CV_SD="std").reset_index())
@@ -28,17 +28,39 @@ def extract_genre_names(x):
     except:
         return []
 
+def add_features(df):
+    """
+    映画ごとに計算できる説明変数の変換（公開前の新しい映画の予測にも同じ変換を使う）
+    news がない場合は political_news_count をそのまま使う
+    """
+    # --- ニュースの件数をカウント ---
+    if 'news' in df.columns:
+        df['political_news_count'] = df['news'].apply(count_news)
+
+    # --- 数値変換 ---
+    df['budget_log'] = np.log1p(df['budget'])
+
+    # --- 有名度(Fame)の処理 ---
+    # actor_fame が 0 の場合もあるので log1p を使用
+    df['actor_fame'] = pd.to_numeric(df['actor_fame'], errors='coerce').fillna(0)
+    df['actor_fame_log'] = np.log1p(df['actor_fame'])
+
+    # --- ジャンル処理 ---
+    df['genre_list'] = df['genres'].apply(extract_genre_names)
+
+    # コレクション
+    df["belongs_to_collection"] = df["belongs_to_collection"].notna().astype(int)
+    return df
+
 def load_and_preprocess_data(filepath):
     df = pd.read_csv(filepath)
+    df = add_features(df)
 
-    # --- ニュースの件数をカウント ---
-    df['political_news_count'] = df['news'].apply(count_news)
     upper_count = len(df[df['political_news_count']==100])
     upper_rate = (upper_count / len(df)) * 100 if len(df)>0 else 'error'
     print(f"取得上限に達した映画は{upper_count}件で、全体の{upper_rate:.2f}%です")
 
-    # --- 数値変換 ---
-    df['budget_log'] = np.log1p(df['budget'])
+    # --- 目的変数 ---
     df['revenue_log'] = np.log1p(df['revenue'])
     
     # ROI計算
@@ -48,13 +70,7 @@ def load_and_preprocess_data(filepath):
     # 中央値で高ROIフラグ
     df['is_high_roi'] = (df['roi'] > df['roi'].median()).astype(int)
 
-    # --- 有名度(Fame)の処理 ---
-    # actor_fame が 0 の場合もあるので log1p を使用
-    df['actor_fame'] = pd.to_numeric(df['actor_fame'], errors='coerce').fillna(0)
-    df['actor_fame_log'] = np.log1p(df['actor_fame'])
-
-    # --- ジャンル処理 ---
-    df['genre_list'] = df['genres'].apply(extract_genre_names)
+    # --- ジャンルのダミー変数 ---
     mlb = MultiLabelBinarizer()
     genre_dummies = mlb.fit_transform(df['genre_list'])
     genre_cols = [f"Genre_{c.replace(' ', '_')}" for c in mlb.classes_]
@@ -64,7 +80,8 @@ def load_and_preprocess_data(filepath):
     top_genres = genre_df.sum().sort_values(ascending=False).head(10).index
     df = pd.concat([df, genre_df[top_genres]], axis=1)
 
-    # コレクション
-    df["belongs_to_collection"] = df["belongs_to_collection"].notna().astype(int)
+    # 公開年（クラスター頑健標準誤差のグループに使う）
+    if 'release_date' in df.columns:
+        df['release_year'] = pd.to_datetime(df['release_date'], errors='coerce').dt.year
 
     return df
\ No newline at end of file
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import patsy
+
+
+class DesignMatrixCache:
+    """
+    複数のフォーミュラで共有するデザイン行列のキャッシュ
+
+    全フォーミュラの右辺に現れる項の和集合を一度だけ評価し、
+    列方向に連続した (Fortran順) NumPy 配列として保持する。
+    各モデルはこの行列から列を選択するだけで、patsy.dmatrices と同じ
+    列順・列名・欠損行の除外を再現する。
+    """
+
+    def __init__(self, df, formula_rhs_list, eval_env=0):
+        self.df = df
+        self._eval_env = patsy.EvalEnvironment.capture(eval_env, reference=1)
+
+        # 全フォーミュラの項の和集合（出現順を保持）
+        union_terms = []
+        for rhs in formula_rhs_list:
+            for term in self._rhs_terms(rhs):
+                if term not in union_terms:
+                    union_terms.append(term)
+
+        # 欠損行は落とさずに評価し、モデルごとに除外する
+        master = patsy.dmatrix(
+            patsy.ModelDesc([], union_terms), df,
+            eval_env=self._eval_env,
+            NA_action=patsy.NAAction(NA_types=[]),
+            return_type='matrix'
+        )
+        self.design_info = master.design_info
+        self.X = np.asfortranarray(master, dtype=float)
+        self.column_index = {name: i for i, name in enumerate(self.design_info.column_names)}
+
+        self._term_slices = dict(self.design_info.term_slices)
+        self._design_memo = {}
+        self._response_memo = {}
+
+    @staticmethod
+    def _rhs_terms(rhs):
+        return patsy.ModelDesc.from_formula(rhs).rhs_termlist
+
+    def column_indices(self, rhs):
+        """フォーミュラ右辺に対応するマスター行列の列番号と列名を返す"""
+        indices, names = [], []
+        for term in self._rhs_terms(rhs):
+            if term not in self._term_slices:
+                raise KeyError(f"Term '{term.name()}' is not in the design cache.")
+            sl = self._term_slices[term]
+            cols = list(range(sl.start, sl.stop))
+            indices.extend(cols)
+            if len(cols) == 1:
+                # 交互作用の因子の並び順はフォーミュラ側の表記に合わせる
+                names.append(term.name())
+            else:
+                names.extend(self.design_info.column_names[sl])
+        return np.asarray(indices, dtype=np.intp), names
+
+    def design(self, rhs):
+        """
+        右辺に対応するデザイン行列（欠損行を含む）を返す
+        列が連続していればコピーなしのビュー、そうでなければ一度だけ抽出してメモ化する
+        """
+        key = " ".join(rhs.split())
+        if key not in self._design_memo:
+            indices, names = self.column_indices(rhs)
+            if len(indices) > 0 and np.all(np.diff(indices) == 1):
+                X = self.X[:, indices[0]:indices[-1] + 1]
+            else:
+                X = np.take(self.X, indices, axis=1)
+                X = np.asfortranarray(X)
+            self._design_memo[key] = (X, names)
+        return self._design_memo[key]
+
+    def response(self, lhs):
+        """左辺（目的変数）を評価して返す（変数ごとにメモ化）"""
+        key = " ".join(lhs.split())
+        if key not in self._response_memo:
+            y = patsy.dmatrix(
+                patsy.ModelDesc([], patsy.ModelDesc.from_formula(f"{lhs} ~ 1").lhs_termlist),
+                self.df,
+                eval_env=self._eval_env,
+                NA_action=patsy.NAAction(NA_types=[]),
+                return_type='matrix'
+            )
+            self._response_memo[key] = (np.asarray(y, dtype=float), y.design_info.column_names)
+        return self._response_memo[key]
+
+    def dmatrices(self, formula, return_type='dataframe'):
+        """
+        patsy.dmatrices と同じ (y, X) を返す
+        欠損がある場合のみ行を抽出（コピー）する
+        """
+        lhs, rhs = formula.split('~', 1)
+        y, y_names = self.response(lhs)
+        X, x_names = self.design(rhs)
+
+        # patsy と同様に、いずれかの列が欠損している行を除外
+        mask = ~(np.isnan(X).any(axis=1) | np.isnan(y).any(axis=1))
+        index = self.df.index
+        if not mask.all():
+            y, X, index = y[mask], X[mask], index[mask]
+
+        if return_type == 'matrix':
+            return y, X
+        y_df = pd.DataFrame(y, columns=y_names, index=index, copy=False)
+        X_df = pd.DataFrame(X, columns=x_names, index=index, copy=False)
+        return y_df, X_df
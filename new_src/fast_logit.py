@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import expit
+
+
+def weighted_gram(X, W, row_chunk=65536):
+    """
+    目的変数ごとの X' diag(w_k) X (K×p×p) をまとめて計算する
+    各行の外積の上三角 (n×p(p+1)/2) を作り、重み行列との1回の行列積で全 K 本を求める
+    """
+    n, p = X.shape
+    K = W.shape[1]
+    iu, ju = np.triu_indices(p)
+    H_flat = np.zeros((K, len(iu)))
+    for start in range(0, n, row_chunk):
+        rows = slice(start, min(start + row_chunk, n))
+        Z = X[rows, iu] * X[rows, ju]
+        H_flat += W[rows].T @ Z
+    H = np.empty((K, p, p))
+    H[:, iu, ju] = H_flat
+    H[:, ju, iu] = H_flat
+    return H
+
+
+def batched_solve(H, g):
+    """K 本の連立方程式をまとめて解く（特異な場合は個別に最小二乗解）"""
+    try:
+        return np.linalg.solve(H, g[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        return np.stack([np.linalg.lstsq(H[k], g[k], rcond=None)[0] for k in range(H.shape[0])])
+
+
+def fit_logit_batch(X, Y, start_params=None, maxiter=35, tol=1e-8, freq_weights=None):
+    """
+    共通のデザイン行列 X に対して、K 本の2値目的変数 Y (n×K) のロジットを
+    ニュートン法 (IRLS) でまとめて推定する
+
+    重みの更新と連立方程式の求解を全目的変数について一括で行い、
+    収束した目的変数はそれ以降の更新から外す。
+    freq_weights: 行ごとの度数重み (n または n×K)。ブートストラップの再標本化回数などに使う
+    戻り値は目的変数ごとの係数・標準誤差・対数尤度・AIC/BIC・観測数（度数重みの合計）の辞書
+    (statsmodels の Logit と同じ定義)
+    """
+    x_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    if isinstance(Y, pd.DataFrame):
+        y_names = list(Y.columns)
+    elif isinstance(Y, pd.Series) and Y.name is not None:
+        y_names = [Y.name]
+    else:
+        y_names = None
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    if y_names is None:
+        y_names = [f"y{k}" for k in range(Y.shape[1])]
+    n, p = X.shape
+    K = Y.shape[1]
+    if freq_weights is None:
+        freq_weights = np.ones(1)
+    freq_weights = np.asarray(freq_weights, dtype=float)
+    if freq_weights.ndim == 1 and len(freq_weights) == n:
+        freq_weights = freq_weights[:, None]
+    freq_weights = np.broadcast_to(freq_weights, (n, K))
+
+    params = np.zeros((K, p)) if start_params is None else np.array(np.broadcast_to(start_params, (K, p)), dtype=float)
+    converged = np.zeros(K, dtype=bool)
+    n_iter = np.zeros(K, dtype=int)
+
+    for _ in range(maxiter):
+        active = np.flatnonzero(~converged)
+        if len(active) == 0:
+            break
+        mu = expit(X @ params[active].T)
+        fw = freq_weights[:, active]
+        W = fw * mu * (1 - mu)
+        grad = (X.T @ (fw * (Y[:, active] - mu))).T
+        H = weighted_gram(X, W)
+
+        step = batched_solve(H, grad)
+        params[active] += step
+        n_iter[active] += 1
+        converged[active] = np.max(np.abs(step), axis=1) < tol
+
+    # 最終的な係数でのヘッセ行列から共分散を計算
+    eta = X @ params.T
+    mu = expit(eta)
+    H = weighted_gram(X, freq_weights * mu * (1 - mu))
+    try:
+        cov = np.linalg.inv(H)
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(H)
+    bse = np.sqrt(np.abs(np.diagonal(cov, axis1=1, axis2=2)))
+
+    # log(1 + exp(eta)) を安定に計算
+    llf = np.sum(freq_weights * (Y * eta - np.logaddexp(0, eta)), axis=0)
+    nobs = freq_weights.sum(axis=0)
+    y_mean = np.clip((freq_weights * Y).sum(axis=0) / nobs, 1e-12, 1 - 1e-12)
+    llnull = nobs * (y_mean * np.log(y_mean) + (1 - y_mean) * np.log(1 - y_mean))
+
+    zvalues = params / bse
+    pvalues = 2 * stats.norm.sf(np.abs(zvalues))
+
+    def frame(values):
+        return pd.DataFrame(values.T, index=x_names, columns=y_names)
+
+    def series(values):
+        return pd.Series(values, index=y_names)
+
+    return {
+        "params": frame(params),
+        "bse": frame(bse),
+        "zvalues": frame(zvalues),
+        "pvalues": frame(pvalues),
+        "cov_params": cov,
+        "llf": series(llf),
+        "llnull": series(llnull),
+        "prsquared": series(1 - llf / llnull),
+        "aic": series(-2 * llf + 2 * p),
+        "bic": series(-2 * llf + np.log(nobs) * p),
+        "converged": series(converged),
+        "n_iter": series(n_iter),
+        "nobs": series(nobs),
+    }
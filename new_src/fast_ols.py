@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from scipy import stats
+from statsmodels.regression.linear_model import OLSResults, RegressionResultsWrapper
+
+
+def _constant_columns(X):
+    """定数列（切片）の有無を判定する"""
+    return (np.ptp(X, axis=0) == 0) & (X[0] != 0)
+
+
+def fit_ols_multi(X, Y):
+    """
+    同じデザイン行列 X を共有する複数の目的変数 Y (n×K) を、
+    一度の QR 分解でまとめて推定する
+
+    戻り値は目的変数ごとの係数・標準誤差・R²・対数尤度・AIC/BIC をまとめた辞書
+    (statsmodels の OLS と同じ定義)
+    """
+    x_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    y_names = list(Y.columns) if isinstance(Y, pd.DataFrame) else [f"y{k}" for k in range(np.shape(Y)[1])]
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n, p = X.shape
+
+    # X を一度だけ分解し、全目的変数を同時に解く
+    Q, R = np.linalg.qr(X)
+    diag_R = np.abs(np.diag(R))
+    if diag_R.min() <= diag_R.max() * max(n, p) * np.finfo(float).eps:
+        raise np.linalg.LinAlgError("Design matrix is rank deficient.")
+
+    params = np.linalg.solve(R, Q.T @ Y)
+    R_inv = np.linalg.solve(R, np.eye(p))
+    normalized_cov = R_inv @ R_inv.T
+
+    resid = Y - X @ params
+    ssr = np.einsum('ij,ij->j', resid, resid)
+
+    k_constant = int(_constant_columns(X).any())
+    if k_constant:
+        centered = Y - Y.mean(axis=0)
+        tss = np.einsum('ij,ij->j', centered, centered)
+    else:
+        tss = np.einsum('ij,ij->j', Y, Y)
+
+    return ols_statistics(params, normalized_cov, ssr, tss, n, k_constant, x_names, y_names)
+
+
+def ols_statistics(params, normalized_cov, ssr, tss, nobs, k_constant, x_names, y_names):
+    """
+    係数・(X'X)^-1・残差平方和から statsmodels の OLS と同じ定義の統計量を計算する
+    params は p×K (目的変数ごとに1列)
+    """
+    p = params.shape[0]
+    df_model = p - k_constant
+    df_resid = nobs - p
+    scale = ssr / df_resid
+
+    rsquared = 1 - ssr / tss
+    rsquared_adj = 1 - (nobs - k_constant) / df_resid * (1 - rsquared)
+
+    llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+    k_params = df_model + k_constant
+    aic = -2 * llf + 2 * k_params
+    bic = -2 * llf + np.log(nobs) * k_params
+
+    bse = np.sqrt(np.outer(np.diag(normalized_cov), scale))
+    tvalues = params / bse
+    pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid)
+
+    def frame(values):
+        return pd.DataFrame(values, index=x_names, columns=y_names)
+
+    def series(values):
+        return pd.Series(values, index=y_names)
+
+    return {
+        "params": frame(params),
+        "bse": frame(bse),
+        "tvalues": frame(tvalues),
+        "pvalues": frame(pvalues),
+        "normalized_cov_params": normalized_cov,
+        "scale": series(scale),
+        "ssr": series(ssr),
+        "rsquared": series(rsquared),
+        "rsquared_adj": series(rsquared_adj),
+        "llf": series(llf),
+        "aic": series(aic),
+        "bic": series(bic),
+        "nobs": nobs,
+        "df_model": df_model,
+        "df_resid": df_resid,
+    }
+
+
+def to_ols_results(y, X, fit, target=0):
+    """
+    fit_ols_multi の結果から statsmodels の OLS 結果オブジェクトを組み立てる
+    再推定はせず、summary() などは通常の sm.OLS(...).fit() と同じように使える
+    """
+    model = sm.OLS(y, X)
+    params = fit["params"].iloc[:, target].values
+
+    # 分解済みの情報を渡して、ランク計算のやり直しを避ける
+    model.rank = fit["df_model"] + int(model.k_constant > 0)
+    model.df_model = float(fit["df_model"])
+    model.df_resid = float(fit["df_resid"])
+    model.normalized_cov_params = fit["normalized_cov_params"]
+
+    results = OLSResults(model, params, normalized_cov_params=fit["normalized_cov_params"])
+    return RegressionResultsWrapper(results)
+
+
+def fit_ols_targets(design_cache, dep_vars, rhs):
+    """
+    同じ右辺を持つ複数の目的変数のOLSをまとめて推定する
+    欠損などで使用する行が目的変数ごとに異なる場合や、ランク落ちの場合は個別に推定する
+    """
+    designs = [design_cache.dmatrices(f"{dep} ~ {rhs}") for dep in dep_vars]
+    _, X = designs[0]
+
+    if all(X_k.index.equals(X.index) for _, X_k in designs):
+        Y = pd.concat([y for y, _ in designs], axis=1)
+        try:
+            fit = fit_ols_multi(X, Y)
+            return {dep: to_ols_results(y, X, fit, k) for k, (dep, (y, _)) in enumerate(zip(dep_vars, designs))}
+        except np.linalg.LinAlgError:
+            pass
+
+    return {dep: sm.OLS(y, X_k).fit() for dep, (y, X_k) in zip(dep_vars, designs)}
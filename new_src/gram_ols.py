@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from scipy import linalg
+
+from fast_ols import ols_statistics
+
+
+def solve_gram(XtX, XtY):
+    """
+    正規方程式 X'X b = X'Y を解き、係数と (X'X)^-1 を返す
+    列のスケールを揃えてからコレスキー分解する（X'X の条件数を改善）
+    """
+    d = 1 / np.sqrt(np.diag(XtX))
+    factor = linalg.cho_factor(XtX * np.outer(d, d))
+    params = d[:, None] * linalg.cho_solve(factor, XtY * d[:, None])
+    normalized_cov = np.outer(d, d) * linalg.cho_solve(factor, np.eye(len(d)))
+    return params, normalized_cov
+
+
+class GramOLS:
+    """
+    十分統計量 (X'X, X'y, y'y) によるOLSエンジン
+
+    全列を含むデザイン行列から X'X, X'Y, Y'Y を一度だけ計算しておけば、
+    任意の列部分集合のモデルは p×p の小さな連立方程式を解くだけで推定できる
+    (1スペックあたり O(p³)、行数 n には依存しない)
+    """
+
+    def __init__(self, X, Y, column_names=None, target_names=None):
+        if column_names is None:
+            column_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+        if target_names is None:
+            target_names = list(Y.columns) if isinstance(Y, pd.DataFrame) else [f"y{k}" for k in range(np.shape(Y)[1])]
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            Y = Y[:, None]
+
+        self.column_names = list(column_names)
+        self.target_names = list(target_names)
+        self.column_index = {name: i for i, name in enumerate(self.column_names)}
+        self.target_index = {name: k for k, name in enumerate(self.target_names)}
+
+        self.nobs = X.shape[0]
+        self.XtX = X.T @ X
+        self.XtY = X.T @ Y
+        self.YtY = np.einsum('ij,ij->j', Y, Y)
+        self.Y_sum = Y.sum(axis=0)
+        self.first_row = X[0].copy()
+        self.is_constant = (np.ptp(X, axis=0) == 0) & (X[0] != 0)
+
+    def update(self, X, Y):
+        """
+        新しい行 (X, Y) の十分統計量を加算する（欠損のある行は除外）
+        計算量は追加する行数に比例し、既存の行を読み直す必要はない
+        """
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            Y = Y[:, None]
+        if X.shape[1] != len(self.column_names) or Y.shape[1] != len(self.target_names):
+            raise ValueError("Shape of the new rows does not match the stored statistics.")
+        mask = ~(np.isnan(X).any(axis=1) | np.isnan(Y).any(axis=1))
+        if not mask.all():
+            X, Y = X[mask], Y[mask]
+
+        self.nobs += X.shape[0]
+        self.XtX += X.T @ X
+        self.XtY += X.T @ Y
+        self.YtY += np.einsum('ij,ij->j', Y, Y)
+        self.Y_sum += Y.sum(axis=0)
+        self.is_constant &= (X == self.first_row).all(axis=0)
+
+    def save(self, path):
+        """十分統計量を npz 形式で保存する"""
+        np.savez(path, XtX=self.XtX, XtY=self.XtY, YtY=self.YtY, Y_sum=self.Y_sum,
+                 nobs=self.nobs, first_row=self.first_row, is_constant=self.is_constant,
+                 column_names=np.array(self.column_names), target_names=np.array(self.target_names))
+
+    @classmethod
+    def load(cls, path):
+        """save で保存した十分統計量から復元する（元データは不要）"""
+        with np.load(path) as data:
+            engine = cls.__new__(cls)
+            engine.column_names = [str(c) for c in data["column_names"]]
+            engine.target_names = [str(t) for t in data["target_names"]]
+            engine.column_index = {name: i for i, name in enumerate(engine.column_names)}
+            engine.target_index = {name: k for k, name in enumerate(engine.target_names)}
+            engine.nobs = int(data["nobs"])
+            for key in ("XtX", "XtY", "YtY", "Y_sum", "first_row", "is_constant"):
+                setattr(engine, key, data[key].copy())
+        return engine
+
+    @classmethod
+    def from_design_cache(cls, design_cache, dep_vars):
+        """
+        DesignMatrixCache のマスター行列（全スペックの列の和集合）から構築する
+        欠損のある行は全列・全目的変数について一括で除外する
+        """
+        Y = np.column_stack([design_cache.response(dep)[0] for dep in dep_vars])
+        X = design_cache.X
+        mask = ~(np.isnan(X).any(axis=1) | np.isnan(Y).any(axis=1))
+        if not mask.all():
+            X, Y = X[mask], Y[mask]
+        engine = cls(X, Y, design_cache.design_info.column_names, dep_vars)
+        engine.design_cache = design_cache
+        return engine
+
+    def _indices(self, columns):
+        return np.asarray([self.column_index[c] if isinstance(c, str) else c for c in columns], dtype=np.intp)
+
+    def fit(self, columns, targets=None):
+        """
+        列の部分集合 columns（列名または列番号）で全目的変数（または targets）を推定する
+        戻り値は fast_ols.fit_ols_multi と同じ形式の辞書
+        """
+        idx = self._indices(columns)
+        t_idx = np.arange(len(self.target_names)) if targets is None else np.asarray(
+            [self.target_index[t] for t in targets], dtype=np.intp)
+
+        XtX = self.XtX[np.ix_(idx, idx)]
+        XtY = self.XtY[np.ix_(idx, t_idx)]
+
+        params, normalized_cov = solve_gram(XtX, XtY)
+
+        # RSS = y'y - b'X'y
+        ssr = self.YtY[t_idx] - np.einsum('ij,ij->j', params, XtY)
+
+        n = self.nobs
+        k_constant = int(self.is_constant[idx].any())
+        if k_constant:
+            tss = self.YtY[t_idx] - self.Y_sum[t_idx] ** 2 / n
+        else:
+            tss = self.YtY[t_idx]
+
+        x_names = [self.column_names[i] for i in idx]
+        y_names = [self.target_names[k] for k in t_idx]
+        return ols_statistics(params, normalized_cov, ssr, tss, n, k_constant, x_names, y_names)
+
+    def fit_formula(self, rhs, targets=None):
+        """フォーミュラ右辺で指定したスペックを推定する (from_design_cache で構築した場合)"""
+        indices, names = self.design_cache.column_indices(rhs)
+        fit = self.fit(indices, targets)
+        for key in ("params", "bse", "tvalues", "pvalues"):
+            fit[key].index = names
+        return fit
+
+    def compare(self, formula_specs, targets=None):
+        """
+        複数スペックの AIC/BIC/R² を比較表にまとめる
+        formula_specs: {スペック名: 右辺} の辞書
+        """
+        rows = []
+        for base_name, rhs in formula_specs.items():
+            fit = self.fit_formula(rhs, targets)
+            for target in fit["aic"].index:
+                rows.append({
+                    "Base": base_name,
+                    "Target": target,
+                    "AIC": fit["aic"][target],
+                    "BIC": fit["bic"][target],
+                    "R2": fit["rsquared"][target],
+                    "n_params": len(fit["params"]),
+                })
+        return pd.DataFrame(rows)
@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+
+from design_cache import DesignMatrixCache
+from fast_logit import fit_logit_batch
+from gram_ols import GramOLS
+
+# 交互作用の探索対象となる主効果
+SEARCH_FACTORS = ['political_news_count', 'actor_fame_log', 'budget_log', 'belongs_to_collection']
+
+
+def candidate_interactions(factors):
+    """2次以上の交互作用項を次数順に列挙する"""
+    return [combo for order in range(2, len(factors) + 1)
+            for combo in itertools.combinations(factors, order)]
+
+
+def _extend_cholesky(L, c, G, Gy, active, new):
+    """
+    コレスキー因子 L と c = L^-1 X_S'y に列 new を追加する (rank-k 更新)
+    X'X の再分解はせず、追加する列との内積だけを使う。共線的な場合は None を返す
+    """
+    G_an = G[np.ix_(active, new)]
+    G_nn = G[np.ix_(new, new)]
+    if len(active) > 0:
+        B = linalg.solve_triangular(L, G_an, lower=True)
+        S = G_nn - B.T @ B
+    else:
+        B = np.empty((0, len(new)))
+        S = G_nn.copy()
+
+    try:
+        M = linalg.cholesky(S, lower=True)
+    except linalg.LinAlgError:
+        return None
+    if np.min(np.abs(np.diag(M))) <= np.sqrt(np.finfo(float).eps) * np.sqrt(np.max(np.diag(G_nn))):
+        return None
+
+    c_new = linalg.solve_triangular(M, Gy[new] - B.T @ c, lower=True)
+
+    k, m = len(active), len(new)
+    L_new = np.zeros((k + m, k + m))
+    L_new[:k, :k] = L
+    L_new[k:, :k] = B.T
+    L_new[k:, k:] = M
+    return L_new, np.vstack([c, c_new]), c_new
+
+
+def search_interactions(engine, base_columns, interaction_columns, criterion='aic', top_k=None):
+    """
+    階層性を満たす交互作用の全組み合わせを探索し、情報量規準の順位表を返す
+
+    engine: 全列を含む GramOLS
+    base_columns: 常に含める列 (切片・主効果・ジャンル)
+    interaction_columns: {交互作用のタプル: 列名}
+    top_k: 指定すると、RSS の下限から上位 top_k に入り得ない部分木を枝刈りする
+    """
+    # スケールを揃えたグラム行列（RSS は列のスケールに依存しない）
+    d = 1 / np.sqrt(np.diag(engine.XtX))
+    G = engine.XtX * np.outer(d, d)
+    Gy = engine.XtY * d[:, None]
+    yty = engine.YtY
+    n = engine.nobs
+    penalty = 2.0 if criterion == 'aic' else np.log(n)
+    n_targets = len(engine.target_names)
+
+    terms = list(interaction_columns)
+    term_index = [engine.column_index[interaction_columns[t]] for t in terms]
+    base_index = [engine.column_index[c] for c in base_columns]
+
+    # 全列モデルの RSS は、どの部分モデルの RSS よりも小さい（枝刈りの下限）
+    full = engine.fit(base_index + term_index)
+    rss_floor = full["ssr"].values
+
+    def information_criterion(rss, k):
+        llf = -n / 2 * (np.log(2 * np.pi) + np.log(rss / n) + 1)
+        return -2 * llf + penalty * k, llf
+
+    # 目的変数ごとの上位 top_k (最大ヒープに -値 を保持)
+    best = [[] for _ in range(n_targets)]
+    records = []
+    stats = {"evaluated": 0, "pruned": 0}
+
+    def record(included, c, k):
+        rss = yty - np.einsum('ij,ij->j', c, c)
+        ic, llf = information_criterion(rss, k)
+        stats["evaluated"] += 1
+        for t in range(n_targets):
+            records.append((t, tuple(included), k, rss[t], llf[t], ic[t]))
+            if top_k is not None:
+                if len(best[t]) < top_k:
+                    heapq.heappush(best[t], -ic[t])
+                elif ic[t] < -best[t][0]:
+                    heapq.heapreplace(best[t], -ic[t])
+
+    def can_improve(k):
+        # 子孫モデルは k+1 列以上・RSS は全列モデル以上なので、規準値の下限が決まる
+        if top_k is None:
+            return True
+        bound, _ = information_criterion(rss_floor, k + 1)
+        return any(len(best[t]) < top_k or bound[t] < -best[t][0] for t in range(n_targets))
+
+    def walk(pos, L, c, active, included):
+        for i in range(pos, len(terms)):
+            term = terms[i]
+            # 階層性: 下位の交互作用がすべて含まれている場合のみ追加できる
+            subterms = candidate_interactions(term)[:-1]
+            if any(s not in included for s in subterms):
+                continue
+            if not can_improve(len(active)):
+                stats["pruned"] += 1
+                return
+            extended = _extend_cholesky(L, c, G, Gy, active, [term_index[i]])
+            if extended is None:
+                continue
+            L_new, c_new, _ = extended
+            new_included = included | {term}
+            record([t for t in terms if t in new_included], c_new, len(active) + 1)
+            walk(i + 1, L_new, c_new, active + [term_index[i]], new_included)
+
+    start = time.perf_counter()
+    root = _extend_cholesky(np.empty((0, 0)), np.empty((0, n_targets)), G, Gy, [], base_index)
+    if root is None:
+        raise np.linalg.LinAlgError("Base design matrix is rank deficient.")
+    L0, c0, _ = root
+    record([], c0, len(base_index))
+    walk(0, L0, c0, base_index, frozenset())
+    elapsed = time.perf_counter() - start
+
+    rows = []
+    for t, included, k, rss, llf, ic in records:
+        rows.append({
+            "Target": engine.target_names[t],
+            "Interactions": " + ".join(interaction_columns[term] for term in included) or "(none)",
+            "n_interactions": len(included),
+            "n_params": k,
+            "RSS": rss,
+            "LogLik": llf,
+            criterion.upper(): ic,
+        })
+
+    print(f"Evaluated {stats['evaluated']} models ({stats['pruned']} subtrees pruned) in {elapsed:.3f}s")
+    return rank_models(rows, criterion, top_k)
+
+
+def rank_models(rows, criterion, top_k=None):
+    """目的変数ごとに情報量規準で順位と最良モデルとの差 (Delta) を付ける"""
+    ranked = pd.DataFrame(rows)
+    ranked = ranked.sort_values(["Target", criterion.upper()]).reset_index(drop=True)
+    ranked["Rank"] = ranked.groupby("Target").cumcount() + 1
+    ranked["Delta"] = ranked[criterion.upper()] - ranked.groupby("Target")[criterion.upper()].transform("min")
+    if top_k is not None:
+        ranked = ranked[ranked["Rank"] <= top_k].reset_index(drop=True)
+    return ranked
+
+
+def hierarchical_subsets(terms):
+    """階層性を満たす交互作用の組み合わせを、search_interactions と同じ順に列挙する（空の組み合わせを含む）"""
+    def walk(pos, included):
+        for i in range(pos, len(terms)):
+            if any(s not in included for s in candidate_interactions(terms[i])[:-1]):
+                continue
+            new_included = included | {terms[i]}
+            yield [t for t in terms if t in new_included]
+            yield from walk(i + 1, new_included)
+
+    yield []
+    yield from walk(0, frozenset())
+
+
+def search_logit_interactions(design_cache, dep_var, base_columns, interaction_columns, criterion='aic', top_k=None):
+    """
+    2値の目的変数について、階層性を満たす交互作用の全組み合わせをロジット (IRLS) で推定し、情報量規準の順位表を返す
+    RSS のような単調な下限がないので枝刈りはせず、全モデルを推定する
+    (共線的な列を含むモデルと、収束しないモデル（完全分離など）は順位表から除く)
+    """
+    y = design_cache.response(dep_var)[0][:, 0]
+    X = design_cache.X
+    mask = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+    X, y = X[mask], y[mask]
+    n = len(y)
+    penalty = 2.0 if criterion == 'aic' else np.log(n)
+    base_index = [design_cache.column_index[c] for c in base_columns]
+
+    rows = []
+    stats = {"evaluated": 0, "skipped": 0}
+    start = time.perf_counter()
+    for included in hierarchical_subsets(list(interaction_columns)):
+        columns = base_index + [design_cache.column_index[interaction_columns[t]] for t in included]
+        X_sub = X[:, columns]
+        if np.linalg.matrix_rank(X_sub) < len(columns):
+            stats["skipped"] += 1
+            continue
+        fit = fit_logit_batch(X_sub, y)
+        if not fit["converged"].iloc[0]:
+            stats["skipped"] += 1
+            continue
+        stats["evaluated"] += 1
+        llf = fit["llf"].iloc[0]
+        rows.append({
+            "Target": dep_var,
+            "Interactions": " + ".join(interaction_columns[t] for t in included) or "(none)",
+            "n_interactions": len(included),
+            "n_params": len(columns),
+            "LogLik": llf,
+            criterion.upper(): -2 * llf + penalty * len(columns),
+        })
+    elapsed = time.perf_counter() - start
+
+    print(f"Evaluated {stats['evaluated']} logit models ({stats['skipped']} rank-deficient or non-converged) "
+          f"in {elapsed:.3f}s")
+    return rank_models(rows, criterion, top_k)
+
+
+def run_interaction_search(df, dep_vars, controls_rhs, factors=None, criterion='aic', top_k=None, logit_dep_vars=()):
+    """
+    データフレームから探索用のデザイン行列を構築して交互作用探索を実行する
+    dep_vars: OLS の目的変数（RSS の下限で枝刈りする）
+    logit_dep_vars: ロジットの目的変数（枝刈りせずに全モデルを IRLS で推定する）
+    controls_rhs: 常に含める統制変数（ジャンルなど）の右辺
+    """
+    if factors is None:
+        factors = SEARCH_FACTORS
+    full_rhs = f"{' * '.join(factors)} + {controls_rhs}"
+    design_cache = DesignMatrixCache(df, [full_rhs])
+
+    base_rhs = f"{' + '.join(factors)} + {controls_rhs}"
+    _, base_columns = design_cache.column_indices(base_rhs)
+    interaction_columns = {combo: ":".join(combo) for combo in candidate_interactions(factors)}
+
+    tables = []
+    if dep_vars:
+        engine = GramOLS.from_design_cache(design_cache, dep_vars)
+        tables.append(search_interactions(engine, base_columns, interaction_columns, criterion=criterion, top_k=top_k))
+    for dep_var in logit_dep_vars:
+        tables.append(search_logit_interactions(design_cache, dep_var, base_columns, interaction_columns,
+                                                criterion=criterion, top_k=top_k))
+    return pd.concat(tables, ignore_index=True)
@@ -1,100 +1,309 @@
+import argparse
+import numpy as np
 import pandas as pd
-import statsmodels.formula.api as smf
+import statsmodels.api as sm
+from bootstrap import bootstrap_model_grid
+from cross_validation import cross_validate_grid
 from data_processing import load_and_preprocess_data
+from design_cache import DesignMatrixCache
+from fast_logit import fit_logit_batch
+from fast_ols import fit_ols_targets
+from gram_ols import GramOLS
+from interaction_search import run_interaction_search
+from online_ols import run_online_update
+from permutation_test import permutation_test_grid
+from regression_diagnostics import diagnostics_grid
+from result_store import FitResultStore, make_key
 from visualization import (
     plot_distributions, plot_financials, 
-    plot_additional_exploratory_analysis, save_regression_summary,
+    plot_additional_exploratory_analysis, save_summary_text,
     analyze_threshold_sensitivity
 )
 
 INPUT_FILE = "new_data/movies_with_news.csv"
 
-def main():
-    print("Loading data...")
-    df = load_and_preprocess_data(INPUT_FILE)
-    
-    # データの可視化
-    print("\nGenerating visualizations...")
-    plot_distributions(df)
-    plot_financials(df)
-    plot_additional_exploratory_analysis(df)
-
-    # 比較したいモデル構成の定義
-    # ジャンル変数の共通部分
-    genres = "Genre_Drama + Genre_Comedy + Genre_Thriller + Genre_Action + Genre_Adventure + Genre_Romance + Genre_Crime + Genre_Science_Fiction + Genre_Family + Genre_Horror"
-    
-    formula_bases = {
-        # 基本モデル
-        "Base": f"political_news_count + actor_fame_log + budget_log + belongs_to_collection + {genres}",
-
-        # 非線形性モデル
-        "Quadratic": f"political_news_count + I(political_news_count**2) + actor_fame_log + budget_log + belongs_to_collection + {genres}",
-
-        # 交差項
-        "News_Fame": f"political_news_count * actor_fame_log + budget_log + belongs_to_collection + {genres}",
-        "News_Budget": f"political_news_count * budget_log + actor_fame_log + belongs_to_collection + {genres}",
-        "News_Collection": f"political_news_count * belongs_to_collection + actor_fame_log + budget_log + {genres}",
-
-        # 3元交差項
-        "News_Fame_Budget": f"political_news_count * actor_fame_log * budget_log + belongs_to_collection + {genres}",
-        "News_Fame_Collection": f"political_news_count * actor_fame_log * belongs_to_collection + budget_log + {genres}",
-        "News_Budget_Collection": f"political_news_count * budget_log * belongs_to_collection + actor_fame_log + {genres}",
-
-        # フルモデル
-        "Full_Complex": f"political_news_count * actor_fame_log * budget_log * belongs_to_collection + {genres}"
-    }
-
-    # 目的変数とモデルタイプの定義
-    targets = [
-        {"name": "Revenue", "dep_var": "revenue_log", "type": "ols"},
-        {"name": "ROI", "dep_var": "roi_log", "type": "ols"},
-        {"name": "High_ROI", "dep_var": "is_high_roi", "type": "logit"}
-    ]
+# 推定方法ごとの設定（保存キーの一部）
+ESTIMATOR_SETTINGS = {
+    "ols": {"cov_type": "nonrobust"},
+    "logit": {"method": "newton", "maxiter": 35},
+}
 
-    # モデル比較の実行
+# 比較したいモデル構成の定義
+# ジャンル変数の共通部分
+GENRES = "Genre_Drama + Genre_Comedy + Genre_Thriller + Genre_Action + Genre_Adventure + Genre_Romance + Genre_Crime + Genre_Science_Fiction + Genre_Family + Genre_Horror"
+
+FORMULA_BASES = {
+    # 基本モデル
+    "Base": f"political_news_count + actor_fame_log + budget_log + belongs_to_collection + {GENRES}",
+
+    # 非線形性モデル
+    "Quadratic": f"political_news_count + I(political_news_count**2) + actor_fame_log + budget_log + belongs_to_collection + {GENRES}",
+
+    # 交差項
+    "News_Fame": f"political_news_count * actor_fame_log + budget_log + belongs_to_collection + {GENRES}",
+    "News_Budget": f"political_news_count * budget_log + actor_fame_log + belongs_to_collection + {GENRES}",
+    "News_Collection": f"political_news_count * belongs_to_collection + actor_fame_log + budget_log + {GENRES}",
+
+    # 3元交差項
+    "News_Fame_Budget": f"political_news_count * actor_fame_log * budget_log + belongs_to_collection + {GENRES}",
+    "News_Fame_Collection": f"political_news_count * actor_fame_log * belongs_to_collection + budget_log + {GENRES}",
+    "News_Budget_Collection": f"political_news_count * budget_log * belongs_to_collection + actor_fame_log + {GENRES}",
+
+    # フルモデル
+    "Full_Complex": f"political_news_count * actor_fame_log * budget_log * belongs_to_collection + {GENRES}"
+}
+
+# 目的変数とモデルタイプの定義
+TARGETS = [
+    {"name": "Revenue", "dep_var": "revenue_log", "type": "ols"},
+    {"name": "ROI", "dep_var": "roi_log", "type": "ols"},
+    {"name": "High_ROI", "dep_var": "is_high_roi", "type": "logit"}
+]
+
+def run_full_comparison(design_cache, formula_bases, targets, store=None, force_refit=False):
+    """
+    全モデルを推定し、要約の表示・画像保存を行いながら AIC/BIC を比較表にまとめる
+    store: FitResultStore を渡すと、キーが一致する保存済みの結果を再利用する
+    force_refit: True の場合は保存済みの結果を使わずに再推定する
+    """
+    ols_dep_vars = [t['dep_var'] for t in targets if t['type'] == "ols"]
     comparison_results = []
 
     for base_name, base_formula in formula_bases.items():
         print(f"\n{'='*20} Testing Base: {base_name} {'='*20}")
+        ols_models = None
         
         for target in targets:
             full_formula = f"{target['dep_var']} ~ {base_formula}"
             print(f"\n--- Running {target['type'].upper()} for {target['name']} ---")
             
             try:
-                if target['type'] == "ols":
-                    model = smf.ols(full_formula, data=df).fit()
+                y, X = design_cache.dmatrices(full_formula)
+                settings = ESTIMATOR_SETTINGS[target['type']]
+                key = make_key(full_formula, target['type'], settings, X, y)
+                record = None if store is None or force_refit else store.get(key)
+
+                if record is not None:
+                    # 保存済みの結果を再利用
+                    print(f"(loaded stored result {key[:12]})")
+                    summary_text, aic, bic = record["summary_text"], record["aic"], record["bic"]
 
                 else:
-                    model = smf.logit(full_formula, data=df).fit()
+                    if target['type'] == "ols":
+                        # 右辺が共通のOLSは一度の分解でまとめて推定
+                        if ols_models is None:
+                            ols_models = fit_ols_targets(design_cache, ols_dep_vars, base_formula)
+                        model = ols_models[target['dep_var']]
+
+                    else:
+                        model = sm.Logit(y, X).fit(maxiter=settings["maxiter"])
+
+                    if store is not None:
+                        store.put_model(key, full_formula, target['type'], settings, model)
+                    summary_text, aic, bic = model.summary().as_text(), model.aic, model.bic
                 
                 # 結果の表示と保存
-                print(model.summary())
+                print(summary_text)
                 file_name = f"summary_{base_name}_{target['name']}.png"
-                save_regression_summary(model, file_name)
+                save_summary_text(summary_text, file_name)
                 
                 # 比較用メトリクスの保存
                 comparison_results.append({
                     "Base": base_name,
                     "Target": target['name'],
-                    "AIC": model.aic,
-                    "BIC": model.bic
+                    "AIC": aic,
+                    "BIC": bic
                 })
             
             except Exception as e:
                 print(f"Error fitting {base_name} for {target['name']}: {e}")
 
+    return pd.DataFrame(comparison_results)
+
+def run_fast_comparison(design_cache, formula_bases, targets):
+    """
+    要約の出力を省き、AIC/BIC の比較だけを行う
+    OLS は十分統計量 (X'X, X'y) から各スペックを小さな連立方程式で解き、
+    ロジットは共有デザイン行列に対して IRLS で推定する
+    """
+    ols_targets = [t for t in targets if t['type'] == "ols"]
+    engine = GramOLS.from_design_cache(design_cache, [t['dep_var'] for t in ols_targets])
+
+    comparison_results = []
+    for base_name, base_formula in formula_bases.items():
+        fit = engine.fit_formula(base_formula)
+        for target in targets:
+            try:
+                if target['type'] == "ols":
+                    aic, bic = fit["aic"][target['dep_var']], fit["bic"][target['dep_var']]
+                else:
+                    y, X = design_cache.dmatrices(f"{target['dep_var']} ~ {base_formula}")
+                    logit_fit = fit_logit_batch(X, y)
+                    if not logit_fit["converged"].iloc[0]:
+                        # 完全分離などで収束しない場合、AIC/BIC は比較に使えないので欠損にする
+                        print(f"Warning: IRLS did not converge for {base_name} / {target['name']} "
+                              f"({logit_fit['n_iter'].iloc[0]} iterations); AIC/BIC set to NaN.")
+                        aic, bic = np.nan, np.nan
+                    else:
+                        aic, bic = logit_fit["aic"].iloc[0], logit_fit["bic"].iloc[0]
+
+                comparison_results.append({
+                    "Base": base_name,
+                    "Target": target['name'],
+                    "AIC": aic,
+                    "BIC": bic
+                })
+
+            except Exception as e:
+                print(f"Error fitting {base_name} for {target['name']}: {e}")
+
+    return pd.DataFrame(comparison_results)
+
+def main(compare_only=False, search_criterion=None, top_k=None, n_boot=None, n_jobs=1, n_perm=None,
+         cv_folds=None, cv_repeats=10, force_refit=False, diagnostics=False, cluster_col='release_year',
+         online_batches=None, online_check=False):
+    """
+    compare_only: True の場合は可視化・要約画像・感度分析を省き、モデル比較だけを行う
+    search_criterion: 'aic' / 'bic' を指定すると、交互作用の全組み合わせを全目的変数について探索して順位表を表示する
+                      (OLS は十分統計量から、ロジットは IRLS で全モデルを推定する)
+    top_k: 探索時に目的変数ごとに残す上位モデル数（指定時は OLS の目的変数で枝刈りを行う）
+    n_boot: 指定するとモデルグリッド全体で political_news_count 関連項のブートストラップ信頼区間を計算する
+    n_perm: 指定すると political_news_count 関連項の置換検定 (Freedman–Lane) を行う
+    cv_folds: 指定すると cv_repeats 回繰り返しの k-fold 交差検証の結果を比較表に加える
+    n_jobs: ブートストラップ・置換検定・交差検証・閾値の感度分析で使うプロセス数
+    force_refit: True の場合は保存済みの推定結果を使わずに全モデルを再推定する
+    diagnostics: True の場合は頑健標準誤差 (HC0–HC3・クラスター頑健)・てこ比・Cook の距離・
+                 VIF・Breusch–Pagan 検定（OLS のみ）を比較表に加える
+    cluster_col: クラスター頑健標準誤差のグループに使う列
+    online_batches: 追加データの CSV のリスト。指定すると保存済みの十分統計量に加算して OLS を更新する
+    online_check: True の場合は逐次更新の結果を全データでの再推定と比較する
+    """
+    # 新しいバッチの十分統計量だけを加算して OLS を更新（保存済みの状態が有効なら初期データは読み込まない）
+    if online_batches is not None:
+        print("\n========== Online OLS Update ==========")
+        ols_dep_vars = [t['dep_var'] for t in TARGETS if t['type'] == "ols"]
+        online_df = run_online_update(INPUT_FILE, FORMULA_BASES, ols_dep_vars, online_batches, check=online_check)
+        print(online_df.sort_values(by=["Target", "AIC"]).to_string(index=False))
+        return
+
+    print("Loading data...")
+    df = load_and_preprocess_data(INPUT_FILE)
+    
+    # データの可視化
+    if not compare_only and search_criterion is None and n_boot is None and n_perm is None:
+        print("\nGenerating visualizations...")
+        plot_distributions(df)
+        plot_financials(df)
+        plot_additional_exploratory_analysis(df)
+
+    # 交互作用の全探索（階層性を満たす全モデルを情報量規準で順位付け）
+    if search_criterion is not None:
+        print(f"\n========== Interaction Search ({search_criterion.upper()}) ==========")
+        ranked_df = run_interaction_search(df, [t['dep_var'] for t in TARGETS if t['type'] == "ols"], GENRES,
+                                           criterion=search_criterion, top_k=top_k,
+                                           logit_dep_vars=[t['dep_var'] for t in TARGETS if t['type'] == "logit"])
+        pd.set_option('display.max_colwidth', None)
+        for target_name, group in ranked_df.groupby("Target"):
+            print(f"\n--- {target_name} ---")
+            print(group.head(20 if top_k is None else top_k).to_string(index=False))
+        return
+    
+    formula_bases = FORMULA_BASES
+    targets = TARGETS
+
+    # 全フォーミュラの列をまとめたデザイン行列を一度だけ構築
+    design_cache = DesignMatrixCache(df, formula_bases.values())
+
+    # ブートストラップ信頼区間（パーセンタイル・BCa）
+    if n_boot is not None:
+        print(f"\n========== Bootstrap Confidence Intervals (B={n_boot}) ==========")
+        bootstrap_df = bootstrap_model_grid(design_cache, formula_bases, targets,
+                                            n_boot=n_boot, n_jobs=n_jobs)
+        print(bootstrap_df.to_string(index=False))
+        return
+
+    # 置換検定（統制変数は固定し、縮小モデルの残差を置換）
+    if n_perm is not None:
+        print(f"\n========== Permutation Tests (Freedman-Lane, {n_perm} permutations) ==========")
+        ols_targets = {t['name']: t['dep_var'] for t in targets if t['type'] == "ols"}
+        permutation_df = permutation_test_grid(df, formula_bases, ols_targets, n_perm=n_perm, n_jobs=n_jobs)
+        print(permutation_df.to_string(index=False))
+        return
+
+    # モデル比較の実行
+    if compare_only:
+        comparison_df = run_fast_comparison(design_cache, formula_bases, targets)
+    else:
+        store = FitResultStore()
+        try:
+            comparison_df = run_full_comparison(design_cache, formula_bases, targets,
+                                                store=store, force_refit=force_refit)
+        finally:
+            store.close()
+
+    # 交差検証による予測性能（RMSE / log-loss）を比較表に追加
+    if cv_folds is not None:
+        print(f"\nRunning {cv_repeats}x{cv_folds}-fold cross-validation...")
+        cv_df = cross_validate_grid(design_cache, formula_bases, targets,
+                                    n_splits=cv_folds, n_repeats=cv_repeats, n_jobs=n_jobs)
+        comparison_df = comparison_df.merge(cv_df, on=["Base", "Target"], how="left")
+
+    # 頑健標準誤差と回帰診断を比較表に追加
+    if diagnostics:
+        clusters = df[cluster_col] if cluster_col in df.columns else None
+        if clusters is None:
+            print(f"Warning: column '{cluster_col}' not found; cluster-robust SEs are skipped.")
+        diagnostics_df, se_df = diagnostics_grid(design_cache, formula_bases, targets, clusters=clusters)
+        comparison_df = comparison_df.merge(diagnostics_df, on=["Base", "Target"], how="left")
+
+        print("\n========== Standard Errors of political_news_count Terms ==========")
+        print(se_df[se_df["term"].str.contains("political_news_count", regex=False)].to_string(index=False))
+
     # 比較結果の要約表示
     print("\n" + "="*30)
     print("MODEL COMPARISON SUMMARY")
     print("="*30)
-    comparison_df = pd.DataFrame(comparison_results)
     print(comparison_df.sort_values(by=["Target", "AIC"])) # AICが低い順に並び替え
 
+    if compare_only:
+        return
+
     # 感度分析（代表として1つのフォーミュラで実行）
     print('\n========== Sensitivity Analysis ==========')
     sensitivity_formula = f"dummy ~ {formula_bases['News_Budget']}"
-    analyze_threshold_sensitivity(df, sensitivity_formula, 'political_news_count:budget_log')
+    analyze_threshold_sensitivity(df, sensitivity_formula, 'political_news_count:budget_log', n_jobs=n_jobs)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="OLS・ロジスティック回帰によるモデル比較")
+    parser.add_argument("--compare-only", action="store_true",
+                        help="要約の出力を省き、十分統計量を使ってAIC/BICの比較だけを行う")
+    parser.add_argument("--search-interactions", choices=["aic", "bic"], default=None,
+                        help="交互作用の全組み合わせを探索し、指定した情報量規準で順位付けする")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="探索時に目的変数ごとに残す上位モデル数（指定時は OLS の目的変数で枝刈りを行う）")
+    parser.add_argument("--bootstrap", type=int, default=None, metavar="N",
+                        help="N回のブートストラップで political_news_count 関連項の信頼区間を計算する")
+    parser.add_argument("--permutation", type=int, default=None, metavar="N",
+                        help="N回の置換で political_news_count 関連項の置換検定 (Freedman-Lane) を行う")
+    parser.add_argument("--cv", type=int, default=None, metavar="K",
+                        help="K-fold 交差検証の RMSE / log-loss を比較表に加える")
+    parser.add_argument("--cv-repeats", type=int, default=10,
+                        help="交差検証の繰り返し回数")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="頑健標準誤差・てこ比・Cook の距離・VIF・Breusch-Pagan 検定 (OLS のみ) を比較表に加える")
+    parser.add_argument("--cluster", default="release_year",
+                        help="クラスター頑健標準誤差のグループに使う列")
+    parser.add_argument("--online-update", nargs="*", default=None, metavar="CSV",
+                        help="追加データの CSV を保存済みの十分統計量に加算して OLS を更新する")
+    parser.add_argument("--online-check", action="store_true",
+                        help="逐次更新の結果を全データでの再推定と比較する (--online-update と併用)")
+    parser.add_argument("--force-refit", action="store_true",
+                        help="保存済みの推定結果を使わずに全モデルを再推定する")
+    parser.add_argument("--n-jobs", type=int, default=1,
+                        help="並列に使うプロセス数 (0 で全コア)")
+    args = parser.parse_args()
+    main(compare_only=args.compare_only, search_criterion=args.search_interactions, top_k=args.top_k,
+         n_boot=args.bootstrap, n_jobs=args.n_jobs, n_perm=args.permutation,
+         cv_folds=args.cv, cv_repeats=args.cv_repeats, force_refit=args.force_refit,
+         diagnostics=args.diagnostics, cluster_col=args.cluster,
+         online_batches=args.online_update, online_check=args.online_check)
\ No newline at end of file
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+
+from data_processing import load_and_preprocess_data
+from design_cache import DesignMatrixCache
+from gram_ols import GramOLS
+from result_store import RESULT_DIR
+
+# 逐次更新用の十分統計量の保存先
+ONLINE_DIR = os.path.join(RESULT_DIR, "online")
+STATE_FILE = os.path.join(ONLINE_DIR, "gram_state.npz")
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def file_hash(filepath):
+    """
+    CSV の内容ハッシュ
+    追加バッチは二重に加算しないため、初期データは変更されたら十分統計量を作り直すために使う
+    """
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def file_signature(filepath):
+    """ファイルのサイズと更新時刻（内容を読まずに変更を検出する）"""
+    stat = os.stat(filepath)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def base_changed(meta, base_file, verify=False):
+    """
+    初期データが十分統計量を作ったときから変わったか
+    サイズと更新時刻が記録と同じならハッシュは計算しない (verify=True の場合は常に内容のハッシュで確かめる)
+    更新時刻だけが変わり内容が同じ場合は、記録を新しいサイズ・更新時刻に置き換える
+    """
+    signature = file_signature(base_file)
+    if not verify and meta.get("base_signature") == signature:
+        return False
+    if meta.get("base_hash") != file_hash(base_file):
+        return True
+    meta["base_signature"] = signature
+    return False
+
+
+def _formula_key(rhs):
+    return " ".join(rhs.split())
+
+
+class StoredColumns:
+    """
+    保存済みの状態に記録した、フォーミュラ右辺ごとの列番号と列名
+    GramOLS.fit_formula が使う DesignMatrixCache.column_indices の代わりになり、
+    初期データを読み込まずにスペックを推定できる
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def column_indices(self, rhs):
+        key = _formula_key(rhs)
+        if key not in self.columns:
+            raise KeyError(f"Formula '{key}' is not in the stored online statistics.")
+        entry = self.columns[key]
+        return np.asarray(entry["indices"], dtype=np.intp), entry["names"]
+
+
+def align_genre_columns(df, genre_columns):
+    """
+    バッチ単体で前処理すると上位ジャンルが変わり得るので、
+    初期データと同じ Genre_ 列を genre_list から作り直す
+    """
+    keys = df['genre_list'].apply(lambda genres: {g.replace(' ', '_') for g in genres})
+    for col in genre_columns:
+        df[col] = keys.apply(lambda names: int(col[len("Genre_"):] in names))
+    return df
+
+
+def save_online_state(engine, meta, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    engine.save(path)
+    with open(_meta_path(path), "w") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def load_online_state(path=STATE_FILE):
+    """保存済みの十分統計量とメタ情報を読み込む（なければ None）"""
+    if not (os.path.exists(path) and os.path.exists(_meta_path(path))):
+        return None, None
+    with open(_meta_path(path)) as f:
+        meta = json.load(f)
+    return GramOLS.load(path), meta
+
+
+def init_online_state(df, formula_bases, dep_vars, base_file=None):
+    """
+    初期データから全スペックの列の和集合の十分統計量を作る
+    フォーミュラごとの列番号・列名と初期データのハッシュ・サイズ・更新時刻もメタ情報に記録する
+    """
+    design_cache = DesignMatrixCache(df, formula_bases.values())
+    engine = GramOLS.from_design_cache(design_cache, dep_vars)
+    columns = {}
+    for rhs in formula_bases.values():
+        indices, names = design_cache.column_indices(rhs)
+        columns[_formula_key(rhs)] = {"indices": indices.tolist(), "names": names}
+    meta = {
+        "formulas": list(formula_bases.values()),
+        "column_names": list(engine.column_names),
+        "columns": columns,
+        "genre_columns": [c for c in df.columns if c.startswith("Genre_")],
+        "base_file": base_file,
+        "base_hash": None if base_file is None else file_hash(base_file),
+        "base_signature": None if base_file is None else file_signature(base_file),
+        "batches": [],
+    }
+    return engine, meta
+
+
+def state_mismatch(engine, meta, formula_bases, dep_vars, base_file, verify=False):
+    """
+    保存済みの状態を使えない理由（使える場合は None）
+    verify: True の場合は初期データの変更をサイズ・更新時刻ではなく内容のハッシュで確かめる
+    """
+    if engine is None:
+        return "no stored statistics"
+    if meta["formulas"] != list(formula_bases.values()):
+        return "formulas changed"
+    if engine.target_names != list(dep_vars):
+        return "targets changed"
+    if "columns" not in meta or meta.get("column_names") != engine.column_names:
+        return "stored statistics have no column metadata"
+    if base_changed(meta, base_file, verify):
+        return "base data changed"
+    return None
+
+
+def fold_in_batch(engine, meta, batch_df, formula_bases):
+    """
+    追加データの十分統計量だけを計算して加算する
+    (全スペックの列の和集合で1回だけ X'X を計算すれば、全スペックが更新される)
+    """
+    batch_df = align_genre_columns(batch_df, meta["genre_columns"])
+    design_cache = DesignMatrixCache(batch_df, formula_bases.values())
+    if design_cache.design_info.column_names != engine.column_names:
+        raise ValueError("Design columns of the new batch do not match the stored statistics.")
+
+    Y = np.column_stack([design_cache.response(dep)[0][:, 0] for dep in engine.target_names])
+    nobs_before = engine.nobs
+    engine.update(design_cache.X, Y)
+    return engine.nobs - nobs_before
+
+
+def online_summary(engine, formula_bases, term='political_news_count'):
+    """更新後の十分統計量から全スペックの AIC/BIC/R² と term の係数を計算する"""
+    rows = []
+    for base_name, rhs in formula_bases.items():
+        fit = engine.fit_formula(rhs)
+        for target in engine.target_names:
+            rows.append({
+                "Base": base_name,
+                "Target": target,
+                "nobs": engine.nobs,
+                "AIC": fit["aic"][target],
+                "BIC": fit["bic"][target],
+                "R2": fit["rsquared"][target],
+                f"coef_{term}": fit["params"][target].get(term, np.nan),
+                f"se_{term}": fit["bse"][target].get(term, np.nan),
+            })
+    return pd.DataFrame(rows)
+
+
+def check_against_refit(engine, full_df, formula_bases):
+    """
+    逐次更新した結果と、全データでの再推定 (statsmodels) の結果を比較する
+    """
+    rows = []
+    for base_name, rhs in formula_bases.items():
+        fit = engine.fit_formula(rhs)
+        for target in engine.target_names:
+            model = smf.ols(f"{target} ~ {rhs}", data=full_df).fit()
+            params = fit["params"][target].reindex(model.params.index)
+            rows.append({
+                "Base": base_name,
+                "Target": target,
+                "nobs_online": engine.nobs,
+                "nobs_refit": int(model.nobs),
+                "max_param_diff": np.max(np.abs(params - model.params)),
+                "AIC_diff": fit["aic"][target] - model.aic,
+                "BIC_diff": fit["bic"][target] - model.bic,
+                "match": (engine.nobs == int(model.nobs)
+                          and np.allclose(params, model.params, rtol=1e-6, atol=1e-8)
+                          and np.isclose(fit["aic"][target], model.aic, rtol=1e-9)),
+            })
+    return pd.DataFrame(rows)
+
+
+def load_batch(filepath, genre_columns):
+    return align_genre_columns(load_and_preprocess_data(filepath), genre_columns)
+
+
+def run_online_update(base_file, formula_bases, dep_vars, batch_files, check=False, path=STATE_FILE):
+    """
+    保存済みの十分統計量に新しいバッチを加算し、全スペックの推定結果を更新する
+    保存済みの状態が有効なら初期データ (base_file) は読み込まず、所要時間はバッチの大きさに比例する
+    (初期データの変更はサイズと更新時刻で判定し、それらが変わったときだけ内容のハッシュを計算する)
+    状態がない・フォーミュラや目的変数が変わった・初期データの内容が変わった場合は base_file から作り直す
+    check: True の場合は初期データの内容もハッシュで確かめ、初期データと全バッチを結合して再推定し、
+           結果が一致するか確認する
+    """
+    engine, meta = load_online_state(path)
+    df = None
+    reason = state_mismatch(engine, meta, formula_bases, dep_vars, base_file, verify=check)
+    if reason is not None:
+        if engine is not None and meta["batches"]:
+            print(f"Warning: discarding {len(meta['batches'])} folded batch(es) ({reason}).")
+        print(f"Initializing online statistics from the base data ({reason})...")
+        df = load_and_preprocess_data(base_file)
+        engine, meta = init_online_state(df, formula_bases, dep_vars, base_file)
+    # 保存済みの状態にはデザイン行列がないので、列の位置は記録した列番号から求める
+    engine.design_cache = StoredColumns(meta["columns"])
+
+    folded = {batch["hash"] for batch in meta["batches"]}
+    for filepath in batch_files:
+        digest = file_hash(filepath)
+        if digest in folded:
+            print(f"Skipping {filepath}: already folded in.")
+            continue
+        start = time.perf_counter()
+        n_added = fold_in_batch(engine, meta, load_and_preprocess_data(filepath), formula_bases)
+        print(f"Folded in {filepath}: {n_added} rows ({time.perf_counter() - start:.3f}s)")
+        meta["batches"].append({"path": os.path.abspath(filepath), "hash": digest, "rows": n_added})
+        folded.add(digest)
+
+    save_online_state(engine, meta, path)
+    summary_df = online_summary(engine, formula_bases)
+
+    if check:
+        print("\nChecking against a full refit...")
+        if df is None:
+            df = load_and_preprocess_data(base_file)
+        frames = [df] + [load_batch(batch["path"], meta["genre_columns"]) for batch in meta["batches"]]
+        check_df = check_against_refit(engine, pd.concat(frames, ignore_index=True), formula_bases)
+        print(check_df.to_string(index=False))
+        print(f"All specifications match: {bool(check_df['match'].all())}")
+
+    return summary_df
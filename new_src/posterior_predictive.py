@@ -0,0 +1,238 @@
+import os
+
+import arviz as az
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.special import expit, log_expit, logsumexp
+
+from posterior_summary import stack_draws
+from visualization import IMAGE_DIR
+
+# 1チャンクの (draws × 行) の要素数の上限（float64 で約 40MB）
+# 行数が多い予測（10^6 行など）も、この大きさの行列を順に処理するのでメモリに収まる
+PREDICT_CHUNK_ELEMENTS = 5_000_000
+
+# 予測区間のカバー率を調べる確率
+INTERVAL_PROBS = (0.5, 0.8, 0.9, 0.95)
+
+# ロジスティック回帰の較正（予測確率の分位点で区切るビンの数）
+CALIBRATION_BINS = 10
+
+# PSIS の Pareto k がこれを超える行は LOO の近似が信頼できない
+PARETO_K_THRESHOLD = 0.7
+
+
+def posterior_params(trace, columns, varying_slope="political_news_count", max_draws=None):
+    """
+    保存済みのトレースから予測に使う事後サンプルを (サンプル数, ...) の配列で取り出す
+    beta は columns（デザイン行列の列名）の順に並べ替える
+    階層モデルのトレースにはグループの偏差と、その列番号も含める
+    max_draws: 指定した場合は等間隔に間引いたサンプルを使う（予測の応答時間を抑えるため）
+    """
+    beta, names = stack_draws(trace, "beta")
+    keep = slice(None)
+    if max_draws is not None and len(beta) > max_draws:
+        keep = np.linspace(0, len(beta) - 1, max_draws).round().astype(int)
+    order = [names.index(str(c)) for c in columns]
+    params = {"beta": np.ascontiguousarray(beta[keep][:, order])}
+    if "sigma" in trace.posterior:
+        params["sigma"] = trace.posterior["sigma"].stack(sample=("chain", "draw")).values[keep]
+    if "group_offset" in trace.posterior:
+        offset, groups = stack_draws(trace, "group_offset")
+        columns = [str(c) for c in columns]
+        params["group_offset"] = offset[keep]
+        params["group_idx"] = [columns.index(g) for g in groups]
+        params["slope_idx"] = columns.index(varying_slope)
+    return params
+
+
+def chunk_slices(n_rows, n_draws, max_elements=PREDICT_CHUNK_ELEMENTS):
+    """(draws × 行) の行列が max_elements に収まるように行を区切る"""
+    size = max(1, max_elements // max(n_draws, 1))
+    return [slice(start, min(start + size, n_rows)) for start in range(0, n_rows, size)]
+
+
+def linear_predictor(params, X):
+    """全サンプル・全行の線形予測子 (サンプル数 × 行) を1回の行列積で計算する"""
+    eta = params["beta"] @ X.T
+    if "group_offset" in params:
+        varying = X[:, params["group_idx"]] * X[:, [params["slope_idx"]]]
+        eta += params["group_offset"] @ varying.T
+    return eta
+
+
+def pointwise_log_lik(params, X, y, family):
+    """行ごとの対数尤度 (サンプル数 × 行)"""
+    eta = linear_predictor(params, X)
+    if family == 'bernoulli':
+        return np.where(y > 0, log_expit(eta), log_expit(-eta))
+    sigma = params["sigma"][:, None]
+    return -0.5 * ((y - eta) / sigma) ** 2 - np.log(sigma) - 0.5 * np.log(2 * np.pi)
+
+
+def _design(X):
+    return np.asarray(X, dtype=float)
+
+
+def _response(y):
+    return np.asarray(y, dtype=float).ravel()
+
+
+def predict(trace, X, family='normal', interval_prob=0.95, random_seed=None,
+            max_elements=PREDICT_CHUNK_ELEMENTS):
+    """
+    新しい（または検証用の）行の予測を、PyMC のモデルを使わずに保存済みの事後サンプルから計算する
+    線形回帰: 予測の平均と、誤差 sigma を含む予測区間
+    ロジスティック回帰: 確率の事後平均と、確率の信用区間
+    """
+    params = posterior_params(trace, list(X.columns))
+    return predict_params(params, X, family, interval_prob, np.random.default_rng(random_seed), max_elements)
+
+
+def predict_params(params, X, family='normal', interval_prob=0.95, rng=None, max_elements=PREDICT_CHUNK_ELEMENTS):
+    """predict の本体（posterior_params で取り出した事後サンプルを使う）"""
+    X = _design(X)
+    rng = np.random.default_rng() if rng is None else rng
+    tail = (1 - interval_prob) / 2
+    n_draws = len(params["beta"])
+
+    out = {"mean": np.empty(len(X)), "low": np.empty(len(X)), "high": np.empty(len(X))}
+    for rows in chunk_slices(len(X), n_draws, max_elements):
+        eta = linear_predictor(params, X[rows])
+        if family == 'bernoulli':
+            # expit は単調なので、確率の分位点は線形予測子の分位点から求める
+            out["mean"][rows] = expit(eta).mean(axis=0)
+            out["low"][rows], out["high"][rows] = expit(np.quantile(eta, [tail, 1 - tail], axis=0))
+        else:
+            draws = eta + params["sigma"][:, None] * rng.standard_normal(eta.shape)
+            out["mean"][rows] = eta.mean(axis=0)
+            out["low"][rows], out["high"][rows] = np.quantile(draws, [tail, 1 - tail], axis=0)
+    prefix = "prob" if family == 'bernoulli' else "pred"
+    return pd.DataFrame({f"{prefix}_{k}": v for k, v in out.items()})
+
+
+def _relative_ess(trace):
+    """PSIS で使う相対的な有効サンプルサイズ（az.loo と同じく事後分布の ESS の平均 / サンプル数）"""
+    n_samples = trace.posterior.sizes["chain"] * trace.posterior.sizes["draw"]
+    ess = az.ess(trace.posterior[["beta"]], method="mean")["beta"].values
+    return float(np.mean(ess)) / n_samples
+
+
+def psis_loo(trace, X, y, family='normal', max_elements=PREDICT_CHUNK_ELEMENTS):
+    """
+    PSIS-LOO による ELPD を行のチャンクごとに計算する（対数尤度の行列全体を保持しない）
+    戻り値: (要約の辞書, 行ごとの elpd と Pareto k)
+    """
+    columns = list(X.columns)
+    X, y = _design(X), _response(y)
+    params = posterior_params(trace, columns)
+    n_draws = len(params["beta"])
+    reff = _relative_ess(trace)
+
+    elpd = np.empty(len(X))
+    lppd = np.empty(len(X))
+    pareto_k = np.empty(len(X))
+    for rows in chunk_slices(len(X), n_draws, max_elements):
+        log_lik = pointwise_log_lik(params, X[rows], y[rows], family).T
+        log_weights, pareto_k[rows] = az.psislw(-log_lik, reff=reff)
+        elpd[rows] = logsumexp(log_lik + log_weights, axis=1)
+        lppd[rows] = logsumexp(log_lik, axis=1) - np.log(n_draws)
+
+    summary = {
+        "elpd_loo": elpd.sum(),
+        "se": np.sqrt(len(elpd) * elpd.var()),
+        "p_loo": lppd.sum() - elpd.sum(),
+        "n_high_k": int((pareto_k > PARETO_K_THRESHOLD).sum()),
+        "max_k": float(pareto_k.max()),
+    }
+    return summary, pd.DataFrame({"elpd_loo": elpd, "pareto_k": pareto_k})
+
+
+def holdout_elpd(trace, X, y, family='normal', max_elements=PREDICT_CHUNK_ELEMENTS):
+    """学習に使っていない行の対数予測密度 (log pointwise predictive density) の和と標準誤差"""
+    columns = list(X.columns)
+    X, y = _design(X), _response(y)
+    params = posterior_params(trace, columns)
+    n_draws = len(params["beta"])
+    lppd = np.empty(len(X))
+    for rows in chunk_slices(len(X), n_draws, max_elements):
+        lppd[rows] = logsumexp(pointwise_log_lik(params, X[rows], y[rows], family), axis=0) - np.log(n_draws)
+    return {"elpd": lppd.sum(), "se": np.sqrt(len(lppd) * lppd.var()), "elpd_per_row": lppd.mean()}
+
+
+def interval_coverage(trace, X, y, probs=INTERVAL_PROBS, random_seed=None,
+                      max_elements=PREDICT_CHUNK_ELEMENTS):
+    """
+    線形回帰の予測区間（sigma を含む）に実測値が入る割合と区間の平均幅
+    よく較正されていればカバー率は probs に近くなる
+    """
+    columns = list(X.columns)
+    X, y = _design(X), _response(y)
+    params = posterior_params(trace, columns)
+    rng = np.random.default_rng(random_seed)
+    n_draws = len(params["beta"])
+    quantiles = np.concatenate([[(1 - p) / 2 for p in probs], [(1 + p) / 2 for p in probs]])
+
+    covered = np.zeros(len(probs))
+    width = np.zeros(len(probs))
+    for rows in chunk_slices(len(X), n_draws, max_elements):
+        eta = linear_predictor(params, X[rows])
+        draws = eta + params["sigma"][:, None] * rng.standard_normal(eta.shape)
+        bounds = np.quantile(draws, quantiles, axis=0)
+        low, high = bounds[:len(probs)], bounds[len(probs):]
+        covered += ((y[rows] >= low) & (y[rows] <= high)).sum(axis=1)
+        width += (high - low).sum(axis=1)
+    return pd.DataFrame({"prob": probs, "coverage": covered / len(X), "mean_width": width / len(X)})
+
+
+def calibration(trace, X, y, n_bins=CALIBRATION_BINS, max_elements=PREDICT_CHUNK_ELEMENTS):
+    """
+    ロジスティック回帰の較正
+    予測確率（事後平均）の分位点でビンに分け、ビンごとの平均予測確率と実際の割合を比べる
+    戻り値: (ビンごとの表, Brier スコア・対数損失・ECE の辞書)
+    """
+    columns = list(X.columns)
+    X, y = _design(X), _response(y)
+    params = posterior_params(trace, columns)
+    n_draws = len(params["beta"])
+    prob = np.empty(len(X))
+    for rows in chunk_slices(len(X), n_draws, max_elements):
+        prob[rows] = expit(linear_predictor(params, X[rows])).mean(axis=0)
+
+    edges = np.unique(np.quantile(prob, np.linspace(0, 1, n_bins + 1)))
+    bins = np.clip(np.searchsorted(edges, prob, side="right") - 1, 0, len(edges) - 2)
+    table = (pd.DataFrame({"bin": bins, "prob": prob, "observed": y})
+             .groupby("bin").agg(mean_pred=("prob", "mean"), observed_rate=("observed", "mean"),
+                                 n=("prob", "size"))
+             .reset_index())
+    clipped = np.clip(prob, 1e-15, 1 - 1e-15)
+    scores = {
+        "brier": float(np.mean((prob - y) ** 2)),
+        "log_loss": float(-np.mean(y * np.log(clipped) + (1 - y) * np.log(1 - clipped))),
+        "ece": float(np.sum(table["n"] * (table["mean_pred"] - table["observed_rate"]).abs()) / len(y)),
+    }
+    return table, scores
+
+
+def plot_calibration(tables, filename="bayes_calibration.png"):
+    """
+    較正曲線（ビンごとの平均予測確率と実際の割合）
+    tables: {ラベル: calibration の表} の辞書
+    """
+    fig, ax = plt.subplots(figsize=(6, 6))
+    ax.plot([0, 1], [0, 1], color='gray', linestyle='--', linewidth=1)
+    for label, table in tables.items():
+        ax.plot(table['mean_pred'], table['observed_rate'], '-o', label=label)
+    ax.set_xlabel('Mean predicted P(High ROI)')
+    ax.set_ylabel('Observed rate')
+    ax.set_title('Calibration of the Bayesian logistic model')
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.grid(True, linestyle=':', alpha=0.6)
+    ax.legend(loc='upper left')
+
+    save_path = os.path.join(IMAGE_DIR, filename)
+    plt.savefig(save_path, bbox_inches='tight')
+    print(f"Saved calibration plot to: {save_path}")
+    plt.close()
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# 既定で計算する HDI の確率
+HDI_PROBS = (0.5, 0.89, 0.95)
+
+# 既定の ROPE（実質的にゼロとみなす係数の範囲）
+ROPE = (-0.05, 0.05)
+
+# ロジスティック回帰で P(オッズ比 > 閾値) を計算する閾値
+ODDS_RATIO_THRESHOLDS = (1.0, 1.1, 1.5)
+
+
+def stack_draws(trace, var_name="beta"):
+    """
+    (chain, draw, 係数) の事後サンプルを (サンプル数, 係数) の配列にまとめる
+    戻り値: (配列, 係数名)
+    """
+    values = trace.posterior[var_name]
+    dims = [d for d in values.dims if d not in ("chain", "draw")]
+    draws = values.stack(sample=("chain", "draw")).transpose("sample", *dims).values
+    draws = draws.reshape(draws.shape[0], -1)
+    if len(dims) == 1:
+        names = [str(c) for c in values[dims[0]].values]
+    elif not dims:
+        names = [var_name]
+    else:
+        names = [",".join(map(str, combo)) for combo in itertools.product(*(values[d].values for d in dims))]
+    return draws, names
+
+
+def hdi_sorted(sorted_draws, prob):
+    """
+    列ごとにソート済みのサンプルから、全係数の HDI を一度に求める
+    (az.hdi と同じく、prob の割合を含む区間のうち幅が最小のもの)
+    """
+    n = sorted_draws.shape[0]
+    n_included = int(np.floor(prob * n))
+    widths = sorted_draws[n_included:] - sorted_draws[:n - n_included]
+    start = np.argmin(widths, axis=0)
+    cols = np.arange(sorted_draws.shape[1])
+    return sorted_draws[start, cols], sorted_draws[start + n_included, cols]
+
+
+def summarize_draws(draws, names, hdi_probs=HDI_PROBS, rope=ROPE, family='normal',
+                    odds_ratio_thresholds=ODDS_RATIO_THRESHOLDS):
+    """
+    (サンプル数, 係数) の事後サンプルから、全係数の要約を1回の走査で計算する
+    平均・標準偏差・複数の確率の HDI・P(>0)・P(<0)・ROPE 内の確率
+    family='bernoulli' の場合はオッズ比の平均・HDI・P(オッズ比 > 閾値) も計算する
+    (オッズ比の確率は exp を取らずに log(閾値) と比較する)
+    """
+    sorted_draws = np.sort(draws, axis=0)
+    table = {
+        "term": names,
+        "mean": draws.mean(axis=0),
+        "sd": draws.std(axis=0, ddof=1),
+        "median": 0.5 * (sorted_draws[(len(draws) - 1) // 2] + sorted_draws[len(draws) // 2]),
+    }
+    hdis = {prob: hdi_sorted(sorted_draws, prob) for prob in hdi_probs}
+    for prob, (low, high) in hdis.items():
+        table[f"hdi_{prob * 100:g}_low"] = low
+        table[f"hdi_{prob * 100:g}_high"] = high
+    table["p_positive"] = (draws > 0).mean(axis=0)
+    table["p_negative"] = (draws < 0).mean(axis=0)
+    if rope is not None:
+        table["p_rope"] = ((draws >= rope[0]) & (draws <= rope[1])).mean(axis=0)
+
+    if family == 'bernoulli':
+        table["odds_ratio_mean"] = np.exp(draws).mean(axis=0)
+        for prob, (low, high) in hdis.items():
+            # exp は単調なので、係数の HDI の端点をそのまま変換できる
+            table[f"odds_ratio_hdi_{prob * 100:g}_low"] = np.exp(low)
+            table[f"odds_ratio_hdi_{prob * 100:g}_high"] = np.exp(high)
+        for threshold in odds_ratio_thresholds:
+            table[f"p_odds_ratio_gt_{threshold:g}"] = (draws > np.log(threshold)).mean(axis=0)
+    return pd.DataFrame(table)
+
+
+def summarize_posterior(trace, var_name="beta", family='normal', **kwargs):
+    """1つのトレースの全係数の要約（summarize_draws を参照）"""
+    draws, names = stack_draws(trace, var_name)
+    return summarize_draws(draws, names, family=family, **kwargs)
+
+
+def summarize_models(traces, var_name="beta", **kwargs):
+    """
+    複数モデルの要約を縦に並べた tidy な表にする
+    traces: {モデル名: (trace, family)} の辞書
+    """
+    frames = []
+    for model_name, (trace, family) in traces.items():
+        summary = summarize_posterior(trace, var_name, family=family, **kwargs)
+        summary.insert(0, "model", model_name)
+        frames.append(summary)
+    return pd.concat(frames, ignore_index=True)
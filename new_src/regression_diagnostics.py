@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from fast_logit import fit_logit_batch, weighted_gram
+
+# 頑健標準誤差の種類
+HC_TYPES = ["HC0", "HC1", "HC2", "HC3"]
+
+
+def _sandwich(R_inv, meat):
+    """(X'X)^-1 X' Ω X (X'X)^-1 = R^-1 (Q' Ω Q) R^-T を全目的変数についてまとめて計算する"""
+    return R_inv @ meat @ R_inv.T
+
+
+def ols_diagnostics(X, Y, clusters=None, x_names=None, y_names=None):
+    """
+    同じデザイン行列を共有する複数の目的変数 Y (n×K) について、
+    頑健標準誤差 (HC0–HC3・クラスター頑健)、てこ比、Cook の距離、Breusch–Pagan 検定を計算する
+
+    X の QR 分解を一度だけ行い、Q から全目的変数の残差・てこ比・サンドイッチ推定量の中身を求める。
+    HC0–HC3 の中身 Q' diag(ω) Q は重み (n×4K) との1回の行列積でまとめて計算する
+    """
+    if x_names is None:
+        x_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    if y_names is None:
+        y_names = list(Y.columns) if isinstance(Y, pd.DataFrame) else [f"y{k}" for k in range(np.shape(Y)[1])]
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n, p = X.shape
+    K = Y.shape[1]
+
+    # 共有する中間量: Q, R^-1, てこ比, 残差
+    Q, R = np.linalg.qr(X)
+    R_inv = np.linalg.solve(R, np.eye(p))
+    leverage = np.einsum('ij,ij->i', Q, Q)
+    resid = Y - Q @ (Q.T @ Y)
+    resid2 = resid ** 2
+    scale = resid2.sum(axis=0) / (n - p)
+
+    # HC0–HC3 の重み
+    h = leverage[:, None]
+    weights = np.hstack([resid2, resid2 * n / (n - p), resid2 / (1 - h), resid2 / (1 - h) ** 2])
+    meat = weighted_gram(Q, weights).reshape(len(HC_TYPES), K, p, p)
+    cov = {"nonrobust": (R_inv @ R_inv.T)[None] * scale[:, None, None]}
+    for i, name in enumerate(HC_TYPES):
+        cov[name] = _sandwich(R_inv, meat[i])
+
+    # クラスター頑健: クラスターごとのスコア和 (G×p×K) を疎な指示行列との積で求める
+    if clusters is not None:
+        _, groups = np.unique(np.asarray(clusters), return_inverse=True)
+        n_groups = groups.max() + 1
+        indicator = sparse.csr_matrix((np.ones(n), (groups, np.arange(n))), shape=(n_groups, n))
+        scores = (indicator @ (Q[:, :, None] * resid[:, None, :]).reshape(n, p * K)).reshape(n_groups, p, K)
+        correction = n_groups / (n_groups - 1) * (n - 1) / (n - p)
+        cov["cluster"] = _sandwich(R_inv, np.einsum('gik,gjk->kij', scores, scores)) * correction
+
+    bse = {name: pd.DataFrame(np.sqrt(np.diagonal(c, axis1=1, axis2=2)).T, index=x_names, columns=y_names)
+           for name, c in cov.items()}
+
+    # Cook の距離
+    cooks = resid2 * h / (p * scale * (1 - h) ** 2)
+
+    # Breusch–Pagan (Koenker 版, statsmodels の het_breuschpagan と同じ): LM = n × (e² を X に回帰した R²)
+    proj = Q.T @ resid2
+    mean_sq = resid2.mean(axis=0)
+    ess = np.einsum('ij,ij->j', proj, proj) - n * mean_sq ** 2
+    tss = np.einsum('ij,ij->j', resid2, resid2) - n * mean_sq ** 2
+    bp_lm = n * ess / tss
+    bp_pvalue = stats.chi2.sf(bp_lm, p - 1)
+
+    return {
+        "cov": cov,
+        "bse": bse,
+        "leverage": leverage,
+        "cooks_distance": pd.DataFrame(cooks, columns=y_names),
+        "bp_lm": pd.Series(bp_lm, index=y_names),
+        "bp_pvalue": pd.Series(bp_pvalue, index=y_names),
+    }
+
+
+def logit_diagnostics(X, y, clusters=None, x_names=None, y_name="y0"):
+    """
+    ロジットの頑健標準誤差 (HC0–HC3・クラスター頑健)、てこ比、Cook の距離を計算する（戻り値は ols_diagnostics と同じ形）
+
+    IRLS の重み w = μ(1-μ) で重み付けした X の QR 分解から、パンのヘッセ行列の逆行列と
+    重み付きハット行列の対角要素（てこ比）を求め、スコアの残差 y - μ をサンドイッチ推定量の中身に使う。
+    HC1–HC3 は R の sandwich::vcovHC と同じ定義 (statsmodels の GLM は HC1–HC3 をすべて HC0 として計算する)。
+    Cook の距離はピアソン残差から計算する (statsmodels の GLM と同じ定義)。Breusch–Pagan 検定は対象外 (NaN)
+    """
+    if x_names is None:
+        x_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).ravel()
+    n, p = X.shape
+
+    fit = fit_logit_batch(X, y)
+    if not fit["converged"].iloc[0]:
+        raise np.linalg.LinAlgError(f"Logit for '{y_name}' did not converge ({fit['n_iter'].iloc[0]} iterations).")
+    mu = 1 / (1 + np.exp(-(X @ fit["params"].to_numpy()[:, 0])))
+    w = mu * (1 - mu)
+    resid = (y - mu)[:, None]
+    resid2 = resid ** 2
+
+    Q, R = np.linalg.qr(X * np.sqrt(w)[:, None])
+    R_inv = np.linalg.solve(R, np.eye(p))
+    leverage = np.einsum('ij,ij->i', Q, Q)
+    h = leverage[:, None]
+
+    # スコア x_i (y_i - μ_i) の外積和を X の重み付き交差積で求め、(X'WX)^-1 で挟む
+    weights = np.hstack([resid2, resid2 * n / (n - p), resid2 / (1 - h), resid2 / (1 - h) ** 2])
+    bread = R_inv @ R_inv.T
+    meat = weighted_gram(X, weights)
+    cov = {"nonrobust": bread[None]}
+    for i, name in enumerate(HC_TYPES):
+        cov[name] = (bread @ meat[i] @ bread)[None]
+
+    if clusters is not None:
+        _, groups = np.unique(np.asarray(clusters), return_inverse=True)
+        n_groups = groups.max() + 1
+        indicator = sparse.csr_matrix((np.ones(n), (groups, np.arange(n))), shape=(n_groups, n))
+        scores = indicator @ (X * resid)
+        correction = n_groups / (n_groups - 1) * (n - 1) / (n - p)
+        cov["cluster"] = (bread @ (scores.T @ scores) @ bread)[None] * correction
+
+    bse = {name: pd.DataFrame(np.sqrt(np.diagonal(c, axis1=1, axis2=2)).T, index=x_names, columns=[y_name])
+           for name, c in cov.items()}
+
+    cooks = resid2 / w[:, None] * h / (p * (1 - h) ** 2)
+
+    return {
+        "cov": cov,
+        "bse": bse,
+        "leverage": leverage,
+        "cooks_distance": pd.DataFrame(cooks, columns=[y_name]),
+        "bp_lm": pd.Series(np.nan, index=[y_name]),
+        "bp_pvalue": pd.Series(np.nan, index=[y_name]),
+    }
+
+
+def vif_from_gram(XtX, X_sum, nobs, is_constant):
+    """
+    交差積行列 X'X と列和から VIF を計算する（切片列を除く各列）
+    切片がある場合は中心化した交差積の相関行列の逆行列の対角要素が VIF になる
+    """
+    if is_constant.any():
+        mean = X_sum / nobs
+        C = XtX - nobs * np.outer(mean, mean)
+    else:
+        C = XtX
+    keep = ~is_constant
+    C = C[np.ix_(keep, keep)]
+    d = 1 / np.sqrt(np.diag(C))
+    return np.diag(np.linalg.inv(C * np.outer(d, d))), keep
+
+
+def diagnostics_grid(design_cache, formula_bases, targets, clusters=None, term='political_news_count'):
+    """
+    モデルグリッド全体について診断量を計算する
+    targets: main.py と同じ形式 (OLS は ols_diagnostics、ロジットは logit_diagnostics。ロジットの BP 検定は NaN)
+    clusters: クラスター頑健標準誤差に使うグループ（デザイン行列の行と対応する配列、例: 公開年）
+
+    戻り値:
+        summary: Base×Target ごとの term の各種標準誤差・てこ比・Cook の距離・VIF・BP 検定（比較表に結合する）
+        se_table: 全係数の各種標準誤差（縦長）
+    """
+    ols_targets = [t for t in targets if t['type'] == "ols"]
+    logit_targets = [t for t in targets if t['type'] != "ols"]
+    Y = np.column_stack([design_cache.response(t['dep_var'])[0][:, 0] for t in ols_targets + logit_targets])
+    X = design_cache.X
+
+    # 全スペック共通で欠損のない行だけを使う
+    mask = ~(np.isnan(X).any(axis=1) | np.isnan(Y).any(axis=1))
+    if clusters is not None:
+        clusters = pd.Series(np.asarray(clusters))
+        mask &= clusters.notna().to_numpy()
+        clusters = clusters.to_numpy()[mask]
+    X, Y = X[mask], Y[mask]
+    n = len(X)
+
+    # VIF 用の交差積は全列について一度だけ計算する
+    XtX = X.T @ X
+    X_sum = X.sum(axis=0)
+    is_constant = (np.ptp(X, axis=0) == 0) & (X[0] != 0)
+    y_names = [t['name'] for t in ols_targets]
+    Y_logit = Y[:, len(ols_targets):]
+    Y = Y[:, :len(ols_targets)]
+
+    summary_rows = []
+    se_tables = []
+    for base_name, base_formula in formula_bases.items():
+        idx, names = design_cache.column_indices(base_formula)
+        vif, keep = vif_from_gram(XtX[np.ix_(idx, idx)], X_sum[idx], n, is_constant[idx])
+        p = len(idx)
+
+        fits = []
+        if ols_targets:
+            fits.append((y_names, ols_diagnostics(X[:, idx], Y, clusters, names, y_names)))
+        for k, target in enumerate(logit_targets):
+            fits.append(([target['name']],
+                         logit_diagnostics(X[:, idx], Y_logit[:, k], clusters, names, target['name'])))
+
+        for target_names, diag in fits:
+            for target_name in target_names:
+                row = {"Base": base_name, "Target": target_name}
+                for cov_type, bse in diag["bse"].items():
+                    row[f"SE_{cov_type}"] = bse[target_name].get(term, np.nan)
+                row["Max_Leverage"] = diag["leverage"].max()
+                row["N_High_Leverage"] = int(np.sum(diag["leverage"] > 2 * p / n))
+                row["Max_CooksD"] = diag["cooks_distance"][target_name].max()
+                row["N_Influential"] = int(np.sum(diag["cooks_distance"][target_name] > 4 / n))
+                row["Max_VIF"] = vif.max() if len(vif) else np.nan
+                row["BP_LM"] = diag["bp_lm"][target_name]
+                row["BP_pvalue"] = diag["bp_pvalue"][target_name]
+                summary_rows.append(row)
+
+                se_table = pd.DataFrame({f"SE_{cov_type}": bse[target_name] for cov_type, bse in diag["bse"].items()})
+                se_table["VIF"] = pd.Series(vif, index=[c for c, k in zip(names, keep) if k])
+                se_table = se_table.rename_axis("term").reset_index()
+                se_table.insert(0, "Target", target_name)
+                se_table.insert(0, "Base", base_name)
+                se_tables.append(se_table)
+
+    return pd.DataFrame(summary_rows), pd.concat(se_tables, ignore_index=True)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# 推定結果の保存先
+RESULT_DIR = "new_results"
+RESULT_DB = os.path.join(RESULT_DIR, "fit_results.sqlite")
+
+
+def data_hash(*arrays):
+    """デザイン行列・目的変数の内容（値・形状・型）からハッシュを計算する"""
+    h = hashlib.sha256()
+    for arr in arrays:
+        arr = np.ascontiguousarray(np.asarray(arr))
+        h.update(str((arr.shape, arr.dtype.str)).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def make_key(formula, estimator, settings, X, y):
+    """フォーミュラ・推定方法・設定・データのハッシュから保存キーを作る"""
+    payload = json.dumps({
+        "formula": " ".join(formula.split()),
+        "estimator": estimator,
+        "settings": settings,
+        "columns": list(getattr(X, "columns", [])),
+        "data": data_hash(X, y),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class FitResultStore:
+    """
+    推定結果を SQLite に保存し、同じキーの再推定を省略するための保存庫
+
+    係数・共分散・AIC/BIC・診断量・要約テキストを保持する。
+    キーにはデータのハッシュを含むので、データやフォーミュラが変われば自動的に再推定される
+    """
+
+    def __init__(self, path=RESULT_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fit_results (
+                key TEXT PRIMARY KEY,
+                formula TEXT,
+                estimator TEXT,
+                settings TEXT,
+                param_names TEXT,
+                params TEXT,
+                cov_params TEXT,
+                aic REAL,
+                bic REAL,
+                llf REAL,
+                nobs REAL,
+                diagnostics TEXT,
+                summary_text TEXT,
+                artifact_path TEXT,
+                created_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        """保存済みの結果を辞書で返す（なければ None）"""
+        cur = self.conn.execute("SELECT * FROM fit_results WHERE key = ?", (key,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        record = dict(zip([c[0] for c in cur.description], row))
+        for field in ("settings", "param_names", "params", "cov_params", "diagnostics"):
+            if record[field] is not None:
+                record[field] = json.loads(record[field])
+        return record
+
+    def put(self, key, formula, estimator, settings, param_names=None, params=None, cov_params=None,
+            aic=None, bic=None, llf=None, nobs=None, diagnostics=None, summary_text=None, artifact_path=None):
+        """結果を保存する（同じキーは上書き）"""
+        def to_json(value):
+            if value is None:
+                return None
+            return json.dumps(np.asarray(value).tolist() if isinstance(value, np.ndarray) else value)
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO fit_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, formula, estimator, to_json(settings), to_json(param_names),
+             to_json(None if params is None else np.asarray(params, dtype=float)),
+             to_json(None if cov_params is None else np.asarray(cov_params, dtype=float)),
+             aic, bic, llf, nobs, to_json(diagnostics), summary_text, artifact_path, time.time())
+        )
+        self.conn.commit()
+
+    def put_model(self, key, formula, estimator, settings, model):
+        """statsmodels の結果オブジェクトから必要な値を取り出して保存する"""
+        diagnostics = {}
+        for attr in ("rsquared", "rsquared_adj", "prsquared", "llnull", "condition_number"):
+            if hasattr(model, attr):
+                diagnostics[attr] = float(getattr(model, attr))
+        if hasattr(model, "mle_retvals") and model.mle_retvals is not None:
+            diagnostics["converged"] = bool(model.mle_retvals.get("converged", True))
+
+        self.put(key, formula, estimator, settings,
+                 param_names=list(model.params.index), params=model.params.values,
+                 cov_params=np.asarray(model.cov_params()),
+                 aic=float(model.aic), bic=float(model.bic), llf=float(model.llf), nobs=float(model.nobs),
+                 diagnostics=diagnostics, summary_text=model.summary().as_text())
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,146 @@
+import time
+
+import arviz as az
+import numpy as np
+import pandas as pd
+
+from bayes_model_factory import BayesianModelFactory, JAX_BACKENDS, HIERARCHICAL_FAMILIES, available_backends
+from design_cache import DesignMatrixCache
+
+# JAX 系のコンパイル時間を推定するための短い実行のステップ数
+JAX_PROBE_STEPS = 10
+
+
+def ess_per_second(trace, sampling_time, var_names=("beta", "sigma")):
+    """パラメータごとの有効サンプルサイズ (bulk / tail) と1秒あたりの ESS"""
+    var_names = [v for v in var_names if v in trace.posterior]
+    ess_bulk = az.ess(trace, var_names=var_names, method="bulk")
+    ess_tail = az.ess(trace, var_names=var_names, method="tail")
+
+    rows = []
+    for var in var_names:
+        bulk = np.atleast_1d(ess_bulk[var].values)
+        tail = np.atleast_1d(ess_tail[var].values)
+        dims = [d for d in ess_bulk[var].dims]
+        labels = ([f"{var}[{c}]" for c in ess_bulk[var].coords[dims[0]].values] if dims else [var])
+        for label, b, t in zip(labels, bulk, tail):
+            rows.append({"Parameter": label, "ESS_bulk": b, "ESS_tail": t, "ESS_per_sec": b / sampling_time})
+    return pd.DataFrame(rows)
+
+
+def benchmark_backends(df, base_formula_rhs, model_specs, backends=None, draws=1000, tune=1000,
+                       chains=2, cores=None, seed=0, prior_beta_sigma=1, prior_sigma=10):
+    """
+    サンプラーごとにコンパイル時間・サンプリング時間・パラメータごとの ESS/秒を測る
+    model_specs: {キー: (フォーミュラ, モデル名, family)} の辞書
+
+    pymc / nutpie はコンパイルとサンプリングを分けて測る（同じ形状のモデルは2つ目以降コンパイル済み）。
+    JAX 系は pm.sample の呼び出しごとに JIT コンパイルされるので、短い実行 (tune=draws=JAX_PROBE_STEPS) と
+    本番の実行の時間差から1ステップあたりの時間を求め、残りをコンパイル時間とみなす
+
+    戻り値: (モデル×サンプラーごとの要約, パラメータごとの ESS)
+    """
+    if backends is None:
+        backends = available_backends()
+    design_cache = DesignMatrixCache(df, [base_formula_rhs])
+
+    summary_rows = []
+    ess_tables = []
+    for backend in backends:
+        if backend not in available_backends():
+            print(f"Skipping {backend}: not installed.")
+            continue
+        # サンプラーごとに新しいファクトリを使い、コンパイル時間を含めて測る
+        factory = BayesianModelFactory(prior_beta_sigma=prior_beta_sigma, prior_sigma=prior_sigma)
+        jax_initialized = False
+
+        for key, (formula, model_name, family) in model_specs.items():
+            print(f"\n--- {model_name} / {backend} ---")
+            y, X = design_cache.dmatrices(formula)
+            sample_kwargs = {"chains": chains, "cores": cores, "progressbar": False,
+                             "random_seed": seed, "backend": backend}
+
+            if backend in JAX_BACKENDS:
+                # JAX ランタイムの初期化はプロセスで1回だけなので計測から除く
+                if not jax_initialized:
+                    factory.sample(X, y, family, draws=1, tune=1, **sample_kwargs)
+                    jax_initialized = True
+                start = time.perf_counter()
+                factory.sample(X, y, family, draws=JAX_PROBE_STEPS, tune=JAX_PROBE_STEPS, **sample_kwargs)
+                probe_time = time.perf_counter() - start
+            else:
+                start = time.perf_counter()
+                factory.compile(X, y, family, backend)
+                compile_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            trace = factory.sample(X, y, family, draws=draws, tune=tune, **sample_kwargs)
+            sampling_time = time.perf_counter() - start
+            if backend in JAX_BACKENDS:
+                step_time = max(sampling_time - probe_time, 0) / max(draws + tune - 2 * JAX_PROBE_STEPS, 1)
+                compile_time = max(probe_time - 2 * JAX_PROBE_STEPS * step_time, 0)
+                sampling_time -= compile_time
+
+            ess_df = ess_per_second(trace, sampling_time)
+            ess_df.insert(0, "Backend", backend)
+            ess_df.insert(0, "Model", model_name)
+            ess_tables.append(ess_df)
+
+            summary_rows.append({
+                "Model": model_name,
+                "Backend": backend,
+                "Compile_s": compile_time,
+                "Sampling_s": sampling_time,
+                "Min_ESS_per_sec": ess_df["ESS_per_sec"].min(),
+                "Median_ESS_per_sec": ess_df["ESS_per_sec"].median(),
+            })
+            print(f"compile {compile_time:.2f}s, sampling {sampling_time:.2f}s, "
+                  f"min ESS/s {ess_df['ESS_per_sec'].min():.1f}")
+
+    summary_df = pd.DataFrame(summary_rows)
+    if len(summary_df):
+        # モデルごとに、最も遅く混ざるパラメータの ESS/秒が最大のサンプラーを推奨する
+        best = summary_df.loc[summary_df.groupby("Model", sort=False)["Min_ESS_per_sec"].idxmax()]
+        summary_df["Fastest"] = summary_df.index.isin(best.index)
+    return summary_df, pd.concat(ess_tables, ignore_index=True) if ess_tables else pd.DataFrame()
+
+
+def benchmark_parameterizations(X, y, draws=1000, tune=1000, chains=2, cores=None, seed=0,
+                                prior_beta_sigma=1, prior_sigma=10):
+    """
+    階層モデルの中心化・非中心化の表し方で、コンパイル時間・サンプリング時間・発散の数・ESS/秒を比べる
+    X はグループのダミー変数の列名を含む DataFrame
+
+    戻り値: (表し方ごとの要約, パラメータごとの ESS)
+    """
+    summary_rows = []
+    ess_tables = []
+    for family, parameterization in HIERARCHICAL_FAMILIES.items():
+        print(f"\n--- {parameterization} ---")
+        factory = BayesianModelFactory(prior_beta_sigma=prior_beta_sigma, prior_sigma=prior_sigma)
+        start = time.perf_counter()
+        factory.compile(X, y, family)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trace = factory.sample(X, y, family, draws=draws, tune=tune, chains=chains, cores=cores,
+                               progressbar=False, random_seed=seed)
+        sampling_time = time.perf_counter() - start
+
+        ess_df = ess_per_second(trace, sampling_time, var_names=("beta", "sigma", "tau_group", "group_slope"))
+        ess_df.insert(0, "Parameterization", parameterization)
+        ess_tables.append(ess_df)
+        tau_row = ess_df[ess_df["Parameter"] == "tau_group"].iloc[0]
+        summary_rows.append({
+            "Parameterization": parameterization,
+            "Compile_s": compile_time,
+            "Sampling_s": sampling_time,
+            "Divergences": int(trace.sample_stats["diverging"].sum()),
+            "Min_ESS_per_sec": ess_df["ESS_per_sec"].min(),
+            "Median_ESS_per_sec": ess_df["ESS_per_sec"].median(),
+            "Tau_ESS_per_sec": tau_row["ESS_per_sec"],
+        })
+        print(f"compile {compile_time:.2f}s, sampling {sampling_time:.2f}s, "
+              f"divergences {summary_rows[-1]['Divergences']}, min ESS/s {ess_df['ESS_per_sec'].min():.1f}")
+
+    return pd.DataFrame(summary_rows), pd.concat(ess_tables, ignore_index=True)
@@ -0,0 +1,203 @@
+import glob
+import json
+import os
+import re
+import time
+import uuid
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from bayes_model_factory import JAX_BACKENDS
+from sampler_benchmark import ess_per_second
+from visualization import IMAGE_DIR
+
+# 実行ログの保存先（トレースプロットと同じディレクトリ）。1回の推定ごとに JSON を1つ書き、
+# 並列に推定する別プロセスが同じファイルに同時に書き込まないようにする
+RUN_LOG_DIR = os.path.join(IMAGE_DIR, "bayes_run_logs")
+RUN_LOG_CSV = os.path.join(IMAGE_DIR, "bayes_run_log.csv")
+
+# 比較表に載せる所要時間の内訳
+PHASES = ("design_s", "compile_s", "init_s", "tune_s", "draw_s")
+
+
+class PhaseTimer:
+    """
+    pm.sample の callback として、チェーンごとに最初の draw・最後のチューニングの draw・最後の draw の時刻を記録する
+    (チューニングの時間 = 最後のチューニングの draw - 最初の draw、本サンプリングの時間 = 最後の draw - 最後のチューニングの draw)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.chains = {}
+
+    def __call__(self, trace, draw):
+        now = time.perf_counter()
+        chain = self.chains.setdefault(int(draw.chain), {"first": now, "tune_end": None, "last": now})
+        if draw.tuning:
+            chain["tune_end"] = now
+        chain["last"] = now
+
+    def phases(self):
+        """
+        初期化（最初の draw まで）の時間と、チューニング・本サンプリングのチェーンの合計時間
+        チェーンを並列に進めた場合、合計は経過時間より長くなる
+        """
+        if not self.chains:
+            return {"init_s": np.nan, "tune_s": np.nan, "draw_s": np.nan}, {}
+        per_chain = {}
+        for chain, t in sorted(self.chains.items()):
+            tune_end = t["first"] if t["tune_end"] is None else t["tune_end"]
+            per_chain[chain] = {"tune_s": tune_end - t["first"], "draw_s": t["last"] - tune_end}
+        return {
+            "init_s": min(t["first"] for t in self.chains.values()) - self.start,
+            "tune_s": sum(c["tune_s"] for c in per_chain.values()),
+            "draw_s": sum(c["draw_s"] for c in per_chain.values()),
+        }, per_chain
+
+
+def chain_stats(trace):
+    """チェーンごとのステップサイズ・木の深さ・発散の数・受理率（サンプラーの sample_stats から）"""
+    if "sample_stats" not in trace.groups():
+        return []
+    stats = trace.sample_stats
+    depth = "tree_depth" if "tree_depth" in stats else "depth"
+    rows = []
+    for chain in stats["chain"].values:
+        s = stats.sel(chain=chain)
+        row = {"chain": int(chain), "step_size": float(s["step_size"].mean())}
+        if depth in s:
+            row.update(tree_depth_mean=float(s[depth].mean()), tree_depth_max=int(s[depth].max()))
+        if "n_steps" in s:
+            row["n_steps_mean"] = float(s["n_steps"].mean())
+        if "diverging" in s:
+            row["divergences"] = int(s["diverging"].sum())
+        if "acceptance_rate" in s:
+            row["acceptance_rate"] = float(s["acceptance_rate"].mean())
+        if "reached_max_treedepth" in s:
+            row["max_treedepth_hits"] = int(s["reached_max_treedepth"].sum())
+        rows.append(row)
+    return rows
+
+
+def build_run_record(model_name, formula, family, backend, settings, phases, trace, per_chain=None):
+    """
+    1回の推定の実行ログ
+    phases: {"design_s", "compile_s", "init_s", "tune_s", "draw_s", "sampling_s"}（秒）
+    JAX 系のバックエンドの compile_s はモデルの構築だけで、JIT コンパイルの時間は sampling_s に含まれる
+    ESS/秒はサンプリング全体の経過時間 (sampling_s) あたり（sampler_benchmark と同じ基準）
+    """
+    chains = chain_stats(trace)
+    for row in chains:
+        row.update((per_chain or {}).get(row["chain"], {}))
+    ess = ess_per_second(trace, phases["sampling_s"])
+    return {
+        "run_id": f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": model_name,
+        "formula": " ".join(formula.split()),
+        "family": family,
+        "backend": backend,
+        "settings": settings,
+        "phases": {k: float(v) for k, v in phases.items()},
+        "chains": chains,
+        "ess": ess.to_dict(orient="records"),
+    }
+
+
+def _flatten(record):
+    """比較表の1行（実行ごと）"""
+    chains = pd.DataFrame(record["chains"])
+    ess = pd.DataFrame(record["ess"])
+    settings = record["settings"]
+    row = {"run_id": record["run_id"], "started_at": record["started_at"], "model": record["model"],
+           "backend": record["backend"], "chains": settings.get("chains"),
+           "draws": settings.get("draws", record["phases"].get("adaptive_draws")), "tune": settings.get("tune")}
+    row.update(record["phases"])
+    for column, how in (("divergences", "sum"), ("step_size", "mean"), ("tree_depth_mean", "mean"),
+                        ("tree_depth_max", "max"), ("acceptance_rate", "mean")):
+        row[column] = chains[column].agg(how) if column in chains else np.nan
+    row["min_ess_per_sec"] = ess["ESS_per_sec"].min() if len(ess) else np.nan
+    row["median_ess_per_sec"] = ess["ESS_per_sec"].median() if len(ess) else np.nan
+    return row
+
+
+def load_run_log(directory=RUN_LOG_DIR):
+    """保存済みの実行ログ（古い順）"""
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path) as f:
+            records.append(json.load(f))
+    return sorted(records, key=lambda r: r["run_id"])
+
+
+def compare_runs(records, last=None):
+    """
+    実行ごとの所要時間の内訳・発散・ステップサイズ・木の深さ・ESS/秒の比較表
+    同じモデルの直前の実行に対する min ESS/秒 の比 (ess_ratio_prev) も付ける
+    last: モデルごとに直近の last 回だけを残す
+    """
+    if not records:
+        return pd.DataFrame()
+    table = pd.DataFrame([_flatten(r) for r in records])
+    table["ess_ratio_prev"] = table["min_ess_per_sec"] / table.groupby("model")["min_ess_per_sec"].shift()
+    if last is not None:
+        table = table.groupby("model", sort=False).tail(last)
+    return table.sort_values(["model", "run_id"], ignore_index=True)
+
+
+def write_run_log(record, directory=RUN_LOG_DIR, csv_path=RUN_LOG_CSV):
+    """
+    実行ログを JSON で保存し、全実行の比較表の CSV を作り直す
+    (CSV は一時ファイルに書いてから置き換えるので、並列の書き込みでも壊れない)
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r"\W+", "_", record["model"]).strip("_")
+    path = os.path.join(directory, f"{record['run_id']}_{name}.json")
+    with open(path, "w") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2, default=float)
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    compare_runs(load_run_log(directory)).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return path
+
+
+def format_run_summary(record):
+    """1行の要約（推定のたびに表示する）"""
+    row = _flatten(record)
+    # JAX 系は JIT コンパイルがサンプリングの中で行われるので、compile_s はモデルの構築の時間
+    if record["backend"] in JAX_BACKENDS:
+        compile_label = f"model build {row['compile_s']:.2f}s (JIT included in sampling {row['sampling_s']:.1f}s)"
+    else:
+        compile_label = f"compile {row['compile_s']:.2f}s"
+    return (f"design {row['design_s']:.2f}s, {compile_label}, init {row['init_s']:.2f}s, "
+            f"tuning {row['tune_s']:.1f}s, draws {row['draw_s']:.1f}s (chain total), "
+            f"divergences {row['divergences']:.0f}, step size {row['step_size']:.3f}, "
+            f"tree depth {row['tree_depth_mean']:.1f}, min ESS/s {row['min_ess_per_sec']:.1f}")
+
+
+def plot_run_comparison(table, filename="bayes_run_comparison.png"):
+    """実行ごとの所要時間の内訳（積み上げ棒）と min ESS/秒（右軸）をモデルごとに並べる"""
+    models = list(dict.fromkeys(table["model"]))
+    fig, axes = plt.subplots(len(models), 1, figsize=(10, 3.5 * len(models)), squeeze=False)
+    for ax, model in zip(axes[:, 0], models):
+        runs = table[table["model"] == model]
+        labels = [f"{r.run_id[:15]}\n{r.backend}" for r in runs.itertuples()]
+        bottom = np.zeros(len(runs))
+        for phase in PHASES:
+            values = runs[phase].fillna(0).to_numpy()
+            ax.bar(labels, values, bottom=bottom, label=phase[:-2])
+            bottom += values
+        ax.set_ylabel('Seconds')
+        ax.set_title(model)
+        ax.legend(loc='upper left', fontsize=8)
+        ax2 = ax.twinx()
+        ax2.plot(labels, runs["min_ess_per_sec"], color='black', marker='o', linestyle=':')
+        ax2.set_ylabel('Min ESS/s')
+    fig.tight_layout()
+
+    save_path = os.path.join(IMAGE_DIR, filename)
+    plt.savefig(save_path, bbox_inches='tight')
+    print(f"Saved run comparison to: {save_path}")
+    plt.close()
@@ -0,0 +1,357 @@
+import argparse
+# PyTensor のコンパイルキャッシュの設定を有効にするため、pymc を使うモジュールより先に読み込む
+import bayes_model_factory
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import patsy
+import statsmodels.api as sm
+from scipy import stats
+from scipy.special import expit
+
+from bayesian_analysis import (MODEL_SPECS, BASE_FORMULA_RHS, CONTINUOUS_COLS, INPUT_FILE, standardize_data,
+                               run_bayesian_model)
+from data_processing import add_features, load_and_preprocess_data, count_news, extract_genre_names
+from design_cache import DesignMatrixCache
+from main import FORMULA_BASES, TARGETS, ESTIMATOR_SETTINGS
+from online_ols import align_genre_columns
+from posterior_predictive import posterior_params, predict_params
+from result_store import FitResultStore, make_key
+
+# 予測に使う事後サンプル数（等間隔に間引く）。区間の計算量は draws × 行 に比例する
+SERVICE_DRAWS = 500
+
+# 予測区間・信用区間の確率
+SERVICE_INTERVAL = 0.95
+
+# ベンチマークのリクエストの行数と、p95 の応答時間の目標（秒）
+LATENCY_TARGETS = {1: 0.05, 10000: 2.0}
+
+# 予測する目的変数 {キー: (OLS/ロジットの目的変数, 出力の列名)}
+SCORE_TARGETS = {
+    "revenue": ("revenue_log", "revenue_log"),
+    "roi": ("roi_log", "roi_log"),
+    "logit": ("is_high_roi", "high_roi_prob"),
+}
+
+
+def _collection_value(value):
+    """
+    True / False と 1 / 0 は元データの形式（コレクション名 / 欠損）にする
+    add_features は欠損でない値をすべて「コレクションあり」とみなすので、0 や False をそのまま渡さない
+    """
+    if isinstance(value, (bool, np.bool_, int, np.integer)) or (
+            isinstance(value, (float, np.floating)) and not np.isnan(value)):
+        return "collection" if value else None
+    return value
+
+
+def to_raw_records(records):
+    """
+    リクエストの映画を、元データの CSV と同じ形式の DataFrame にする
+    genres: ジャンル名のリスト（元データの文字列もそのまま受け付ける）
+    belongs_to_collection: True / False または 1 / 0（元データのコレクション名・欠損もそのまま受け付ける）
+    """
+    df = pd.DataFrame.from_records(records)
+    if "genres" not in df.columns:
+        df["genres"] = [[] for _ in range(len(df))]
+    df["genres"] = [[{"name": g} for g in genres] if isinstance(genres, list) else genres
+                    for genres in df["genres"]]
+    if "belongs_to_collection" not in df.columns:
+        df["belongs_to_collection"] = None
+    df["belongs_to_collection"] = [_collection_value(value) for value in df["belongs_to_collection"]]
+    return df
+
+
+def design_matrix(design_info, df):
+    """
+    学習時の design_info でデザイン行列を作る
+    項が数値の列とその積だけの場合は列を直接掛け合わせる（patsy の評価は1回あたり数十ミリ秒かかる）
+    それ以外の項（I(x**2) など）を含む場合は patsy で評価する
+    """
+    factors = [factor for term in design_info.terms for factor in term.factors]
+    if any(design_info.factor_infos[f].type != "numerical" or design_info.factor_infos[f].num_columns != 1
+           or f.name() not in df.columns for f in factors):
+        return np.asarray(patsy.build_design_matrices([design_info], df)[0])
+    X = np.empty((len(df), len(design_info.terms)))
+    for j, term in enumerate(design_info.terms):
+        X[:, j] = 1.0
+        for factor in term.factors:
+            X[:, j] *= df[factor.name()].to_numpy(dtype=float)
+    return X
+
+
+class MovieScorer:
+    """
+    推定済みの OLS / ロジットの係数とベイズモデルの事後サンプルを一度だけ読み込み、
+    新しい映画の収益・ROI・高 ROI の確率を区間付きでまとめて予測する
+
+    説明変数は学習時と同じ変換 (add_features) とジャンル列・標準化の定数を使う
+    """
+
+    def __init__(self, formula_base="Base", n_draws=SERVICE_DRAWS, interval_prob=SERVICE_INTERVAL,
+                 input_file=INPUT_FILE, random_seed=0):
+        start = time.perf_counter()
+        self.formula_base = formula_base
+        self.input_file = input_file
+        self.n_draws = n_draws
+        self.interval_prob = interval_prob
+        # np.random.Generator はスレッド間で共有できないので、リクエストごとに子の乱数生成器を作る
+        self.seed_sequence = np.random.SeedSequence(random_seed)
+        self.seed_lock = threading.Lock()
+
+        print("Loading training data...")
+        df = load_and_preprocess_data(input_file)
+        self.genre_columns = [c for c in df.columns if c.startswith("Genre_")]
+        self.scaling = {col: (df[col].mean(), df[col].std()) for col in CONTINUOUS_COLS}
+        df_std = standardize_data(df, CONTINUOUS_COLS)
+
+        store = FitResultStore()
+        try:
+            self._load_frequentist(df, store)
+            self._load_bayesian(df_std, store)
+        finally:
+            store.close()
+        self.load_time = time.perf_counter() - start
+        print(f"Models loaded in {self.load_time:.1f}s")
+
+    def _load_frequentist(self, df, store):
+        """モデルグリッドの OLS / ロジットの係数・共分散（保存庫になければ推定して保存する）"""
+        rhs = FORMULA_BASES[self.formula_base]
+        self.freq_design = patsy.dmatrix(rhs, df, return_type='dataframe').design_info
+        design_cache = DesignMatrixCache(df, [rhs])
+        self.freq_models = {}
+        for key, (dep_var, _) in SCORE_TARGETS.items():
+            target = next(t for t in TARGETS if t['dep_var'] == dep_var)
+            formula = f"{dep_var} ~ {rhs}"
+            y, X = design_cache.dmatrices(formula)
+            settings = ESTIMATOR_SETTINGS[target['type']]
+            model_key = make_key(formula, target['type'], settings, X, y)
+            record = store.get(model_key)
+            if record is None:
+                print(f"Fitting {target['type'].upper()} for {target['name']} ({self.formula_base})...")
+                if target['type'] == "ols":
+                    model = sm.OLS(y, X).fit()
+                else:
+                    model = sm.Logit(y, X).fit(maxiter=settings["maxiter"], disp=0)
+                store.put_model(model_key, formula, target['type'], settings, model)
+                record = store.get(model_key)
+            if record["param_names"] != list(self.freq_design.column_names):
+                raise ValueError(f"Stored parameters of '{formula}' do not match the design columns.")
+
+            params = np.asarray(record["params"])
+            entry = {"type": target['type'], "params": params, "cov": np.asarray(record["cov_params"])}
+            if target['type'] == "ols":
+                # 誤差分散は最大対数尤度から戻す: llf = -n/2 (log(2π) + log(SSR/n) + 1)
+                nobs = record["nobs"]
+                ssr = nobs * np.exp(-2 * record["llf"] / nobs - np.log(2 * np.pi) - 1)
+                entry["df_resid"] = nobs - len(params)
+                entry["scale"] = ssr / entry["df_resid"]
+            self.freq_models[key] = entry
+
+    def _load_bayesian(self, df_std, store):
+        """3つのベイズモデルの事後サンプル（保存済みのトレースがなければサンプリングする）"""
+        self.bayes_design = patsy.dmatrix(BASE_FORMULA_RHS, df_std, return_type='dataframe').design_info
+        design_cache = DesignMatrixCache(df_std, [BASE_FORMULA_RHS])
+        self.bayes_models = {}
+        for key, (formula, model_name, family) in MODEL_SPECS.items():
+            trace, columns = run_bayesian_model(df_std, formula, model_name, family, design_cache=design_cache,
+                                                store=store, progressbar=False)
+            self.bayes_models[key] = (family, posterior_params(trace, list(columns), max_draws=self.n_draws))
+
+    def features(self, records):
+        """リクエストの映画に学習時と同じ変換を適用する"""
+        df = add_features(to_raw_records(records))
+        df = align_genre_columns(df, self.genre_columns)
+        for col, (mean, std) in self.scaling.items():
+            df[f'{col}_std'] = (df[col] - mean) / std
+        return df
+
+    def score(self, records):
+        """
+        映画のリスト（辞書）をまとめて予測する
+        OLS: 予測値と予測区間、ロジット: 確率と信頼区間（線形予測子のデルタ法）
+        ベイズ: 事後サンプルによる予測の平均と予測区間、確率の事後平均と信用区間
+        収益・ROI は対数から元の尺度 (expm1) に戻した値も返す
+        """
+        df = self.features(records)
+        out = pd.DataFrame(index=range(len(df)))
+        if "title" in df.columns:
+            out["title"] = df["title"].to_numpy()
+
+        # 頻度論のモデル（1回の行列積と二次形式）
+        X = design_matrix(self.freq_design, df)
+        for key, entry in self.freq_models.items():
+            name = SCORE_TARGETS[key][1]
+            eta = X @ entry["params"]
+            se = np.sqrt(np.einsum('ij,jk,ik->i', X, entry["cov"], X))
+            if entry["type"] == "ols":
+                half = stats.t.ppf((1 + self.interval_prob) / 2, entry["df_resid"]) * np.sqrt(se ** 2 + entry["scale"])
+                out[f"ols_{name}"], out[f"ols_{name}_low"], out[f"ols_{name}_high"] = eta, eta - half, eta + half
+            else:
+                half = stats.norm.ppf((1 + self.interval_prob) / 2) * se
+                out[f"ols_{name}"] = expit(eta)
+                out[f"ols_{name}_low"], out[f"ols_{name}_high"] = expit(eta - half), expit(eta + half)
+
+        # ベイズモデル（draws × 行 の行列積）
+        X = design_matrix(self.bayes_design, df)
+        with self.seed_lock:
+            rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
+        for key, (family, params) in self.bayes_models.items():
+            name = SCORE_TARGETS[key][1]
+            pred = predict_params(params, X, family, self.interval_prob, rng)
+            out[f"bayes_{name}"] = pred.iloc[:, 0].to_numpy()
+            out[f"bayes_{name}_low"] = pred.iloc[:, 1].to_numpy()
+            out[f"bayes_{name}_high"] = pred.iloc[:, 2].to_numpy()
+
+        for prefix in ("ols", "bayes"):
+            out[f"{prefix}_revenue"] = np.expm1(out[f"{prefix}_revenue_log"])
+            out[f"{prefix}_roi"] = np.expm1(out[f"{prefix}_roi_log"])
+        return out
+
+
+def make_handler(scorer):
+    """POST /score（JSON の映画のリスト）と GET /health を処理するハンドラ"""
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "formula_base": scorer.formula_base,
+                                 "models": list(SCORE_TARGETS), "load_time": scorer.load_time})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                records = payload["movies"] if isinstance(payload, dict) else payload
+                result = scorer.score(records)
+            except (ValueError, KeyError, TypeError, patsy.PatsyError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            self._send(200, {"predictions": result.to_dict(orient="records"),
+                             "elapsed_ms": (time.perf_counter() - start) * 1000})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(scorer, host="127.0.0.1", port=8000):
+    server = ThreadingHTTPServer((host, port), make_handler(scorer))
+    print(f"Serving predictions on http://{host}:{port}/score (GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def sample_requests(n_rows, input_file=INPUT_FILE, seed=0):
+    """
+    ベンチマーク用のリクエスト（学習データの映画を復元抽出する）
+    公開前の映画と同じく、ニュースは件数・ジャンルは名前のリスト・コレクションは True / False で渡す
+    """
+    raw = pd.read_csv(input_file).sample(n_rows, replace=True, random_state=seed)
+    return [{"title": row.title, "budget": row.budget, "actor_fame": row.actor_fame,
+             "political_news_count": count_news(row.news), "genres": extract_genre_names(row.genres),
+             "belongs_to_collection": bool(pd.notna(row.belongs_to_collection))}
+            for row in raw.itertuples()]
+
+
+def benchmark_latency(scorer, sizes=tuple(LATENCY_TARGETS), repeats=20, http=True, port=8765):
+    """
+    1リクエストあたりの行数ごとの応答時間 (p50 / p95) とスループット（行/秒）
+    http: True の場合はローカルの HTTP サーバー経由（JSON の変換を含む）でも測る
+    """
+    server = None
+    if http:
+        server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(scorer))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rows = []
+    try:
+        for n_rows in sizes:
+            records = sample_requests(n_rows, scorer.input_file)
+            body = json.dumps({"movies": records}).encode()
+            scorer.score(records)  # 初回の呼び出しを計測から除く
+            modes = [("in-process", lambda: scorer.score(records))]
+            if http:
+                def post():
+                    request = urllib.request.Request(f"http://127.0.0.1:{port}/score", data=body,
+                                                     headers={"Content-Type": "application/json"})
+                    with urllib.request.urlopen(request) as response:
+                        return response.read()
+                modes.append(("http", post))
+            n_repeats = repeats if n_rows < 1000 else max(3, repeats // 4)
+            for mode, call in modes:
+                times = []
+                for _ in range(n_repeats):
+                    start = time.perf_counter()
+                    call()
+                    times.append(time.perf_counter() - start)
+                p50, p95 = np.percentile(times, [50, 95])
+                target = LATENCY_TARGETS.get(n_rows)
+                rows.append({"rows": n_rows, "mode": mode, "p50_ms": p50 * 1000, "p95_ms": p95 * 1000,
+                             "rows_per_sec": n_rows / p50, "target_ms": None if target is None else target * 1000,
+                             "meets_target": None if target is None else bool(p95 <= target)})
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推定済みのモデルで新しい映画の収益・ROI を予測する")
+    parser.add_argument("--input", default=None,
+                        help="予測する映画の CSV（budget, actor_fame, news または political_news_count, genres, "
+                             "belongs_to_collection）")
+    parser.add_argument("--output", default=None,
+                        help="予測結果の CSV（省略時は表示のみ）")
+    parser.add_argument("--serve", action="store_true",
+                        help="HTTP サーバーとして起動する (POST /score)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="1行と10,000行のリクエストの応答時間・スループットを測る")
+    parser.add_argument("--formula-base", choices=list(FORMULA_BASES), default="Base",
+                        help="OLS / ロジットに使うモデルグリッドのフォーミュラ")
+    parser.add_argument("--draws", type=int, default=SERVICE_DRAWS,
+                        help="予測に使う事後サンプル数")
+    args = parser.parse_args()
+
+    scorer = MovieScorer(formula_base=args.formula_base, n_draws=args.draws)
+    if args.benchmark:
+        report = benchmark_latency(scorer)
+        print(report.round(2).to_string(index=False))
+    elif args.serve:
+        serve(scorer, host=args.host, port=args.port)
+    elif args.input is not None:
+        records = json.loads(pd.read_csv(args.input).to_json(orient="records"))
+        result = scorer.score(records)
+        if args.output:
+            result.to_csv(args.output, index=False)
+            print(f"Saved predictions to: {args.output}")
+        else:
+            print(result.round(4).to_string(index=False))
+    else:
+        parser.error("specify --input, --serve or --benchmark")
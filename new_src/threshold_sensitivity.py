@@ -0,0 +1,170 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import patsy
+import statsmodels.api as sm
+
+from fast_logit import fit_logit_batch
+
+
+def threshold_labels(values, quantiles):
+    """
+    値を一度だけソートして全分位点の閾値を求め、
+    閾値ごとの2値ラベル (n×Q) をまとめて作成する
+    (閾値は pandas の Series.quantile と同じ線形補間、欠損は閾値計算から除外)
+    """
+    values = np.asarray(values, dtype=float)
+    sorted_values = np.sort(values[~np.isnan(values)])
+    positions = np.asarray(quantiles, dtype=float) * (len(sorted_values) - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(sorted_values) - 1)
+    frac = positions - lower
+    thresholds = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * frac
+
+    labels = (values[:, None] > thresholds[None, :]).astype(np.int8)
+    return thresholds, labels
+
+
+def _fit_logit_path(X, labels, start_params=None):
+    """
+    隣り合う閾値の解を初期値にしながら（ウォームスタート）ロジットを順に推定する
+    """
+    results = []
+    params = start_params
+    for j in range(labels.shape[1]):
+        y = labels[:, j]
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                model = sm.Logit(y, X).fit(start_params=params, disp=0)
+            params = model.params
+            results.append({
+                "params": model.params,
+                "bse": model.bse,
+                "pvalues": model.pvalues,
+                "llf": model.llf,
+                "converged": model.mle_retvals["converged"],
+                "error": None,
+            })
+        except Exception as e:
+            # 完全分離などで推定できない閾値は欠損として記録し、初期値はリセットする
+            params = start_params
+            results.append({"error": str(e)})
+    return results
+
+
+def _fit_chunk(args):
+    X, labels, start_params = args
+    return _fit_logit_path(X, labels, start_params)
+
+
+def fit_threshold_grid(X, labels, n_jobs=1):
+    """
+    共通のデザイン行列 X に対して、閾値ごとのラベルのロジットを推定する
+    n_jobs > 1 の場合は閾値の並びを連続したブロックに分けて並列化する
+    (各ブロック内ではウォームスタートを使う)
+    """
+    X = np.asarray(X, dtype=float)
+    n_thresholds = labels.shape[1]
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, n_thresholds)
+
+    # 中央の閾値から解いた解を、各ブロックの初期値として共有する
+    middle = n_thresholds // 2
+    start_params = _fit_logit_path(X, labels[:, [middle]])[0].get("params")
+
+    if n_jobs == 1:
+        return _fit_logit_path(X, labels, start_params)
+
+    blocks = np.array_split(np.arange(n_thresholds), n_jobs)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        chunks = executor.map(_fit_chunk, [(X, labels[:, block], start_params) for block in blocks])
+        return [res for chunk in chunks for res in chunk]
+
+
+def _fit_batch_chunk(args):
+    X, labels = args
+    return fit_logit_batch(X, labels)
+
+
+def fit_threshold_grid_batch(X, labels, n_jobs=1):
+    """
+    全閾値のラベルを一つのバッチとして IRLS でまとめて推定する
+    n_jobs > 1 の場合は閾値の列を連続したブロックに分け、ブロックごとに別プロセスで一括推定する
+    fit_threshold_grid と同じ形式のリストを返す（収束しなかった閾値は error に理由を入れる）
+    """
+    X = np.asarray(X, dtype=float)
+    n_thresholds = labels.shape[1]
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, n_thresholds)
+
+    if n_jobs == 1:
+        fits = [fit_logit_batch(X, labels)]
+    else:
+        blocks = np.array_split(np.arange(n_thresholds), n_jobs)
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            fits = list(executor.map(_fit_batch_chunk, [(X, labels[:, block]) for block in blocks]))
+
+    results = []
+    for fit in fits:
+        for k in range(len(fit["converged"])):
+            if not fit["converged"].iloc[k]:
+                results.append({"error": f"IRLS did not converge in {fit['n_iter'].iloc[k]} iterations "
+                                         "(possible perfect separation)"})
+                continue
+            results.append({
+                "params": fit["params"].iloc[:, k].to_numpy(),
+                "bse": fit["bse"].iloc[:, k].to_numpy(),
+                "pvalues": fit["pvalues"].iloc[:, k].to_numpy(),
+                "llf": fit["llf"].iloc[k],
+                "converged": True,
+                "error": None,
+            })
+    return results
+
+
+def run_threshold_sensitivity(df, formula_template, target_term, quantiles, value_col='roi', n_jobs=1, method='batch'):
+    """
+    閾値を変動させたロジスティック回帰の感度分析を実行する
+    入力の df は変更しない。結果は閾値ごとの係数・信頼区間・P値のデータフレーム
+    method: 'batch' (全閾値を一括IRLS) / 'newton' (statsmodels をウォームスタートで逐次実行)
+    n_jobs: 並列に使うプロセス数（どちらの method でも閾値の列をブロックに分けて並列化する）
+    """
+    rhs = formula_template.split('~')[1]
+    X = patsy.dmatrix(rhs, df, return_type='dataframe')
+    column_names = list(X.columns)
+    term_idx = column_names.index(target_term)
+
+    # 閾値は全行の値から計算し、ラベルはデザイン行列の行に合わせる
+    thresholds, labels = threshold_labels(df[value_col].to_numpy(), quantiles)
+    labels = labels[df.index.get_indexer(X.index)]
+
+    if method == 'batch':
+        fits = fit_threshold_grid_batch(X.to_numpy(), labels, n_jobs=n_jobs)
+    else:
+        fits = fit_threshold_grid(X.to_numpy(), labels, n_jobs=n_jobs)
+
+    results = []
+    for q, threshold_val, fit in zip(quantiles, thresholds, fits):
+        if fit.get("error") is not None:
+            print(f"Quantile {q:.2f}: Error - {fit['error']}")
+            continue
+        coef = fit["params"][term_idx]
+        se = fit["bse"][term_idx]
+        results.append({
+            'quantile': q,
+            'threshold': threshold_val,
+            'coef': coef,
+            'se': se,
+            'ci_lower': coef - 1.96 * se,
+            'ci_upper': coef + 1.96 * se,
+            'p_value': fit["pvalues"][term_idx],
+            'converged': fit["converged"],
+        })
+
+    return pd.DataFrame(results)
@@ -0,0 +1,137 @@
+import os
+import shutil
+
+import arviz as az
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from result_store import RESULT_DIR
+
+# トレースの保存先
+TRACE_DIR = os.path.join(RESULT_DIR, "traces")
+
+# 保存形式と拡張子
+TRACE_FORMATS = {"netcdf": ".nc", "zarr": ".zarr"}
+
+# 1チャンクあたりの draw 数（部分的に読み込むときの単位）
+TRACE_CHUNK_DRAWS = 1000
+
+# 圧縮レベル (zlib / zstd)
+COMPRESSION_LEVEL = 5
+
+
+def _prepare(trace, float32=False, drop_constant_data=True):
+    """
+    保存するグループを選び、必要なら浮動小数点の draws を float32 にする
+    constant_data（デザイン行列）は保存キーのデータハッシュで特定できるので、既定では保存しない
+    """
+    groups = {}
+    for group in trace.groups():
+        if drop_constant_data and group == "constant_data":
+            continue
+        ds = trace[group]
+        if float32 and group in ("posterior", "sample_stats", "posterior_predictive", "log_likelihood"):
+            ds = ds.map(lambda v: v.astype(np.float32) if v.dtype == np.float64 else v, keep_attrs=True)
+        groups[group] = ds
+    return groups
+
+
+def _chunks(var):
+    """(chain, draw, ...) の変数はチェーンごと・TRACE_CHUNK_DRAWS 個の draw ごとに分ける"""
+    return tuple(1 if dim == "chain" else min(size, TRACE_CHUNK_DRAWS) if dim == "draw" else size
+                 for dim, size in var.sizes.items())
+
+
+def save_trace(trace, key, fmt="netcdf", float32=False, drop_constant_data=True, directory=TRACE_DIR):
+    """
+    トレースを圧縮・チャンク分割して保存し、パスを返す
+    fmt: 'netcdf' (h5netcdf + zlib) / 'zarr' (ディレクトリ、zarr の既定の圧縮)
+    float32: True の場合は draws を float32 で保存する（サイズが約半分、精度は要約・プロットには十分）
+    """
+    if fmt not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format: {fmt}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}{TRACE_FORMATS[fmt]}")
+    groups = _prepare(trace, float32=float32, drop_constant_data=drop_constant_data)
+
+    # 同じキーを別の形式で保存し直した場合は、古い形式のファイルを残さない
+    for other in TRACE_FORMATS.values():
+        other_path = os.path.join(directory, f"{key}{other}")
+        if other_path != path and os.path.isdir(other_path):
+            shutil.rmtree(other_path)
+        elif other_path != path and os.path.exists(other_path):
+            os.remove(other_path)
+
+    if fmt == "netcdf":
+        mode = "w"
+        for group, ds in groups.items():
+            encoding = {}
+            for name, var in ds.data_vars.items():
+                if var.dtype.kind in "fiub" and var.ndim > 0:
+                    encoding[name] = {"zlib": True, "complevel": COMPRESSION_LEVEL, "shuffle": True,
+                                      "chunksizes": _chunks(var)}
+            ds.to_netcdf(path, mode=mode, group=group, engine="h5netcdf", encoding=encoding)
+            mode = "a"
+    else:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        tree = xr.DataTree.from_dict({f"/{group}": ds for group, ds in groups.items()})
+        encoding = {f"/{group}": {name: {"chunks": _chunks(var)} for name, var in ds.data_vars.items()
+                                  if var.ndim > 0}
+                    for group, ds in groups.items()}
+        tree.to_zarr(path, mode="w", encoding=encoding)
+    return path
+
+
+def load_trace(path):
+    """
+    保存済みのトレースを読み込む
+    値は参照されるまでディスクから読まない（要約やプロットで使う変数だけが読み込まれる）
+    """
+    if path.endswith(TRACE_FORMATS["zarr"]):
+        return az.InferenceData.from_datatree(xr.open_datatree(path, engine="zarr", chunks=None))
+    return az.from_netcdf(path)
+
+
+def path_size(path):
+    """ファイルまたはディレクトリ (zarr) のディスク上のサイズ（バイト）"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def trace_nbytes(trace):
+    """メモリ上に展開した場合のサイズ（バイト）"""
+    return sum(trace[group].nbytes for group in trace.groups())
+
+
+def storage_report(store):
+    """
+    保存庫に記録されたトレースごとのディスク上のサイズ・展開後のサイズ・圧縮率
+    store: FitResultStore
+    """
+    rows = store.conn.execute(
+        "SELECT key, formula, estimator, artifact_path, created_at FROM fit_results "
+        "WHERE artifact_path IS NOT NULL").fetchall()
+    records = []
+    for key, formula, estimator, path, created_at in rows:
+        if not os.path.exists(path):
+            continue
+        disk = path_size(path)
+        memory = trace_nbytes(load_trace(path))
+        records.append({
+            "key": key[:12],
+            "estimator": estimator,
+            "response": formula.split("~")[0].strip(),
+            "format": "zarr" if path.endswith(TRACE_FORMATS["zarr"]) else "netcdf",
+            "disk_kb": disk / 1024,
+            "memory_kb": memory / 1024,
+            "ratio": memory / disk if disk else np.nan,
+            "created_at": pd.to_datetime(created_at, unit="s"),
+        })
+    report = pd.DataFrame(records)
+    if len(report):
+        report = report.sort_values("created_at", ignore_index=True)
+    return report
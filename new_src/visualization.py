@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import japanize_matplotlib
 import pandas as pd
 import numpy as np
-import statsmodels.formula.api as smf
+from threshold_sensitivity import run_threshold_sensitivity
 
 # 保存先フォルダの設定
 IMAGE_DIR = "new_image"
@@ -26,8 +26,12 @@ def save_regression_summary(model, filename):
     回帰分析の結果(summary)を画像として保存する
     """
     # モデルの結果をテキストとして取得
-    summary_text = model.summary().as_text()
-    
+    save_summary_text(model.summary().as_text(), filename)
+
+def save_summary_text(summary_text, filename):
+    """
+    要約テキストを画像として保存する（保存済みの推定結果から再描画する場合にも使う）
+    """
     # 描画エリアを作成 (文字数に合わせてサイズを調整すると良いですが、ここでは大きめに確保)
     fig, ax = plt.subplots(figsize=(12, 8))
     
@@ -157,70 +161,43 @@ def plot_additional_exploratory_analysis(df):
 
     
 
-def analyze_threshold_sensitivity(df, formula_template, target_term, quantiles=None):
+def analyze_threshold_sensitivity(df, formula_template, target_term, quantiles=None, n_jobs=1, method='batch'):
     """
     閾値を変動させてロジスティック回帰を行い、係数の安定性をプロットする
+    quantiles には100点以上の細かいグリッドも指定できる（入力の df は変更しない）
+    n_jobs: 並列に使うプロセス数 (None で全コア)
+    method: 'batch' で全閾値を一括IRLS、'newton' で statsmodels を逐次実行
     """
     if quantiles is None:
         quantiles = [0.35, 0.40, 0.45, 0.50, 0.55, 0.60, 0.65]
     
-    results = []
-    
-    # ベースの数式の右辺だけ取り出す
-    rhs = formula_template.split('~')[1]
-    
     print(f"--- Sensitivity Analysis for {target_term} ---")
     
-    for q in quantiles:
-        # 閾値を計算
-        threshold_val = df['roi'].quantile(q)
-        
-        # 一時的な目的変数を作成 (閾値を超えたら1)
-        temp_col_name = f'is_high_roi_q{int(q*100)}'
-        df[temp_col_name] = (df['roi'] > threshold_val).astype(int)
-        
-        # モデル構築
-        current_formula = f"{temp_col_name} ~ {rhs}"
-        try:
-            model = smf.logit(current_formula, data=df).fit(disp=0) # disp=0でログ抑制
-            
-            # 係数と標準誤差、P値を取得
-            coef = model.params[target_term]
-            se = model.bse[target_term]
-            p_val = model.pvalues[target_term]
-            
-            # 95%信頼区間 (近似的に 1.96 * SE)
-            ci_lower = coef - 1.96 * se
-            ci_upper = coef + 1.96 * se
-            
-            results.append({
-                'quantile': q,
-                'coef': coef,
-                'ci_lower': ci_lower,
-                'ci_upper': ci_upper,
-                'p_value': p_val
-            })
-            print(f"Quantile {q:.2f}: Coef={coef:.4f}, P-val={p_val:.4f}")
-            
-        except Exception as e:
-            print(f"Quantile {q:.2f}: Error - {e}")
-
-    # 結果をDataFrame化
-    res_df = pd.DataFrame(results)
+    # 全閾値のラベルを一括作成してまとめて推定する
+    res_df = run_threshold_sensitivity(df, formula_template, target_term, quantiles,
+                                       n_jobs=n_jobs, method=method)
+    if len(quantiles) <= 20:
+        for _, row in res_df.iterrows():
+            print(f"Quantile {row['quantile']:.2f}: Coef={row['coef']:.4f}, P-val={row['p_value']:.4f}")
     
     # --- 可視化 ---
     fig, ax1 = plt.subplots(figsize=(10, 6))
     
     # 係数のプロット（信頼区間付き）
-    ax1.errorbar(
-        res_df['quantile'], 
-        res_df['coef'], 
-        yerr=[res_df['coef'] - res_df['ci_lower'], res_df['ci_upper'] - res_df['coef']], 
-        fmt='-o', 
-        capsize=5, 
-        color='blue',
-        label='Coefficient (Effect Size)'
-    )
+    if len(res_df) <= 20:
+        ax1.errorbar(
+            res_df['quantile'], 
+            res_df['coef'], 
+            yerr=[res_df['coef'] - res_df['ci_lower'], res_df['ci_upper'] - res_df['coef']], 
+            fmt='-o', 
+            capsize=5, 
+            color='blue',
+            label='Coefficient (Effect Size)'
+        )
+    else:
+        # 細かいグリッドでは信頼区間を帯で表示
+        ax1.plot(res_df['quantile'], res_df['coef'], color='blue', label='Coefficient (Effect Size)')
+        ax1.fill_between(res_df['quantile'], res_df['ci_lower'], res_df['ci_upper'], color='blue', alpha=0.2)
     
     # ゼロライン（ここを跨ぐと有意ではない）
     ax1.axhline(y=0, color='gray', linestyle='--', linewidth=1)
@@ -232,7 +209,8 @@ def analyze_threshold_sensitivity(df, formula_template, target_term, quantiles=N
     
     # P値を右軸に表示（オプション）
     ax2 = ax1.twinx()
-    ax2.plot(res_df['quantile'], res_df['p_value'], color='red', linestyle=':', marker='x', label='P-value')
+    ax2.plot(res_df['quantile'], res_df['p_value'], color='red', linestyle=':',
+             marker='x' if len(res_df) <= 20 else None, label='P-value')
     ax2.set_ylabel('P-value')
     ax2.axhline(y=0.05, color='red', linestyle='--', alpha=0.5, linewidth=1) # 有意水準5%線
     
@@ -248,6 +226,8 @@ def analyze_threshold_sensitivity(df, formula_template, target_term, quantiles=N
     print(f"Saved sensitivity plot to: {save_path}")
     plt.show()
 
+    return res_df
+
 def save_arviz_plot(plot_func, trace, filename, **kwargs):
     """
     ArviZのプロット関数を実行して保存するラッパー関数
@@ -4,6 +4,7 @@ from statsmodels.formula.api import ols, logit
 from data_processing import load_and_preprocess_data
 from visualization import plot_distributions, plot_financials, plot_qq_and_reg, plot_heatmap, save_regression_summary
 from visualization import analyze_threshold_sensitivity
+from permutation_test import run_permutation_test
 
 # --- 設定 ---
 INPUT_FILE = "data/movies_analyzed_3m.csv"
@@ -58,10 +59,15 @@ def main():
     # 画像保存
     save_regression_summary(model_logit, "summary_model3_logit.png")
 
-    print('\n========== Sensitivity Analysis ==========')
-    
     # 注目する変数（交互作用項）を指定
     target_variable = 'political_ratio:over_100news' 
+
+    # --- 置換検定 (Freedman–Lane) ---
+    print('\n========== Permutation Test ==========')
+    run_permutation_test(df, formula_rev, target_variable)
+    run_permutation_test(df, formula_roi, target_variable)
+
+    print('\n========== Sensitivity Analysis ==========')
     
     # 数式テンプレート (目的変数は関数内で書き換えるので dummy でOK)
     formula_template = f"dummy ~ {base_formula}"
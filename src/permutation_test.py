@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import patsy
+
+
+def _permutation_chunk(args):
+    """
+    置換した残差に対する統計量をまとめて計算する
+    残差行列 (chunk×n) と [Q_X, Q_Z, c] の1回の行列積で全置換分が求まる
+    """
+    resid_reduced, basis, n_full, n_reduced, seed_seq, n_perm = args
+    rng = np.random.default_rng(seed_seq)
+    n = len(resid_reduced)
+
+    perm_idx = rng.permuted(np.tile(np.arange(n), (n_perm, 1)), axis=1)
+    E = resid_reduced[perm_idx]
+    proj = E @ basis
+
+    # ||M_X e*||^2 と ||M_Z e*||^2
+    ee = np.einsum('ij,ij->i', E, E)
+    rss_full = ee - np.einsum('ij,ij->i', proj[:, :n_full], proj[:, :n_full])
+    rss_reduced = ee - np.einsum('ij,ij->i', proj[:, n_full:n_full + n_reduced], proj[:, n_full:n_full + n_reduced])
+    coef = proj[:, n_full + n_reduced:]
+    return rss_full, rss_reduced, coef
+
+
+def freedman_lane_test(X, y, test_columns, n_perm=10000, chunk_size=1000, n_jobs=1, seed=0):
+    """
+    Freedman–Lane 法による置換検定
+
+    検定する列 (test_columns) を除いた縮小モデルで統制変数を一度だけ回帰し、
+    その残差を置換して y* = 縮小モデルの予測値 + 置換残差 を作る。
+    各置換の F 統計量（1列の場合は t 統計量も）を行列積でまとめて計算する。
+    """
+    names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).ravel()
+    n, p = X.shape
+    test_idx = [names.index(c) if isinstance(c, str) else c for c in test_columns]
+    control_idx = [j for j in range(p) if j not in test_idx]
+    q = len(test_idx)
+    df_resid = n - p
+
+    # 縮小モデル（統制変数のみ）の残差
+    Z = X[:, control_idx]
+    Q_Z, _ = np.linalg.qr(Z)
+    resid_reduced = y - Q_Z @ (Q_Z.T @ y)
+
+    # 完全モデルの直交基底と、検定する係数を取り出す行ベクトル c ((X'X)^-1 X' の該当行)
+    Q_X, R_X = np.linalg.qr(X)
+    R_inv = np.linalg.solve(R_X, np.eye(p))
+    C = (Q_X @ R_inv.T)[:, test_idx]
+    xtx_inv_diag = np.einsum('ij,ij->i', R_inv, R_inv)[test_idx]
+    basis = np.hstack([Q_X, Q_Z, C])
+
+    # 観測データでの統計量
+    def statistics(rss_full, rss_reduced, coef):
+        f_stat = ((rss_reduced - rss_full) / q) / (rss_full / df_resid)
+        t_stat = coef / np.sqrt(np.outer(rss_full / df_resid, xtx_inv_diag))
+        return f_stat, t_stat
+
+    obs_proj = y @ basis
+    yy = y @ y
+    f_obs, t_obs = statistics(
+        np.atleast_1d(yy - obs_proj[:p] @ obs_proj[:p]),
+        np.atleast_1d(yy - obs_proj[p:p + Z.shape[1]] @ obs_proj[p:p + Z.shape[1]]),
+        obs_proj[None, p + Z.shape[1]:]
+    )
+    f_obs, t_obs = f_obs[0], t_obs[0]
+
+    # 置換をチャンクに分けて（必要なら並列に）評価する
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    sizes = [min(chunk_size, n_perm - start) for start in range(0, n_perm, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(resid_reduced, basis, p, Z.shape[1], s, size) for s, size in zip(seeds, sizes)]
+
+    f_exceed = 0
+    t_greater = np.zeros(q)
+    t_less = np.zeros(q)
+    t_abs = np.zeros(q)
+
+    def accumulate(result):
+        nonlocal f_exceed, t_greater, t_less, t_abs
+        f_perm, t_perm = statistics(*result)
+        f_exceed += np.sum(f_perm >= f_obs)
+        t_greater += np.sum(t_perm >= t_obs, axis=0)
+        t_less += np.sum(t_perm <= t_obs, axis=0)
+        t_abs += np.sum(np.abs(t_perm) >= np.abs(t_obs), axis=0)
+
+    if n_jobs == 1 or len(tasks) == 1:
+        for task in tasks:
+            accumulate(_permutation_chunk(task))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            for result in executor.map(_permutation_chunk, tasks):
+                accumulate(result)
+
+    coef_obs = (C.T @ y)
+    return {
+        "terms": [names[j] for j in test_idx],
+        "coef": pd.Series(coef_obs, index=[names[j] for j in test_idx]),
+        "t_stat": pd.Series(t_obs, index=[names[j] for j in test_idx]),
+        "p_value": pd.Series((1 + t_abs) / (n_perm + 1), index=[names[j] for j in test_idx]),
+        "p_value_greater": pd.Series((1 + t_greater) / (n_perm + 1), index=[names[j] for j in test_idx]),
+        "p_value_less": pd.Series((1 + t_less) / (n_perm + 1), index=[names[j] for j in test_idx]),
+        "f_stat": f_obs,
+        "f_p_value": (1 + f_exceed) / (n_perm + 1),
+        "n_perm": n_perm,
+    }
+
+
+def run_permutation_test(df, formula, test_terms, n_perm=10000, chunk_size=1000, n_jobs=1, seed=0):
+    """
+    フォーミュラで指定したOLSモデルについて、test_terms の置換検定を行い結果を表示する
+    test_terms: 検定する列名（例: 'political_news_count'）またはそのリスト
+    """
+    if isinstance(test_terms, str):
+        test_terms = [test_terms]
+    y, X = patsy.dmatrices(formula, data=df, return_type='dataframe')
+
+    result = freedman_lane_test(X, y, test_terms, n_perm=n_perm, chunk_size=chunk_size,
+                                n_jobs=n_jobs, seed=seed)
+
+    print(f"--- Permutation Test (Freedman-Lane, {n_perm} permutations) ---")
+    for term in result["terms"]:
+        print(f"{term}: Coef={result['coef'][term]:.4f}, t={result['t_stat'][term]:.3f}, "
+              f"P-val={result['p_value'][term]:.4f}")
+    if len(result["terms"]) > 1:
+        print(f"Joint F={result['f_stat']:.3f}, P-val={result['f_p_value']:.4f}")
+    return result
+
+
+def permutation_test_grid(df, formula_bases, dep_vars, term_filter='political_news_count',
+                          n_perm=10000, chunk_size=1000, n_jobs=1, seed=0):
+    """
+    モデルグリッド全体について、term_filter を含む各項を1つずつ置換検定する
+    formula_bases: {モデル名: 右辺}、dep_vars: {目的変数名: 列名} (OLSの目的変数のみ)
+    """
+    rows = []
+    for base_name, base_formula in formula_bases.items():
+        for target_name, dep_var in dep_vars.items():
+            y, X = patsy.dmatrices(f"{dep_var} ~ {base_formula}", data=df, return_type='dataframe')
+            for term in [c for c in X.columns if term_filter in c]:
+                result = freedman_lane_test(X, y, [term], n_perm=n_perm, chunk_size=chunk_size,
+                                            n_jobs=n_jobs, seed=seed)
+                rows.append({
+                    "Base": base_name,
+                    "Target": target_name,
+                    "term": term,
+                    "coef": result["coef"][term],
+                    "t_stat": result["t_stat"][term],
+                    "p_value": result["p_value"][term],
+                    "p_value_greater": result["p_value_greater"][term],
+                    "p_value_less": result["p_value_less"][term],
+                })
+    return pd.DataFrame(rows)